@@ -1,65 +1,88 @@
-from flask import Flask, render_template, redirect, flash, request
-from flask_login import LoginManager, login_required, logout_user, login_user
+from flask import Flask, render_template, redirect, flash, request, current_app, jsonify, abort, send_file
+from flask_login import LoginManager, login_required, logout_user, login_user, current_user
 from config import Config
-from models import db, User
-from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import event
+from models import db, User, Pekerjaan
+from services.migrations import upgrade_schema
+from services.autosave import autosave_buffer
+from services.antrian_submit import antrian_submit
+from services.verifikasi_password import verifikasi_password, AntrianPenuh
+from services.sesi_user import user_cache
+from services.ujian_kelas import dashboard_cache
+from services.exam_cache import exam_cache
+from services.sqlite_tuning import pasang_pragma, checkpoint_wal
+from services.koneksi_baca import siapkan_bind_baca, BIND_BACA
+from services.versi_cache import sinkron_cache
+from services.metrik import metrik
+from services.profil_request import profil_request
+from services.impor_pdf import impor_pdf
+from services.export_pdf import export_pdf
+from services.antrian_pekerjaan import antrian_pekerjaan
+from sqlalchemy import text
+from werkzeug.security import generate_password_hash
+from importlib import import_module
 from waitress import serve
 import logging
-
-app = Flask(__name__)
-app.config.from_object(Config)
-db.init_app(app)
+import os
+import time
 
 # ==========================================
-# OPTIMASI DATABASE (SQLITE PRAGMA)
+# PROFIL DEPLOYMENT (APP FACTORY)
 # ==========================================
-with app.app_context():
-    @event.listens_for(db.engine, "connect")
-    def set_sqlite_pragma(dbapi_connection, connection_record):
-        cursor = dbapi_connection.cursor()
-        # Aktifkan Foreign Keys
-        cursor.execute("PRAGMA foreign_keys = ON")
-        # Aktifkan Write-Ahead Logging (WAL) untuk performa tinggi saat banyak akses
-        cursor.execute("PRAGMA journal_mode = WAL")
-        # Sinkronisasi normal agar lebih cepat (sedikit risiko jika mati lampu, tapi performa naik drastis)
-        cursor.execute("PRAGMA synchronous = NORMAL")
-        cursor.close()
+# full    : semua blueprint dalam satu proses (perilaku lama)
+# student : login + siswa saja -> server ujian
+# staff   : login + admin + guru -> export PDF/Excel berat berjalan di proses
+#           terpisah dengan jumlah thread sendiri, tidak mengganggu siswa
+# Semua profil memakai database yang sama. Role yang boleh login = blueprint
+# yang terdaftar di profil tersebut.
+PROFIL = {
+    'full': ('admin', 'guru', 'siswa'),
+    'student': ('siswa',),
+    'staff': ('admin', 'guru'),
+}
 
-login_manager = LoginManager(app)
+login_manager = LoginManager()
 login_manager.login_view = 'index'
 login_manager.login_message = 'Silakan login terlebih dahulu.'
 login_manager.login_message_category = 'info'
 
 @login_manager.user_loader
 def load_user(id):
-    return db.session.get(User, int(id))
-
-# Import blueprint
-from routes.admin_routes import bp as admin_bp
-from routes.guru_routes import bp as guru_bp
-from routes.siswa_routes import bp as siswa_bp
-
-app.register_blueprint(admin_bp, url_prefix='/admin')
-app.register_blueprint(guru_bp, url_prefix='/guru')
-app.register_blueprint(siswa_bp, url_prefix='/siswa')
+    # Dari cache TTL (tanpa SELECT per request), lihat services/sesi_user.py
+    return user_cache.get(int(id))
 
 # ==========================================
 # HALAMAN UTAMA + LOGIN SATU PINTU
 # ==========================================
-@app.route('/')
 def index():
     return render_template('login.html')
 
-@app.route('/login-unified', methods=['POST'])
 def login_unified():
     username = request.form['username'].strip()
     password = request.form['password']
     role = request.form['role']
 
+    # Server ujian tidak melayani login guru/admin (dan sebaliknya)
+    if role not in current_app.config['CBT_BLUEPRINT']:
+        flash(f'Login {role} tidak dilayani di server ini. Gunakan alamat server yang sesuai.', 'warning')
+        return redirect('/')
+
+    mulai = time.perf_counter()
     user = User.query.filter_by(username=username, role=role).first()
+    verifikasi_password.catat('query_user', time.perf_counter() - mulai)
+    # Kembalikan koneksi DB ke pool selama menunggu hashing (objek user tetap bisa dibaca)
+    db.session.close()
+
+    try:
+        cocok = user is not None and verifikasi_password.cek(user.password, password)
+    except AntrianPenuh:
+        # Pool hashing penuh -> tolak cepat, jangan menahan thread waitress
+        detik = verifikasi_password.retry_after
+        flash(f'Server sedang melayani banyak login. Silakan coba lagi dalam {detik} detik.', 'warning')
+        return render_template('login.html'), 503, {'Retry-After': str(detik)}
+    finally:
+        verifikasi_password.catat('total', time.perf_counter() - mulai)
 
-    if user and check_password_hash(user.password, password):
+    if cocok:
         login_user(user)
         # flash(f'Selamat datang, {user.nama or user.username}!', 'success') # Opsional: Matikan flash login agar lebih ringan
 
@@ -76,18 +99,52 @@ def login_unified():
 # ==========================================
 # LOGOUT GLOBAL
 # ==========================================
-@app.route('/logout')
 @login_required
 def logout():
     logout_user()
     flash('Anda berhasil logout!', 'success')
     return redirect('/')
 
+# ==========================================
+# HEALTH CHECK (DIPAKAI jalankan_multi.py / LOAD BALANCER)
+# ==========================================
+def sehat():
+    db.session.execute(text('SELECT 1'))
+    return jsonify(status='ok', pid=os.getpid(), profil=current_app.config['CBT_PROFILE'])
+
+# ==========================================
+# PROGRES PEKERJAAN LATAR (IMPOR, EXPORT, HITUNG ULANG)
+# ==========================================
+# Dipakai semua role staf; hanya pemilik job (atau admin) yang boleh melihat
+def ambil_pekerjaan(job_id):
+    job = db.session.get(Pekerjaan, job_id)
+    if job is None or (current_user.role != 'admin' and job.pemilik_id != current_user.id):
+        abort(404)
+    return job
+
+@login_required
+def halaman_pekerjaan(job_id):
+    job = ambil_pekerjaan(job_id)
+    kembali = job.tautan or f'/{current_user.role}/dashboard'
+    return render_template('pekerjaan.html', job=antrian_pekerjaan.status(job), kembali=kembali)
+
+@login_required
+def status_pekerjaan(job_id):
+    return jsonify(antrian_pekerjaan.status(ambil_pekerjaan(job_id)))
+
+@login_required
+def unduh_pekerjaan(job_id):
+    job = ambil_pekerjaan(job_id)
+    if not job.file_hasil or not os.path.exists(job.file_hasil):
+        abort(404)
+    return send_file(job.file_hasil, as_attachment=True, download_name=job.nama_file)
+
 # ==========================================
 # BUAT DATABASE + ADMIN DEFAULT
 # ==========================================
-with app.app_context():
+def siapkan_database():
     db.create_all()
+    upgrade_schema()
     if not User.query.filter_by(username='admin', role='admin').first():
         admin = User(
             username='admin',
@@ -99,20 +156,129 @@ with app.app_context():
         db.session.commit()
         print("Admin default dibuat → username: admin | password: admin123")
 
+# ==========================================
+# APP FACTORY
+# ==========================================
+def create_app(profile=None):
+    profile = profile or Config.CBT_PROFILE
+    if profile not in PROFIL:
+        raise ValueError(f"Profil tidak dikenal: {profile} (pilihan: {', '.join(PROFIL)})")
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config['CBT_PROFILE'] = profile
+    app.config['CBT_BLUEPRINT'] = PROFIL[profile]
+    # Engine kedua (mode=ro, pool sendiri) untuk route baca-saja, lihat Config.SQLITE_READ_POOL
+    siapkan_bind_baca(app)
+    db.init_app(app)
+
+    # ==========================================
+    # OPTIMASI DATABASE (SQLITE PRAGMA + CHECKPOINT WAL)
+    # ==========================================
+    # Nilai PRAGMA diatur lewat Config.SQLITE_*, lihat services/sqlite_tuning.py
+    with app.app_context():
+        pasang_pragma(db.engine, app.config)
+        if BIND_BACA in db.engines:
+            pasang_pragma(db.engines[BIND_BACA], app.config, query_only=True)
+        checkpoint_wal.init_app(app, db.engine)
+
+    login_manager.init_app(app)
+
+    app.add_url_rule('/', 'index', index)
+    app.add_url_rule('/login-unified', 'login_unified', login_unified, methods=['POST'])
+    app.add_url_rule('/logout', 'logout', logout)
+    app.add_url_rule('/sehat', 'sehat', sehat)
+    app.add_url_rule('/pekerjaan/<job_id>', 'halaman_pekerjaan', halaman_pekerjaan)
+    app.add_url_rule('/pekerjaan/<job_id>/status', 'status_pekerjaan', status_pekerjaan)
+    app.add_url_rule('/pekerjaan/<job_id>/unduh', 'unduh_pekerjaan', unduh_pekerjaan)
+
+    # Blueprint di luar profil tidak di-import sama sekali
+    for nama in PROFIL[profile]:
+        app.register_blueprint(import_module(f'routes.{nama}_routes').bp, url_prefix=f'/{nama}')
+
+    # Buffer autosave jawaban (flush berkala ke tabel DraftJawaban)
+    autosave_buffer.init_app(app)
+
+    # Antrian submit single-writer (opsional, lihat Config.SUBMIT_QUEUE)
+    antrian_submit.init_app(app)
+
+    # Verifikasi password login di process pool (lihat Config.LOGIN_POOL)
+    verifikasi_password.init_app(app)
+
+    # Cache user untuk user_loader Flask-Login (lihat Config.USER_CACHE_TTL)
+    user_cache.init_app(app)
+
+    # Cache daftar ujian aktif per kelas (lihat Config.DASHBOARD_CACHE_TTL)
+    dashboard_cache.init_app(app)
+
+    # Cache soal ujian: hapus ujian di proses lain ikut mengosongkan cache ini
+    exam_cache.init_app(app)
+
+    # Process pool pembaca PDF untuk job impor soal (lihat Config.PDF_POOL_WORKERS)
+    impor_pdf.init_app(app)
+
+    # Process pool xhtml2pdf untuk job ZIP PDF hasil siswa (lihat Config.PDF_EXPORT_WORKERS)
+    export_pdf.init_app(app)
+
+    # Metrik Prometheus di /metrics (opsional, lihat Config.METRICS)
+    metrik.init_app(app, db)
+
+    # Profiler SQL/cProfile per request untuk admin (lihat Config.PROFILER)
+    profil_request.init_app(app, db)
+
+    with app.app_context():
+        siapkan_database()
+
+    # Invalidasi cache antar proses (tabel versi_cache harus sudah ada)
+    sinkron_cache.init_app(app)
+
+    # Worker antrian pekerjaan latar (tabel pekerjaan harus sudah ada). Hanya jenis
+    # job dari blueprint profil ini yang dikerjakan, lihat Config.JOB_WORKERS
+    antrian_pekerjaan.init_app(app)
+
+    return app
+
+# ==========================================
+# APP GLOBAL (KOMPATIBEL: from app import app)
+# ==========================================
+def __getattr__(nama):
+    # `app` baru dibuat saat pertama kali diminta (profil dari CBT_PROFILE),
+    # sehingga `from app import create_app` tidak ikut membuat tabel/admin
+    if nama == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {nama!r}")
+
 # ==========================================
 # KONFIGURASI SERVER PRODUCTION (WAITRESS)
 # ==========================================
+# Contoh dua proses, satu database:
+#   CBT_PROFILE=student PORT=5000 SERVER_THREADS=75 python app.py
+#   CBT_PROFILE=staff   PORT=5001 SERVER_THREADS=8 SERVER_NICE=10 python app.py
+# Beberapa proses worker di satu port (memakai semua core): python jalankan_multi.py
 if __name__ == '__main__':
+    app = create_app()
+    profil = app.config['CBT_PROFILE']
+    port = app.config['SERVER_PORT']
+    threads = app.config['SERVER_THREADS']
+
     print("="*50)
-    print(" SERVER CBT SIAP (MODE PRODUCTION)")
-    print(" Kapasitas: 75 Concurrent Users")
+    print(f" SERVER CBT SIAP (MODE PRODUCTION) - profil: {profil}")
+    print(f" Melayani: {', '.join(app.config['CBT_BLUEPRINT'])}")
+    print(f" Kapasitas: {threads} thread")
     print(" Database: SQLite (WAL Mode)")
-    print(" Akses Lokal: http://localhost:5000")
+    print(f" Akses Lokal: http://localhost:{port}")
     print("="*50)
-    
+
     # Logger agar error terlihat di terminal
     logger = logging.getLogger('waitress')
     logger.setLevel(logging.INFO)
-    
-    # threads=75: Agar 73 siswa bisa request bersamaan tanpa antri lama
-    serve(app, host='0.0.0.0', port=5000, threads=75)
\ No newline at end of file
+
+    # Proses staf (export berat) bisa diturunkan prioritas CPU-nya agar siswa tetap diutamakan
+    if app.config['SERVER_NICE'] and hasattr(os, 'nice'):
+        os.nice(app.config['SERVER_NICE'])
+
+    # Siapkan proses worker hashing password sebelum siswa mulai login
+    verifikasi_password.panaskan()
+
+    serve(app, host='0.0.0.0', port=port, threads=threads)
@@ -0,0 +1,81 @@
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, text
+from sqlalchemy.dialects import sqlite
+
+from app import app
+from models import db, User, Mapel, Ujian, JawabanSiswa, JawabanEssay, Soal, DraftJawaban, UjianKelas
+
+# ==================== CEK EXPLAIN QUERY PLAN ====================
+# Menjalankan EXPLAIN QUERY PLAN untuk query yang paling sering dipanggil saat
+# ujian berlangsung dan memastikan semuanya memakai indeks (tidak ada
+# "SCAN <tabel>" tanpa indeks). Jalankan: python cek_query_plan.py
+# Exit code 1 jika ada query yang melakukan full table scan.
+
+
+def daftar_query():
+    now = datetime.now()
+    return [
+        ('Cek double submit (siswa.ujian)',
+         JawabanSiswa.query.filter_by(siswa_id=1, ujian_id=1)),
+        ('Ujian aktif per kelas (siswa.dashboard)',
+         Ujian.query.join(UjianKelas, UjianKelas.ujian_id == Ujian.id)
+         .filter(UjianKelas.kelas_id == 1, UjianKelas.waktu_mulai <= now,
+                 UjianKelas.waktu_selesai >= now - timedelta(minutes=30))
+         .order_by(UjianKelas.waktu_mulai)),
+        ('Ujian aktif semua kelas (preview admin)',
+         Ujian.query.filter(Ujian.waktu_mulai <= now, Ujian.waktu_selesai >= now - timedelta(minutes=30))
+         .order_by(Ujian.waktu_mulai)),
+        ('Cek target kelas (siswa.ujian)',
+         UjianKelas.query.filter_by(ujian_id=1, kelas_id=1)),
+        ('Mapel milik guru (guru.dashboard)',
+         Mapel.query.filter_by(guru_id=1)),
+        ('Ujian milik guru (guru.dashboard)',
+         Ujian.query.join(Mapel).filter(Mapel.guru_id == 1).order_by(Ujian.waktu_mulai.desc())),
+        ('Hitung siswa per role (admin.dashboard)',
+         db.session.query(func.count(User.id)).filter(User.role == 'siswa')),
+        ('Login (login_unified)',
+         User.query.filter_by(username='siswa01', role='siswa')),
+        ('Tabel nilai per ujian (guru.lihat_nilai)',
+         JawabanSiswa.query.filter(JawabanSiswa.ujian_id == 1)),
+        ('Polling perubahan nilai (guru.refresh_tabel_nilai)',
+         JawabanSiswa.query.filter(JawabanSiswa.ujian_id == 1, JawabanSiswa.versi_nilai > 5)),
+        ('Soal per ujian (bank_soal.ambil_soal)',
+         Soal.query.filter_by(ujian_id=1).order_by(Soal.urutan)),
+        ('Essay per lembar (lembar_jawaban.ambil_essay)',
+         JawabanEssay.query.filter_by(jawaban_id=1)),
+        ('Draft autosave (autosave.ambil)',
+         DraftJawaban.query.filter_by(siswa_id=1, ujian_id=1)),
+    ]
+
+
+def query_plan(query):
+    sql = str(query.statement.compile(dialect=sqlite.dialect(), compile_kwargs={'literal_binds': True}))
+    rows = db.session.execute(text('EXPLAIN QUERY PLAN ' + sql)).fetchall()
+    return [row[-1] for row in rows]
+
+
+def full_scan(detail):
+    # "SCAN t USING (COVERING) INDEX ..." masih memakai indeks; "SCAN t" saja = full scan
+    return detail.startswith('SCAN ') and 'INDEX' not in detail
+
+
+def main():
+    gagal = 0
+    with app.app_context():
+        for judul, query in daftar_query():
+            plan = query_plan(query)
+            ok = not any(full_scan(detail) for detail in plan)
+            gagal += 0 if ok else 1
+            print(f"[{'OK' if ok else 'SCAN'}] {judul}")
+            for detail in plan:
+                print(f"       {detail}")
+
+    print('=' * 50)
+    print('Semua query memakai indeks.' if not gagal else f'{gagal} query masih full table scan!')
+    return 1 if gagal else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
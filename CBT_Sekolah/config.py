@@ -4,5 +4,77 @@ load_dotenv()
 
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'rahasia123')
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///cbt.db'
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+
+    # Profil deployment app factory: full | student | staff (lihat app.py)
+    CBT_PROFILE = os.getenv('CBT_PROFILE', 'full')
+    SERVER_PORT = int(os.getenv('PORT', '5000'))
+    SERVER_THREADS = int(os.getenv('SERVER_THREADS', '75'))
+    # Nilai nice (prioritas CPU) proses server, misal 10 untuk proses staf. Hanya Linux/macOS.
+    SERVER_NICE = int(os.getenv('SERVER_NICE', '0'))
+    # Bisa diarahkan ke file lain lewat env (misal DB sementara untuk load test)
+    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///cbt.db')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Profil performa SQLite (PRAGMA per koneksi, lihat services/sqlite_tuning.py)
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')  # sedikit risiko jika mati lampu, performa naik drastis
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+    SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', '-32000'))  # negatif = KiB (32 MB per koneksi)
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+    SQLITE_TEMP_STORE = os.getenv('SQLITE_TEMP_STORE', 'MEMORY')
+    SQLITE_WAL_AUTOCHECKPOINT = int(os.getenv('SQLITE_WAL_AUTOCHECKPOINT', '1000'))  # halaman
+    SQLITE_JOURNAL_SIZE_LIMIT = int(os.getenv('SQLITE_JOURNAL_SIZE_LIMIT', str(64 * 1024 * 1024)))
+    # Pool koneksi baca-saja (mode=ro) terpisah untuk dashboard & laporan
+    SQLITE_READ_POOL = os.getenv('SQLITE_READ_POOL', '1') == '1'
+    SQLITE_READ_POOL_SIZE = int(os.getenv('SQLITE_READ_POOL_SIZE', '10'))
+    SQLITE_READ_POOL_OVERFLOW = int(os.getenv('SQLITE_READ_POOL_OVERFLOW', '10'))
+    # Interval (detik) checkpoint PASSIVE di background, 0 = nonaktif
+    SQLITE_CHECKPOINT_INTERVAL = float(os.getenv('SQLITE_CHECKPOINT_INTERVAL', '30'))
+
+    # Interval (detik) flush buffer autosave jawaban siswa ke database
+    AUTOSAVE_INTERVAL = float(os.getenv('AUTOSAVE_INTERVAL', '3'))
+
+    # Antrian submit single-writer (aktifkan dengan SUBMIT_QUEUE=1 saat ujian serentak)
+    SUBMIT_QUEUE = os.getenv('SUBMIT_QUEUE', '0') == '1'
+    SUBMIT_QUEUE_BATCH = int(os.getenv('SUBMIT_QUEUE_BATCH', '50'))
+    SUBMIT_QUEUE_TIMEOUT = float(os.getenv('SUBMIT_QUEUE_TIMEOUT', '30'))
+
+    # Verifikasi password login di process pool + batas antrian (login serentak di awal ujian)
+    LOGIN_POOL = os.getenv('LOGIN_POOL', '1') == '1'
+    LOGIN_POOL_WORKERS = int(os.getenv('LOGIN_POOL_WORKERS', '0'))  # 0 = jumlah CPU - 1
+    LOGIN_QUEUE_MAX = int(os.getenv('LOGIN_QUEUE_MAX', '32'))
+    LOGIN_TIMEOUT = float(os.getenv('LOGIN_TIMEOUT', '10'))
+    LOGIN_RETRY_AFTER = int(os.getenv('LOGIN_RETRY_AFTER', '5'))
+
+    # Lama (detik) data user disimpan di cache user_loader
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '300'))
+
+    # Lama (detik) daftar ujian aktif per kelas di-cache untuk dashboard siswa
+    DASHBOARD_CACHE_TTL = int(os.getenv('DASHBOARD_CACHE_TTL', '15'))
+
+    # Interval (detik) setiap proses membaca tabel versi_cache untuk mengosongkan
+    # cache yang diubah proses lain (multi-worker / student+staff), 0 = nonaktif
+    CACHE_SYNC_INTERVAL = float(os.getenv('CACHE_SYNC_INTERVAL', '1'))
+
+    # Endpoint /metrics format Prometheus (lihat services/metrik.py), hanya untuk scraper lokal
+    METRICS = os.getenv('METRICS', '0') == '1'
+    METRICS_ALLOW = os.getenv('METRICS_ALLOW', '127.0.0.1,::1')  # kosong = semua alamat
+
+    # Impor soal PDF di latar belakang: halaman dibagi per blok ke process pool
+    PDF_POOL_WORKERS = int(os.getenv('PDF_POOL_WORKERS', '0'))  # 0 = jumlah CPU - 1 (minimal 1)
+    PDF_HALAMAN_PER_TUGAS = int(os.getenv('PDF_HALAMAN_PER_TUGAS', '4'))
+
+    # Export PDF hasil siswa massal (ZIP): konversi xhtml2pdf di process pool
+    PDF_EXPORT_WORKERS = int(os.getenv('PDF_EXPORT_WORKERS', '0'))  # 0 = jumlah CPU - 1 (minimal 1)
+
+    # Antrian pekerjaan latar (hitung ulang nilai, impor, export) di tabel pekerjaan
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))  # 0 = proses ini tidak menjalankan job
+    JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '1'))
+    JOB_PROGRESS_INTERVAL = float(os.getenv('JOB_PROGRESS_INTERVAL', '1'))  # batas frekuensi tulis progres
+    JOB_STALE_SECONDS = int(os.getenv('JOB_STALE_SECONDS', '60'))  # tanpa heartbeat -> dicoba ulang
+    JOB_KEEP_DAYS = int(os.getenv('JOB_KEEP_DAYS', '7'))  # job + file hasil lama dihapus
+    JOB_DIR = os.getenv('JOB_DIR', '')  # kosong = instance/pekerjaan
+
+    # Profiler per request + deteksi N+1 (dipicu admin lewat header X-CBT-Profil / ?_profil=1)
+    PROFILER = os.getenv('PROFILER', '1') == '1'
+    PROFILER_DIR = os.getenv('PROFILER_DIR', '')  # kosong = instance/profiles
+    PROFILER_N1_MIN = int(os.getenv('PROFILER_N1_MIN', '3'))
\ No newline at end of file
@@ -0,0 +1,294 @@
+import argparse
+import logging
+import math
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import urllib.request
+
+# ==================== SERVER MULTI-PROSES (WAITRESS x N, SATU PORT) ====================
+# Satu proses Python hanya memakai satu core untuk kode Python (GIL), berapa pun
+# jumlah thread waitress-nya. Skrip ini membuka SATU socket listening lalu
+# menjalankan N proses worker waitress yang menerima koneksi dari socket yang
+# sama (kernel membagi koneksi ke worker yang sedang menunggu).
+#   - Proses induk: migrasi database sekali, checkpoint WAL, mengawasi worker.
+#   - Setiap worker juga membuka port lokal acak khusus health check (/sehat),
+#     sehingga pemeriksaan melewati antrian waitress yang sama dengan request siswa.
+#   - Worker yang mati atau tidak menjawab health check dijalankan ulang otomatis
+#     (jeda bertambah jika terus gagal).
+#   - SIGHUP (Linux/Mac): restart bergiliran. Worker baru harus sehat dulu, baru
+#     worker lama berhenti menerima koneksi dan menyelesaikan request yang berjalan.
+#   - SIGTERM / Ctrl+C: semua worker berhenti dengan cara yang sama.
+# Cache in-process (user, dashboard) antar worker disinkronkan lewat tabel
+# versi_cache, lihat services/versi_cache.py.
+#
+# Contoh: python jalankan_multi.py --workers 4 --threads 20 --port 5000
+#         kill -HUP <pid induk>     -> kode baru dimuat tanpa memutus ujian
+
+logger = logging.getLogger('jalankan_multi')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Server CBT multi-proses (waitress, satu port)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='jumlah proses worker')
+    parser.add_argument('--threads', type=int, default=0,
+                        help='thread waitress per worker (0 = SERVER_THREADS dibagi jumlah worker)')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=0, help='0 = Config.SERVER_PORT')
+    parser.add_argument('--profil', default=None, help='full | student | staff (default CBT_PROFILE)')
+    parser.add_argument('--detak', type=float, default=2.0, help='interval health check (detik)')
+    parser.add_argument('--batas-macet', type=float, default=30.0,
+                        help='worker dimatikan jika tidak sehat selama ini (detik)')
+    parser.add_argument('--batas-mulai', type=float, default=60.0,
+                        help='waktu maksimal worker baru sampai sehat (detik)')
+    parser.add_argument('--tenggang', type=float, default=30.0,
+                        help='waktu menyelesaikan request berjalan saat worker dihentikan (detik)')
+    return parser.parse_args()
+
+
+# ==================== PROSES WORKER ====================
+def masih_sibuk(server, peta):
+    dispatcher = server.task_dispatcher
+    if dispatcher.active_count or dispatcher.queue:
+        return True
+    # Request yang sedang diterima / respons yang belum selesai dikirim
+    for channel in list(peta.values()):
+        if getattr(channel, 'request', None) is not None or getattr(channel, 'requests', None):
+            return True
+        if getattr(channel, 'total_outbufs_len', 0):
+            return True
+    return False
+
+
+def jalankan_worker(sock, profil, threads, env, port_sehat, berhenti, tenggang):
+    # Env diterapkan sebelum import config (Config dibaca saat import)
+    os.environ.update(env)
+    from waitress.server import create_server, BaseWSGIServer
+    from app import create_app
+    from services.verifikasi_password import verifikasi_password
+
+    # Ctrl+C di terminal terkirim ke semua proses; yang mengatur berhenti adalah induk
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *_: berhenti.set())
+
+    app = create_app(profil)
+    verifikasi_password.panaskan()
+
+    sock_sehat = socket.create_server(('127.0.0.1', 0))
+    peta = {}
+    server = create_server(app, map=peta, sockets=[sock, sock_sehat], threads=threads)
+    listener = [obj for obj in peta.values() if isinstance(obj, BaseWSGIServer)]
+
+    def tunggu_berhenti():
+        berhenti.wait()
+        # 1. Berhenti menerima koneksi; koneksi baru di socket bersama diambil worker lain
+        for obj in listener:
+            obj.accepting = False
+        # 2. Selesaikan request yang sedang berjalan (dibatasi tenggang)
+        batas = time.monotonic() + tenggang
+        while time.monotonic() < batas and masih_sibuk(server, peta):
+            time.sleep(0.1)
+        # 3. Kosongkan socket map dari dalam loop waitress -> server.run() selesai
+        listener[0].trigger.pull_trigger(peta.clear)
+
+    threading.Thread(target=tunggu_berhenti, name='tunggu-berhenti', daemon=True).start()
+    port_sehat.value = sock_sehat.getsockname()[1]
+    server.run()
+    server.task_dispatcher.shutdown()
+    # Keluar normal: handler atexit (flush autosave, antrian submit) tetap berjalan
+
+
+class Worker:
+    def __init__(self, ctx, nomor, sock, args, env):
+        self.nomor = nomor
+        self.berhenti = ctx.Event()
+        self.port_sehat = ctx.Value('i', 0)
+        self.proses = ctx.Process(
+            target=jalankan_worker, name=f'cbt-worker-{nomor}',
+            args=(sock, args.profil, args.threads, env, self.port_sehat, self.berhenti, args.tenggang))
+        self.proses.start()
+        self.mulai = time.monotonic()
+        self.sehat_terakhir = None
+
+    def cek_sehat(self, timeout):
+        port = self.port_sehat.value
+        if not port:
+            return False
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/sehat', timeout=timeout) as resp:
+                sehat = resp.status == 200
+        except OSError:
+            sehat = False
+        if sehat:
+            self.sehat_terakhir = time.monotonic()
+        return sehat
+
+    def macet(self, batas_macet, batas_mulai):
+        if self.sehat_terakhir is None:
+            return time.monotonic() - self.mulai > batas_mulai
+        return time.monotonic() - self.sehat_terakhir > batas_macet
+
+    def hentikan(self, tenggang):
+        self.berhenti.set()
+        self.proses.join(tenggang + 10)
+        if self.proses.is_alive():
+            logger.warning('Worker %d (pid %s) tidak berhenti, dipaksa', self.nomor, self.proses.pid)
+            self.proses.kill()
+            self.proses.join()
+
+
+# ==================== PROSES INDUK (PENGAWAS) ====================
+class Pengawas:
+    def __init__(self, args, sock, env):
+        self.args = args
+        self.sock = sock
+        self.env = env
+        self.ctx = multiprocessing.get_context('spawn')
+        self.workers = [None] * args.workers
+        self.gagal = [0] * args.workers     # mati berturut-turut per slot
+        self.jadwal = [0.0] * args.workers  # kapan slot boleh dijalankan lagi
+        self.minta_restart = threading.Event()
+        self.minta_berhenti = threading.Event()
+
+    def mulai_worker(self, nomor):
+        worker = Worker(self.ctx, nomor, self.sock, self.args, self.env)
+        logger.info('Worker %d dimulai (pid %s)', nomor, worker.proses.pid)
+        return worker
+
+    def ganti(self, nomor):
+        self.gagal[nomor] += 1
+        jeda = 0 if self.gagal[nomor] == 1 else min(30, 2 ** (self.gagal[nomor] - 1))
+        self.workers[nomor] = None
+        self.jadwal[nomor] = time.monotonic() + jeda
+        if jeda:
+            logger.warning('Worker %d gagal %d kali berturut-turut, dijalankan lagi dalam %d detik',
+                           nomor, self.gagal[nomor], jeda)
+
+    def awasi(self):
+        for nomor, worker in enumerate(self.workers):
+            if worker is None:
+                if time.monotonic() >= self.jadwal[nomor]:
+                    self.workers[nomor] = self.mulai_worker(nomor)
+                continue
+
+            if not worker.proses.is_alive():
+                logger.warning('Worker %d (pid %s) mati, kode keluar %s',
+                               nomor, worker.proses.pid, worker.proses.exitcode)
+                self.ganti(nomor)
+            elif worker.cek_sehat(self.args.detak):
+                self.gagal[nomor] = 0
+            elif worker.macet(self.args.batas_macet, self.args.batas_mulai):
+                logger.error('Worker %d (pid %s) tidak menjawab health check, dimatikan',
+                             nomor, worker.proses.pid)
+                worker.proses.kill()
+                worker.proses.join()
+                self.ganti(nomor)
+
+    def tunggu_sehat(self, worker):
+        batas = time.monotonic() + self.args.batas_mulai
+        while time.monotonic() < batas and not self.minta_berhenti.is_set():
+            if not worker.proses.is_alive():
+                return False
+            if worker.cek_sehat(self.args.detak):
+                return True
+            time.sleep(0.2)
+        return False
+
+    def restart_bergiliran(self):
+        logger.info('Restart bergiliran %d worker', len(self.workers))
+        for nomor, lama in enumerate(self.workers):
+            if self.minta_berhenti.is_set():
+                return
+            baru = self.mulai_worker(nomor)
+            if not self.tunggu_sehat(baru):
+                # Kode baru gagal start -> worker lama tetap melayani
+                logger.error('Worker baru %d tidak sehat, restart dibatalkan', nomor)
+                baru.hentikan(0)
+                return
+            self.workers[nomor] = baru
+            self.gagal[nomor] = 0
+            if lama is not None:
+                lama.hentikan(self.args.tenggang)
+                logger.info('Worker lama %d (pid %s) selesai', nomor, lama.proses.pid)
+
+    def hentikan_semua(self):
+        aktif = [w for w in self.workers if w is not None]
+        for worker in aktif:
+            worker.berhenti.set()
+        for worker in aktif:
+            worker.hentikan(self.args.tenggang)
+
+    def jalankan(self):
+        for nomor in range(len(self.workers)):
+            self.workers[nomor] = self.mulai_worker(nomor)
+        while not self.minta_berhenti.wait(self.args.detak):
+            if self.minta_restart.is_set():
+                self.minta_restart.clear()
+                self.restart_bergiliran()
+            self.awasi()
+        logger.info('Menghentikan semua worker...')
+        self.hentikan_semua()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(process)d] %(levelname)s %(message)s')
+
+    from config import Config
+    from app import create_app
+
+    args.workers = max(1, args.workers)
+    args.profil = args.profil or Config.CBT_PROFILE
+    args.port = args.port or Config.SERVER_PORT
+    args.threads = args.threads or max(4, math.ceil(Config.SERVER_THREADS / args.workers))
+
+    # Migrasi + admin default cukup sekali di sini, sebelum worker start bersamaan.
+    # App induk juga menjalankan checkpoint WAL untuk semua worker.
+    # Induk tidak mengerjakan job latar (impor PDF, ZIP, hitung ulang): crash/OOM
+    # di sana akan mematikan proses yang seharusnya menghidupkan ulang worker.
+    # Worker di-spawn dan membaca Config sendiri, jadi nilai ini tidak ikut.
+    Config.JOB_WORKERS = 0
+    create_app(args.profil)
+
+    # Process pool PDF dibagi rata antar worker; tanpa ini setiap worker membuat
+    # CPU-1 proses pembaca PDF + CPU-1 proses xhtml2pdf
+    cpu_pdf = max((os.cpu_count() or 1) - 1, 1)
+    pdf_per_worker = str(max(cpu_pdf // args.workers, 1))
+
+    env = {
+        'CBT_PROFILE': args.profil,
+        'SQLITE_CHECKPOINT_INTERVAL': '0',
+        # Dipakai metrik cbt_http_threads
+        'SERVER_THREADS': str(args.threads),
+        # Worker sudah paralel per proses; pool hashing per worker hanya menambah proses
+        'LOGIN_POOL': os.getenv('LOGIN_POOL', '0'),
+        'PDF_POOL_WORKERS': os.getenv('PDF_POOL_WORKERS', pdf_per_worker),
+        'PDF_EXPORT_WORKERS': os.getenv('PDF_EXPORT_WORKERS', pdf_per_worker),
+    }
+
+    sock = socket.create_server((args.host, args.port), backlog=1024)
+    pengawas = Pengawas(args, sock, env)
+
+    signal.signal(signal.SIGTERM, lambda *_: pengawas.minta_berhenti.set())
+    signal.signal(signal.SIGINT, lambda *_: pengawas.minta_berhenti.set())
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, lambda *_: pengawas.minta_restart.set())
+
+    print("=" * 50)
+    print(f" SERVER CBT MULTI-PROSES - profil: {args.profil}")
+    print(f" Worker: {args.workers} proses x {args.threads} thread")
+    print(f" PID induk: {os.getpid()} (kill -HUP untuk restart bergiliran)")
+    print(f" Akses Lokal: http://localhost:{args.port}")
+    print("=" * 50)
+
+    pengawas.jalankan()
+    sock.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
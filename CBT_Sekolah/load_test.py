@@ -0,0 +1,261 @@
+import argparse
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import datetime, timedelta
+from http.cookiejar import CookieJar
+
+import numpy as np
+
+# ==================== LOAD TEST SESI UJIAN (END-TO-END) ====================
+# Mensimulasikan satu sesi ujian penuh terhadap server waitress yang dijalankan
+# di proses ini, memakai database SQLite SEMENTARA (cbt.db asli tidak disentuh):
+#   siswa : login -> dashboard -> buka ujian -> "berpikir" -> submit serentak
+#           saat waktu habis (burst)
+#   guru  : polling refresh_tabel_nilai selama sesi berjalan
+# Hasil: p50/p95/p99, error rate dan jumlah "database is locked" per endpoint.
+#
+# Contoh: python load_test.py --siswa 75 --guru 3 --think 10
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Load test sesi ujian CBT (waitress in-process)')
+    parser.add_argument('--siswa', type=int, default=75, help='jumlah siswa virtual')
+    parser.add_argument('--guru', type=int, default=3, help='jumlah guru virtual yang polling tabel nilai')
+    parser.add_argument('--soal-pg', type=int, default=40)
+    parser.add_argument('--soal-essay', type=int, default=2)
+    parser.add_argument('--think', type=float, default=10, help='lama mengerjakan (detik) sebelum burst submit')
+    parser.add_argument('--poll', type=float, default=2, help='interval polling guru (detik)')
+    parser.add_argument('--threads', type=int, default=75, help='jumlah thread waitress')
+    parser.add_argument('--hash-cepat', action='store_true',
+                        help='hash password murah saat seeding (login tidak lagi mengukur biaya hash asli)')
+    return parser.parse_args()
+
+
+# ==================== KLIEN HTTP SEDERHANA (STDLIB) ====================
+class TanpaRedirect(urllib.request.HTTPRedirectHandler):
+    # Redirect tidak diikuti agar setiap endpoint diukur sendiri-sendiri
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Statistik:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latensi = defaultdict(list)
+        self.error = defaultdict(int)
+        self.locked = defaultdict(int)
+
+    def catat(self, endpoint, detik, ok):
+        with self._lock:
+            self.latensi[endpoint].append(detik)
+            if not ok:
+                self.error[endpoint] += 1
+
+    def catat_locked(self, path):
+        with self._lock:
+            self.locked[path] += 1
+
+
+class Klien:
+    def __init__(self, base_url, statistik):
+        self.base_url = base_url
+        self.statistik = statistik
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(CookieJar()), TanpaRedirect)
+
+    def request(self, endpoint, path, data=None, ok_status=(200,)):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        mulai = time.perf_counter()
+        try:
+            resp = self.opener.open(self.base_url + path, data=body, timeout=120)
+            status, headers, isi = resp.status, resp.headers, resp.read()
+        except urllib.error.HTTPError as e:
+            status, headers, isi = e.code, e.headers, e.read()
+        except Exception:
+            status, headers, isi = None, {}, b''
+        self.statistik.catat(endpoint, time.perf_counter() - mulai, status in ok_status)
+        return status, headers, isi
+
+
+# ==================== SEEDING DATABASE SEMENTARA ====================
+def seed(app, args):
+    from werkzeug.security import generate_password_hash
+    from models import db, User, Kelas, Mapel, Ujian
+    from services.bank_soal import simpan_soal
+    from services.ujian_kelas import simpan_kelas_ujian
+
+    metode = {'method': 'pbkdf2:sha256:1000'} if args.hash_cepat else {}
+    with app.app_context():
+        kelas = Kelas(nama_kelas='LOADTEST')
+        db.session.add(kelas)
+        db.session.flush()
+
+        guru = User(username='guru0', password=generate_password_hash('guru', **metode), role='guru', nama='Guru 0')
+        db.session.add(guru)
+        for i in range(args.siswa):
+            db.session.add(User(username=f'siswa{i}', password=generate_password_hash('siswa', **metode),
+                                role='siswa', nama=f'Siswa {i}', kelas_id=kelas.id))
+        db.session.flush()
+
+        mapel = Mapel(nama='Load Test', guru_id=guru.id)
+        db.session.add(mapel)
+        db.session.flush()
+
+        now = datetime.now()
+        ujian = Ujian(judul='Load Test', mapel_id=mapel.id,
+                      waktu_mulai=now - timedelta(minutes=1),
+                      waktu_selesai=now + timedelta(seconds=args.think + 60))
+        db.session.add(ujian)
+        db.session.flush()
+        simpan_kelas_ujian(ujian, [kelas.id])
+
+        pg = [{'id': f'pg{i}', 'soal': f'Soal {i}', 'a': '1', 'b': '2', 'c': '3', 'd': '4', 'e': '5',
+               'kunci': random.choice('ABCDE')} for i in range(args.soal_pg)]
+        essay = [{'id': f'es{i}', 'soal': f'Essay {i}', 'bobot': 10} for i in range(args.soal_essay)]
+        simpan_soal(ujian.id, pg, essay)
+        db.session.commit()
+        return ujian.id
+
+
+# ==================== SKENARIO ====================
+def login_siswa(klien, idx):
+    # 503 = antrian verifikasi password penuh -> ulangi sesuai Retry-After (seperti browser siswa)
+    for _ in range(20):
+        status, headers, _ = klien.request('login', '/login-unified',
+                                           {'username': f'siswa{idx}', 'password': 'siswa', 'role': 'siswa'},
+                                           ok_status=(302, 503))
+        if status != 503:
+            return
+        klien.statistik.catat('login (ditolak 503)', 0, True)
+        time.sleep(float(headers.get('Retry-After') or 1) * random.uniform(0.5, 1.0))
+
+
+def siswa_virtual(base_url, statistik, idx, ujian_id, args, barrier):
+    klien = Klien(base_url, statistik)
+    login_siswa(klien, idx)
+    klien.request('siswa.dashboard', '/siswa/dashboard')
+    status, _, isi = klien.request('siswa.ujian GET', f'/siswa/ujian/{ujian_id}')
+    field = sorted(set(re.findall(rb'name="((?:pg|essay)_[^"]+)"', isi)))
+
+    # Waktu mengerjakan acak, lalu semua siswa menunggu "waktu habis" bersama-sama
+    time.sleep(random.uniform(args.think * 0.5, args.think))
+    jawaban = {}
+    for f in field:
+        f = f.decode()
+        jawaban[f] = random.choice('ABCDE') if f.startswith('pg_') else 'Jawaban essay siswa ' * 5
+    try:
+        barrier.wait(timeout=args.think + 120)
+    except threading.BrokenBarrierError:
+        pass
+    klien.request('siswa.ujian POST', f'/siswa/ujian/{ujian_id}', jawaban, ok_status=(302,))
+
+
+def guru_virtual(base_url, statistik, idx, ujian_id, args, selesai):
+    klien = Klien(base_url, statistik)
+    # guru0 pemilik mapel; guru lain memakai akun admin agar lolos cek akses
+    if idx == 0:
+        klien.request('login', '/login-unified', {'username': 'guru0', 'password': 'guru', 'role': 'guru'}, ok_status=(302,))
+    else:
+        klien.request('login', '/login-unified', {'username': 'admin', 'password': 'admin123', 'role': 'admin'}, ok_status=(302,))
+
+    token = ''
+    while not selesai.is_set():
+        _, headers, _ = klien.request('guru.refresh_tabel_nilai',
+                                      f'/guru/refresh_tabel_nilai/{ujian_id}?token={token}', ok_status=(200, 204))
+        token = headers.get('X-Nilai-Token') or token
+        selesai.wait(args.poll)
+
+
+class PenghitungLocked(logging.Handler):
+    # Flask mencatat setiap exception request sebagai "Exception on <path> [<method>]"
+    def __init__(self, statistik):
+        super().__init__(logging.ERROR)
+        self.statistik = statistik
+
+    def emit(self, record):
+        exc = record.exc_info[1] if record.exc_info else None
+        if exc is not None and 'database is locked' in str(exc):
+            match = re.search(r'Exception on (\S+) \[(\w+)\]', record.getMessage())
+            self.statistik.catat_locked(f'{match.group(2)} {match.group(1)}' if match else '?')
+
+
+# ==================== LAPORAN ====================
+def laporan(statistik, durasi):
+    print('=' * 96)
+    print(f"{'Endpoint':<28}{'n':>6}{'err':>6}{'err%':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'req/s':>8}")
+    print('-' * 96)
+    for endpoint, data in statistik.latensi.items():
+        ms = np.array(data) * 1000
+        err = statistik.error[endpoint]
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        print(f"{endpoint:<28}{len(ms):>6}{err:>6}{err / len(ms) * 100:>7.1f}%"
+              f"{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}{ms.max():>10.1f}{len(ms) / durasi:>8.1f}")
+    print('-' * 96)
+    if statistik.locked:
+        for path, n in sorted(statistik.locked.items()):
+            print(f"'database is locked' {path}: {n}")
+    else:
+        print("'database is locked': 0")
+
+
+def main():
+    args = parse_args()
+
+    # DB sementara harus di-set SEBELUM app di-import (Config membaca env saat import)
+    tmp = tempfile.mkdtemp(prefix='cbt_loadtest_')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp, 'loadtest.db')
+
+    from waitress.server import create_server
+    from app import app
+    from models import JawabanSiswa
+
+    statistik = Statistik()
+    app.logger.addHandler(PenghitungLocked(statistik))
+    logging.getLogger('waitress.queue').setLevel(logging.ERROR)
+
+    print(f"Seeding {args.siswa} siswa, {args.soal_pg} soal PG, {args.soal_essay} essay di {tmp} ...")
+    ujian_id = seed(app, args)
+
+    server = create_server(app, host='127.0.0.1', port=0, threads=args.threads)
+    base_url = f'http://127.0.0.1:{server.effective_port}'
+    threading.Thread(target=server.run, daemon=True).start()
+    print(f"Waitress jalan di {base_url} ({args.threads} thread)")
+
+    barrier = threading.Barrier(args.siswa)
+    selesai = threading.Event()
+    guru = [threading.Thread(target=guru_virtual, args=(base_url, statistik, i, ujian_id, args, selesai))
+            for i in range(args.guru)]
+    siswa = [threading.Thread(target=siswa_virtual, args=(base_url, statistik, i, ujian_id, args, barrier))
+             for i in range(args.siswa)]
+
+    mulai = time.perf_counter()
+    for t in guru + siswa:
+        t.start()
+    for t in siswa:
+        t.join()
+    selesai.set()
+    for t in guru:
+        t.join()
+    durasi = time.perf_counter() - mulai
+    server.close()
+
+    with app.app_context():
+        tersimpan = JawabanSiswa.query.filter_by(ujian_id=ujian_id).count()
+
+    print(f"\nDurasi sesi: {durasi:.1f} detik | lembar tersimpan: {tersimpan}/{args.siswa}")
+    laporan(statistik, durasi)
+    return 0 if tersimpan == args.siswa else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,19 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+import uuid
 from datetime import datetime
+from services.koneksi_baca import SessionBacaTulis
 
-db = SQLAlchemy()
+# Session dapat diarahkan ke engine baca-saja per request (lihat services/koneksi_baca.py)
+db = SQLAlchemy(session_options={'class_': SessionBacaTulis})
 
 # ===================== USER =====================
 class User(UserMixin, db.Model):
+    __table_args__ = (
+        # Hitung per role (dashboard admin) & daftar siswa per kelas
+        db.Index('ix_user_role_kelas', 'role', 'kelas_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(50), unique=True, nullable=False)
     password = db.Column(db.String(255), nullable=False)
@@ -28,22 +36,41 @@ class Kelas(db.Model):
 class Mapel(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nama = db.Column(db.String(100), nullable=False)
-    guru_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    guru_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
 
 
 # ===================== UJIAN =====================
 class Ujian(db.Model):
+    __table_args__ = (
+        # Filter jendela waktu ujian aktif (dashboard siswa)
+        db.Index('ix_ujian_waktu', 'waktu_mulai', 'waktu_selesai'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     judul = db.Column(db.String(150), nullable=False)
-    mapel_id = db.Column(db.Integer, db.ForeignKey('mapel.id', ondelete='CASCADE'), nullable=False)
+    mapel_id = db.Column(db.Integer, db.ForeignKey('mapel.id', ondelete='CASCADE'), nullable=False, index=True)
     waktu_mulai = db.Column(db.DateTime, nullable=False)
     waktu_selesai = db.Column(db.DateTime, nullable=False)
     durasi_menit = db.Column(db.Integer, default=60)
 
+    # [LEGACY] Bank soal lama dalam bentuk JSON. Sekarang soal disimpan per baris
+    # di tabel Soal; kolom ini hanya dibaca sekali oleh migrasi lalu dikosongkan.
     soal_pg = db.Column(db.Text)
     soal_essay = db.Column(db.Text)
 
-    mapel = db.relationship('Mapel', backref='ujian', passive_deletes=True)
+    # Dinaikkan setiap kali soal disimpan ulang (dipakai sebagai key cache soal)
+    versi_soal = db.Column(db.Integer, nullable=False, default=1)
+
+    # Token acak per ujian, ikut key cache soal: SQLite memakai ulang id ujian yang
+    # dihapus, sehingga (id, versi_soal) saja bisa sama dengan ujian lama
+    token_cache = db.Column(db.String(32), default=lambda: uuid.uuid4().hex)
+
+    # Counter perubahan data nilai (submit/koreksi/hitung ulang/reset) untuk polling tabel nilai
+    versi_nilai = db.Column(db.Integer, nullable=False, default=0)
+
+    # passive_deletes juga di sisi Mapel: hapus mapel diserahkan ke ON DELETE CASCADE,
+    # bukan ORM yang mengosongkan mapel_id (NOT NULL) ujiannya
+    mapel = db.relationship('Mapel', backref=db.backref('ujian', passive_deletes=True), passive_deletes=True)
 
     # ✔ RELASI YANG BENAR (1↔Many)
     jawaban_siswa = db.relationship(
@@ -52,9 +79,76 @@ class Ujian(db.Model):
         passive_deletes=True
     )
 
+    daftar_soal = db.relationship(
+        'Soal',
+        backref='ujian',
+        order_by='Soal.urutan',
+        passive_deletes=True
+    )
+
+
+# ===================== TARGET KELAS UJIAN =====================
+class UjianKelas(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('ujian_id', 'kelas_id', name='uq_ujian_kelas'),
+        # Ujian aktif per kelas (dashboard siswa) langsung dari indeks ini
+        db.Index('ix_ujian_kelas_waktu', 'kelas_id', 'waktu_mulai', 'waktu_selesai'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    ujian_id = db.Column(db.Integer, db.ForeignKey('ujian.id', ondelete='CASCADE'), nullable=False)
+    kelas_id = db.Column(db.Integer, db.ForeignKey('kelas.id', ondelete='CASCADE'), nullable=False)
+
+    # Salinan jadwal Ujian (disinkronkan saat ujian disimpan) agar filter jendela
+    # waktu tidak perlu join ke tabel ujian
+    waktu_mulai = db.Column(db.DateTime, nullable=False)
+    waktu_selesai = db.Column(db.DateTime, nullable=False)
+
+
+# ===================== SOAL =====================
+class Soal(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('ujian_id', 'tipe', 'uid', name='uq_soal_ujian_tipe_uid'),
+        db.Index('ix_soal_ujian_tipe_urutan', 'ujian_id', 'tipe', 'urutan'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    ujian_id = db.Column(db.Integer, db.ForeignKey('ujian.id', ondelete='CASCADE'), nullable=False)
+
+    # ID permanen soal (UUID, atau index "0", "1" untuk data lama) -> dipakai sebagai key jawaban
+    uid = db.Column(db.String(64), nullable=False)
+    tipe = db.Column(db.String(10), nullable=False)  # pg, essay
+    urutan = db.Column(db.Integer, nullable=False, default=0)
+
+    soal = db.Column(db.Text, default='')
+    gambar = db.Column(db.String(255), default='')
+
+    # Khusus PG: teks & gambar opsi A-E + kunci jawaban
+    a = db.Column(db.Text, default='')
+    b = db.Column(db.Text, default='')
+    c = db.Column(db.Text, default='')
+    d = db.Column(db.Text, default='')
+    e = db.Column(db.Text, default='')
+    a_gambar = db.Column(db.String(255), default='')
+    b_gambar = db.Column(db.String(255), default='')
+    c_gambar = db.Column(db.String(255), default='')
+    d_gambar = db.Column(db.String(255), default='')
+    e_gambar = db.Column(db.String(255), default='')
+    kunci = db.Column(db.String(1))
+
+    # Khusus Essay: bobot nilai maksimal
+    bobot = db.Column(db.Integer, default=0)
+
 
 # ===================== JAWABAN SISWA =====================
 class JawabanSiswa(db.Model):
+    __table_args__ = (
+        # Satu siswa hanya boleh punya satu lembar jawaban per ujian (anti double submit)
+        db.Index('uq_jawaban_siswa_ujian', 'siswa_id', 'ujian_id', unique=True),
+        # Tabel nilai per ujian + polling perubahan (versi_nilai > token)
+        db.Index('ix_jawaban_siswa_ujian_versi', 'ujian_id', 'versi_nilai'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     siswa_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
 
@@ -64,11 +158,99 @@ class JawabanSiswa(db.Model):
         nullable=False
     )
 
+    # [LEGACY] Jawaban lama dalam bentuk JSON {id_soal/index: jawaban}.
+    # Dikonversi sekali oleh migrasi ke jawaban_pg_kode + JawabanEssay lalu dikosongkan.
     jawaban_pg = db.Column(db.Text)
     jawaban_essay = db.Column(db.Text)
 
+    # Jawaban PG ringkas: 1 byte per soal PG sesuai urutan soal (b'A'..b'E', b'-' = kosong)
+    jawaban_pg_kode = db.Column(db.LargeBinary)
+
     nilai_pg = db.Column(db.Float, default=0)
     nilai_essay = db.Column(db.Float, default=0)
     total_nilai = db.Column(db.Float, default=0)
 
-    waktu_submit = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    # Disimpan saat submit & hitung ulang agar tabel nilai tidak perlu menilai ulang
+    jml_benar_pg = db.Column(db.Integer, default=0)
+    total_soal_pg = db.Column(db.Integer, default=0)
+
+    # Nilai Ujian.versi_nilai saat baris ini terakhir berubah
+    versi_nilai = db.Column(db.Integer, default=0)
+
+    waktu_submit = db.Column(db.DateTime, default=datetime.utcnow)
+
+    daftar_essay = db.relationship(
+        'JawabanEssay',
+        backref='lembar',
+        passive_deletes=True
+    )
+
+
+# ===================== JAWABAN ESSAY (PER SOAL) =====================
+class JawabanEssay(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('jawaban_id', 'soal_uid', name='uq_jawaban_essay_soal'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    jawaban_id = db.Column(db.Integer, db.ForeignKey('jawaban_siswa.id', ondelete='CASCADE'), nullable=False)
+    soal_uid = db.Column(db.String(64), nullable=False)
+    jawaban = db.Column(db.Text, default='')
+    nilai = db.Column(db.Float, default=0)
+
+# ===================== DRAFT JAWABAN (AUTOSAVE) =====================
+class DraftJawaban(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('siswa_id', 'ujian_id', 'field', name='uq_draft_siswa_ujian_field'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    siswa_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    ujian_id = db.Column(db.Integer, db.ForeignKey('ujian.id', ondelete='CASCADE'), nullable=False)
+
+    # Nama field form (pg_{uid} / essay_{uid}) dan isi jawaban terakhir
+    field = db.Column(db.String(80), nullable=False)
+    nilai = db.Column(db.Text, default='')
+    diperbarui = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# ===================== VERSI CACHE (SINKRON ANTAR PROSES) =====================
+class VersiCache(db.Model):
+    # Satu baris per jenis cache in-process (user, dashboard, ...). Dinaikkan
+    # setiap data sumbernya berubah; proses worker lain mengosongkan cache-nya
+    # saat melihat versi baru.
+    nama = db.Column(db.String(50), primary_key=True)
+    versi = db.Column(db.Integer, nullable=False, default=0)
+
+
+# ===================== PEKERJAAN LATAR (ANTRIAN JOB) =====================
+class Pekerjaan(db.Model):
+    # Job berat staf (impor, export, hitung ulang nilai) yang dikerjakan thread
+    # worker di luar thread waitress, lihat services/antrian_pekerjaan.py
+    __table_args__ = (
+        # Worker mengambil job tertua berstatus 'menunggu'
+        db.Index('ix_pekerjaan_status', 'status', 'dibuat'),
+    )
+
+    # uuid hex: dipakai di URL progres/unduh, tidak bisa ditebak
+    id = db.Column(db.String(32), primary_key=True)
+    jenis = db.Column(db.String(50), nullable=False)
+    parameter = db.Column(db.Text, nullable=False, default='{}')  # JSON
+    status = db.Column(db.String(20), nullable=False, default='menunggu')  # menunggu, berjalan, selesai, gagal
+    pemilik_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'), index=True)
+
+    progres = db.Column(db.Integer, default=0)
+    progres_total = db.Column(db.Integer, default=0)
+    pesan = db.Column(db.Text, default='')
+    hasil = db.Column(db.Text)  # JSON hasil terstruktur (misal laporan impor)
+    file_hasil = db.Column(db.String(255))
+    nama_file = db.Column(db.String(255))
+    tautan = db.Column(db.String(255))  # halaman tujuan setelah selesai
+
+    percobaan = db.Column(db.Integer, nullable=False, default=0)
+    maks_percobaan = db.Column(db.Integer, nullable=False, default=3)
+    pemegang = db.Column(db.String(100))  # host:pid:thread worker yang mengerjakan
+    dibuat = db.Column(db.DateTime, default=datetime.now)
+    mulai = db.Column(db.DateTime)
+    selesai = db.Column(db.DateTime)
+    detak = db.Column(db.DateTime)  # heartbeat worker; basi = proses mati -> dicoba ulang
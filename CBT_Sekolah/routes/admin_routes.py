@@ -1,13 +1,28 @@
+import json
+import os
+import uuid
 from datetime import datetime
 from operator import or_
 
-import pandas as pd  # <--- WAJIB DITAMBAHKAN UNTUK BACA EXCEL
-
-from flask import Blueprint, render_template, request, flash, redirect, url_for
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify
 from flask_login import login_required, current_user, login_user
 from sqlalchemy.orm import joinedload
 
-from models import db, User, Kelas, Mapel, Ujian
+from models import db, User, Kelas, Mapel, Ujian, Pekerjaan
+from services.exam_cache import exam_cache
+from services.autosave import autosave_buffer
+from services.antrian_submit import antrian_submit
+from services.verifikasi_password import verifikasi_password
+from services.sesi_user import user_cache
+from services.ujian_kelas import dashboard_cache
+from services.tabel_nilai import naikkan_versi_nilai_siswa
+from services.sqlite_tuning import checkpoint_wal
+from services.koneksi_baca import baca_saja, pakai_koneksi_baca, status_pool
+from services.versi_cache import sinkron_cache
+from services.profil_request import profil_request
+from services.impor_pdf import impor_pdf
+from services.export_pdf import export_pdf
+from services.antrian_pekerjaan import antrian_pekerjaan, PARAM_FILE_MASUK, SELESAI
 from werkzeug.security import generate_password_hash, check_password_hash
 
 bp = Blueprint('admin', __name__)
@@ -16,6 +31,7 @@ bp = Blueprint('admin', __name__)
 # ==================== DASHBOARD ====================
 @bp.route('/dashboard')
 @login_required
+@baca_saja
 def dashboard():
     if current_user.role != 'admin':
         return redirect('/')
@@ -33,6 +49,31 @@ def dashboard():
                            now=datetime.now())
 
 
+# ==================== STATUS SERVER (CACHE, AUTOSAVE, ANTRIAN SUBMIT) ====================
+@bp.route('/status_server')
+@login_required
+def status_server():
+    if current_user.role != 'admin':
+        return ('', 403)
+
+    return jsonify({
+        'cache_soal': exam_cache.stats(),
+        'autosave': autosave_buffer.stats(),
+        'antrian_submit': antrian_submit.stats(),
+        'login': verifikasi_password.stats(),
+        'user_cache': user_cache.stats(),
+        'dashboard_cache': dashboard_cache.stats(),
+        'sqlite_wal': checkpoint_wal.stats(),
+        'pool_db': status_pool(db.engines),
+        'sinkron_cache': sinkron_cache.stats(),
+        'profiler': profil_request.stats(),
+        'impor_pdf': impor_pdf.stats(),
+        'export_pdf': export_pdf.stats(),
+        'antrian_pekerjaan': antrian_pekerjaan.stats(),
+        'pid': os.getpid(),
+    })
+
+
 # ==================== KELOLA KELAS ====================
 @bp.route('/kelola_kelas', methods=['GET', 'POST'])
 @login_required
@@ -59,6 +100,7 @@ def kelola_kelas():
             kelas = Kelas.query.get_or_404(kelas_id)
             kelas.nama_kelas = request.form['nama_edit']
             db.session.commit()
+            user_cache.clear()
             flash('Kelas berhasil diupdate!', 'success')
 
         # Hapus Kelas
@@ -67,6 +109,8 @@ def kelola_kelas():
             kelas = Kelas.query.get_or_404(kelas_id)
             db.session.delete(kelas)
             db.session.commit()
+            user_cache.clear()
+            dashboard_cache.clear()
             flash('Kelas berhasil dihapus!', 'success')
 
     # Query Kelas + hitung jumlah siswa
@@ -81,6 +125,65 @@ def kelola_kelas():
     return render_template('admin/kelola_kelas.html', kelas=kelas)
 
 
+def impor_excel(file, role, dry_run):
+    # pandas (juga dipakai services.impor_user) baru dimuat saat admin benar-benar import Excel
+    import pandas as pd
+    from services.impor_user import impor_user
+
+    # [FIX] dtype=str agar NIS '00123' tidak terbaca '123' & NIP panjang tidak jadi notasi ilmiah
+    try:
+        df = pd.read_excel(file, dtype=str)
+    except Exception as e:
+        raise ValueError(f'Gagal memproses file: {e}') from None
+    return impor_user(df, role, dry_run)
+
+
+KETERANGAN_GAGAL_IMPOR = {
+    'siswa': 'NIS duplikat / Nama Kelas salah / Format Salah',
+    'guru': 'Duplikat/Invalid',
+}
+
+
+def pesan_hasil_impor(hasil, keterangan_gagal):
+    if hasil.dry_run:
+        return f'Pratinjau Import (belum disimpan): Siap diimpor: {hasil.berhasil}, Gagal: {hasil.gagal}'
+    return f'Import Selesai! Berhasil: {hasil.berhasil}, Gagal: {hasil.gagal} ({keterangan_gagal})'
+
+
+# ==================== JOB LATAR: IMPORT EXCEL SISWA / GURU ====================
+@antrian_pekerjaan.tugas('impor_excel')
+def job_impor_excel(konteks, file_masuk, role, dry_run):
+    hasil = impor_excel(file_masuk, role, dry_run)
+    # Laporan per baris ditampilkan di kelola_siswa/kelola_guru?impor=<id job>
+    konteks.hasil = hasil._asdict()
+    return pesan_hasil_impor(hasil, KETERANGAN_GAGAL_IMPOR[role])
+
+
+def kirim_impor_excel(file, role, endpoint):
+    # Tautan di halaman progres menuju laporan per baris job ini
+    job_id = uuid.uuid4().hex
+    antrian_pekerjaan.kirim('impor_excel', {
+        PARAM_FILE_MASUK: antrian_pekerjaan.simpan_upload(file, os.path.splitext(file.filename)[1].lower()),
+        'role': role,
+        'dry_run': 'dry_run' in request.form,
+    }, current_user.id, tautan=url_for(endpoint, impor=job_id), job_id=job_id)
+    return redirect(url_for('halaman_pekerjaan', job_id=job_id))
+
+
+def ambil_laporan_impor():
+    # Laporan hanya ditampilkan jika ada baris gagal / mode pratinjau (sama seperti sebelumnya)
+    from services.impor_user import HasilImpor
+
+    job_id = request.args.get('impor')
+    if not job_id:
+        return None
+    job = db.session.get(Pekerjaan, job_id)
+    if job is None or job.status != SELESAI or not job.hasil or job.pemilik_id != current_user.id:
+        return None
+    laporan = HasilImpor(**json.loads(job.hasil))
+    return laporan if laporan.dry_run or laporan.gagal else None
+
+
 # ==================== KELOLA SISWA (FIX IMPORT EXCEL) ====================
 @bp.route('/kelola_siswa', methods=['GET', 'POST'])
 @login_required
@@ -92,69 +195,12 @@ def kelola_siswa():
     # 2. PROSES REQUEST POST (TAMBAH, EDIT, HAPUS, IMPORT)
     if request.method == 'POST':
         # --- FITUR BARU: IMPORT EXCEL (PERBAIKAN TIPE DATA) ---
+        # Dikerjakan antrian pekerjaan; laporan per baris tampil lewat ?impor=<id job>
         if 'import_siswa' in request.form:
             file = request.files.get('file_excel')
             if file and file.filename.endswith(('.xlsx', '.xls')):
-                try:
-                    # [FIX] Tambahkan dtype=str agar NIS '00123' tidak terbaca '123'
-                    df = pd.read_excel(file, dtype=str) 
-                    
-                    berhasil = 0
-                    gagal = 0
-
-                    for index, row in df.iterrows():
-                        # Ambil data & bersihkan format
-                        # Karena dtype=str, NaN akan menjadi string 'nan', perlu dicek
-                        raw_nis = str(row.get('NIS', '')).strip()
-                        raw_nama = str(row.get('Nama', '')).strip()
-                        raw_kelas = str(row.get('Kelas', '')).strip()
-
-                        # Validasi Data Kosong / Header
-                        if not raw_nis or raw_nis.lower() == 'nan' or not raw_nama or raw_nama.lower() == 'nan':
-                            gagal += 1
-                            continue
-
-                        # Bersihkan Format Angka (misal 12345.0 menjadi 12345)
-                        if raw_nis.endswith('.0'):
-                            nis = raw_nis[:-2]
-                        else:
-                            nis = raw_nis
-                        
-                        nama = raw_nama
-                        nama_kelas = raw_kelas
-
-                        # 1. Cek duplikat NIS
-                        if User.query.filter_by(username=nis).first():
-                            gagal += 1
-                            continue
-
-                        # 2. Cari ID Kelas
-                        kelas_obj = Kelas.query.filter_by(nama_kelas=nama_kelas).first()
-                        if not kelas_obj:
-                            # Jika kelas tidak ditemukan di DB, gagal import baris ini
-                            gagal += 1
-                            continue
-
-                        # 3. Tambahkan User Baru (Password Default = NIS)
-                        db.session.add(User(
-                            username=nis,
-                            password=generate_password_hash(nis),
-                            role='siswa',
-                            nama=nama,
-                            kelas_id=kelas_obj.id
-                        ))
-                        berhasil += 1
-
-                    db.session.commit()
-                    flash(
-                        f'Import Selesai! Berhasil: {berhasil}, Gagal: {gagal} (NIS duplikat / Nama Kelas salah / Format Salah)',
-                        'info')
-
-                except Exception as e:
-                    flash(f'Gagal memproses file: {str(e)}. Pastikan format kolom (NIS, Nama, Kelas) sudah benar.', 'danger')
-            else:
-                flash('File Excel tidak ditemukan atau format file salah!', 'warning')
-
+                return kirim_impor_excel(file, 'siswa', '.kelola_siswa')
+            flash('File Excel tidak ditemukan atau format file salah!', 'warning')
             return redirect(url_for('.kelola_siswa'))
 
         # --- FITUR LAMA: TAMBAH MANUAL ---
@@ -190,6 +236,7 @@ def kelola_siswa():
                 user.password = generate_password_hash(request.form['password_edit'].strip())
 
             db.session.commit()
+            user_cache.invalidate(user.id)
             flash('Data siswa berhasil diupdate!', 'success')
 
             return redirect(url_for('.kelola_siswa'))
@@ -198,13 +245,18 @@ def kelola_siswa():
         elif 'hapus' in request.form:
             user_id = request.form['user_id_hapus']
             user = User.query.get_or_404(user_id)
+            # Tabel nilai guru yang sedang terbuka ikut membuang baris siswa ini
+            naikkan_versi_nilai_siswa(user.id)
             db.session.delete(user)
             db.session.commit()
+            user_cache.invalidate(user_id)
             flash('Siswa berhasil dihapus!', 'success')
 
             return redirect(url_for('.kelola_siswa'))
 
     # 3. PROSES REQUEST GET (ATAU SETELAH REDIRECT DARI POST)
+    # Bagian POST di atas sudah commit/rollback -> daftar siswa dibaca lewat engine baca-saja
+    pakai_koneksi_baca()
 
     # --- CARI & FILTER ---
     q = request.args.get('q', '').strip()
@@ -233,7 +285,8 @@ def kelola_siswa():
     # Ambil data semua kelas untuk filter dan form
     kelas_list = Kelas.query.order_by(Kelas.nama_kelas).all()
 
-    return render_template('admin/kelola_siswa.html', siswa=siswa, kelas=kelas_list)
+    return render_template('admin/kelola_siswa.html', siswa=siswa, kelas=kelas_list,
+                           laporan_impor=ambil_laporan_impor())
 
 
 # ==================== KELOLA GURU (FIX IMPORT EXCEL) ====================
@@ -246,48 +299,8 @@ def kelola_guru():
         # --- FITUR BARU: IMPORT EXCEL (PERBAIKAN TIPE DATA) ---
         if 'import_guru' in request.form:
             file = request.files.get('file_excel')
-            if file:
-                try:
-                    # [FIX] Tambahkan dtype=str agar NIP panjang tidak jadi notasi ilmiah
-                    df = pd.read_excel(file, dtype=str)
-                    berhasil = 0
-                    skip = 0
-
-                    for _, row in df.iterrows():
-                        raw_nip = str(row.get('NIP', '')).strip()
-                        raw_nama = str(row.get('Nama', '')).strip()
-
-                        if not raw_nip or raw_nip.lower() == 'nan' or not raw_nama:
-                            skip += 1
-                            continue
-
-                        # Bersihkan Format Angka (198501.0 -> 198501)
-                        if raw_nip.endswith('.0'):
-                            nip = raw_nip[:-2]
-                        else:
-                            nip = raw_nip
-                            
-                        nama = raw_nama
-
-                        # Cek duplikat NIP
-                        if User.query.filter_by(username=nip).first():
-                            skip += 1
-                            continue
-
-                        # Tambah Guru (Password Default = NIP)
-                        db.session.add(User(
-                            username=nip,
-                            password=generate_password_hash(nip),
-                            role='guru',
-                            nama=nama
-                        ))
-                        berhasil += 1
-
-                    db.session.commit()
-                    flash(f'Import Guru Selesai! Berhasil: {berhasil}, Skip (Duplikat/Invalid): {skip}', 'info')
-
-                except Exception as e:
-                    flash(f'Gagal memproses file: {str(e)}', 'danger')
+            if file and file.filename:
+                return kirim_impor_excel(file, 'guru', '.kelola_guru')
 
         # --- FITUR LAMA: TAMBAH MANUAL ---
         elif 'tambah' in request.form:
@@ -313,17 +326,21 @@ def kelola_guru():
             if request.form['password_edit']:
                 user.password = generate_password_hash(request.form['password_edit'])
             db.session.commit()
+            user_cache.invalidate(user.id)
             flash('Data guru berhasil diupdate!', 'success')
 
         # --- FITUR LAMA: HAPUS ---
         elif 'hapus' in request.form:
             user = User.query.get_or_404(request.form['user_id_hapus'])
+            user_id = user.id
+            naikkan_versi_nilai_siswa(user_id)
             db.session.delete(user)
             db.session.commit()
+            user_cache.invalidate(user_id)
             flash('Guru berhasil dihapus!', 'success')
 
     guru = User.query.filter_by(role='guru').all()
-    return render_template('admin/kelola_guru.html', guru=guru)
+    return render_template('admin/kelola_guru.html', guru=guru, laporan_impor=ambil_laporan_impor())
 
 
 # ==================== KELOLA MATA PELAJARAN ====================
@@ -350,8 +367,12 @@ def kelola_mapel():
             flash('Mapel berhasil diupdate!', 'success')
         elif 'hapus' in request.form:
             mapel = Mapel.query.get_or_404(request.form['mapel_id_hapus'])
+            # Ujian mapel ini ikut terhapus (ON DELETE CASCADE) -> buang juga dari cache soal
+            ujian_ids = [i for (i,) in db.session.query(Ujian.id).filter(Ujian.mapel_id == mapel.id).all()]
             db.session.delete(mapel)
             db.session.commit()
+            exam_cache.hapus(ujian_ids)
+            dashboard_cache.clear()
             flash('Mapel berhasil dihapus!', 'success')
     mapel = Mapel.query.all()
     return render_template('admin/kelola_mapel.html', mapel=mapel, guru_list=guru_list)
@@ -367,6 +388,8 @@ def ujian():
         ujian_obj = Ujian.query.get_or_404(ujian_id)
         db.session.delete(ujian_obj)
         db.session.commit()
+        exam_cache.hapus([int(ujian_id)])
+        dashboard_cache.clear()
         flash('Ujian berhasil dihapus permanen!', 'success')
         return redirect(url_for('admin.ujian'))
     data_ujian = Ujian.query.order_by(Ujian.waktu_mulai.desc()).all()
@@ -380,13 +403,16 @@ def ganti_password():
     if current_user.role != 'admin':
         return redirect('/')
 
+    # current_user berasal dari cache (tanpa hash password) -> muat User asli
+    user = db.session.get(User, current_user.id)
+
     if request.method == 'POST':
         old_pass = request.form['old_pass']
         new_pass = request.form['new_pass']
         confirm_pass = request.form['confirm_pass']
 
         # 1. Cek Password Lama
-        if not check_password_hash(current_user.password, old_pass):
+        if not check_password_hash(user.password, old_pass):
             flash('Password lama salah!', 'danger')
         
         # 2. Cek Konfirmasi Password Baru
@@ -399,8 +425,9 @@ def ganti_password():
 
         else:
             # 4. Update Password (Hash ulang)
-            current_user.password = generate_password_hash(new_pass)
+            user.password = generate_password_hash(new_pass)
             db.session.commit()
+            user_cache.invalidate(user.id)
             flash('Password Admin berhasil diubah!', 'success')
             return redirect('/admin/dashboard')
 
@@ -1,23 +1,38 @@
 import os
-import json
 import re
 import io
-import pandas as pd
-import pdfplumber
 import uuid 
 from datetime import datetime
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask import Blueprint, render_template, request, flash, redirect, url_for, send_file, current_app
 from flask_login import login_required, current_user
-from models import db, Mapel, Ujian, JawabanSiswa, User
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from openpyxl.utils import get_column_letter
-from openpyxl.drawing.image import Image as ExcelImage
-from xhtml2pdf import pisa
+from models import db, Mapel, Ujian, JawabanSiswa, JawabanEssay, User, Kelas
+from sqlalchemy import func
+from sqlalchemy.orm import contains_eager, joinedload
+from services.exam_cache import exam_cache
+from services.bank_soal import ambil_soal, ambil_kunci, simpan_soal, total_bobot_essay, perlu_hitung_ulang
+from services.lembar_jawaban import decode_pg, ambil_essay, essay_urut, ambil_essay_massal
+from services.penilaian import nilai_pg_satu, hitung_ulang_ujian
+from services.tabel_nilai import naikkan_versi_nilai, buat_token, baca_token
+from services.sesi_user import user_cache
+from services.koneksi_baca import baca_saja
+from services.ujian_kelas import simpan_kelas_ujian, kelas_ujian, kelas_dari_form, dashboard_cache
+from services.impor_pdf import impor_pdf
+from services.antrian_pekerjaan import antrian_pekerjaan, PARAM_FILE_MASUK
+from services.export_pdf import export_pdf
 
 bp = Blueprint('guru', __name__)
 
+# Catatan: pandas, openpyxl & xhtml2pdf sengaja di-import di dalam fungsi yang
+# memakainya (export Excel/PDF) agar proses yang hanya melayani siswa tidak ikut
+# memuat library berat tersebut saat startup. pdfplumber hanya dimuat di proses
+# worker impor PDF (services/impor_pdf.py).
+# Impor PDF, hitung ulang nilai, export Excel & PDF hasil dikerjakan sebagai job
+# di antrian pekerjaan (services/antrian_pekerjaan.py); route hanya mengirim job
+# lalu mengarahkan ke halaman progres /pekerjaan/<id>.
+
+
 # ==================== HELPER: PARSE PDF LINES ====================
 def parse_pdf_lines(lines):
     pg_list = []
@@ -137,9 +152,102 @@ def parse_pdf_lines(lines):
     return pg_list, essay_list
 
 
+# ==================== HELPER: DATA TABEL NILAI ====================
+def ambil_data_nilai(ujian_id, sejak_versi=None):
+    # Satu SELECT: jawaban + siswa + kelas (JOIN), diurutkan per kelas lalu nama.
+    # Tidak ada parsing jawaban / penilaian ulang di sini.
+    query = JawabanSiswa.query.filter(JawabanSiswa.ujian_id == ujian_id)
+    if sejak_versi is not None:
+        # Hanya baris yang berubah setelah versi yang dimiliki browser
+        query = query.filter(JawabanSiswa.versi_nilai > sejak_versi)
+
+    return (query
+            .outerjoin(User, JawabanSiswa.siswa_id == User.id)
+            .outerjoin(Kelas, User.kelas_id == Kelas.id)
+            .options(contains_eager(JawabanSiswa.siswa).contains_eager(User.kelas))
+            .order_by(func.coalesce(Kelas.nama_kelas, ''), func.coalesce(User.nama, ''))
+            .all())
+
+
+# ==================== HELPER: SIMPAN UJIAN & HITUNG ULANG ====================
+def buat_ujian(mapel_id, judul, mulai, selesai, durasi, kelas_ids, pg_list, essay_list):
+    ujian = Ujian(
+        mapel_id=mapel_id,
+        judul=judul,
+        waktu_mulai=mulai,
+        waktu_selesai=selesai,
+        durasi_menit=durasi
+    )
+    db.session.add(ujian)
+    db.session.flush()
+    ujian_id = ujian.id
+    simpan_soal(ujian_id, pg_list, essay_list)
+    simpan_kelas_ujian(ujian, kelas_ids)
+    db.session.commit()
+    dashboard_cache.clear()
+    return ujian_id
+
+
+def naikkan_versi_soal(ujian):
+    # Naikkan versi soal agar cache soal siswa tidak menyajikan soal lama
+    ujian.versi_soal = (ujian.versi_soal or 0) + 1
+    exam_cache.invalidate(ujian.id)
+
+
+def hitung_ulang_nilai(ujian_id):
+    # ==================== HITUNG ULANG NILAI OTOMATIS ====================
+    # Kunci & bobot dibaca dari tabel Soal yang baru disimpan (jawaban ringkas
+    # sudah dipetakan ulang ke urutan soal baru oleh simpan_soal)
+    daftar_kunci = [kunci for _, kunci in ambil_kunci(ujian_id)]
+    return hitung_ulang_ujian(ujian_id, daftar_kunci, total_bobot_essay(ujian_id))
+
+
+# ==================== JOB LATAR: IMPOR PDF & HITUNG ULANG ====================
+@antrian_pekerjaan.tugas('impor_pdf_soal')
+def job_impor_pdf_soal(konteks, file_masuk, judul=None, mulai=None, selesai=None, durasi=None,
+                       kelas_ids=None, mapel_id=None, ujian_id=None):
+    # ujian_id ada -> ganti soal ujian lama (edit_ujian); tanpa ujian_id -> buat ujian baru
+    pg_list, essay_list = parse_pdf_lines(impor_pdf.baris(file_masuk, konteks.progres))
+    if not pg_list and not essay_list:
+        raise ValueError('Gagal membaca soal! Pastikan format PDF sesuai.')
+
+    if ujian_id is None:
+        buat_ujian(mapel_id, judul, datetime.fromisoformat(mulai), datetime.fromisoformat(selesai),
+                   durasi, kelas_ids, pg_list, essay_list)
+        return f'Berhasil! {len(pg_list)} Soal PG dan {len(essay_list)} Soal Essay tersimpan.'
+
+    ujian = db.session.get(Ujian, ujian_id)
+    if ujian is None:
+        raise ValueError('Ujian sudah dihapus.')
+    perubahan = simpan_soal(ujian_id, pg_list, essay_list)
+    if perubahan.ada:
+        naikkan_versi_soal(ujian)
+    count_updated = hitung_ulang_nilai(ujian_id) if perlu_hitung_ulang(perubahan) else 0
+    db.session.commit()
+    dashboard_cache.clear()
+
+    pesan = f'Soal diperbarui dari PDF ({len(pg_list)} PG, {len(essay_list)} Essay).'
+    if count_updated > 0:
+        pesan += f' Nilai {count_updated} siswa berubah setelah dihitung ulang otomatis.'
+    return pesan
+
+
+@antrian_pekerjaan.tugas('hitung_ulang')
+def job_hitung_ulang(konteks, ujian_id):
+    if db.session.get(Ujian, ujian_id) is None:
+        raise ValueError('Ujian sudah dihapus.')
+    count_updated = hitung_ulang_nilai(ujian_id)
+    db.session.commit()
+    konteks.progres(count_updated, count_updated, paksa=True)
+    if count_updated == 0:
+        return 'Nilai siswa sudah sesuai dengan kunci baru, tidak ada yang berubah.'
+    return f'Sukses! Nilai {count_updated} siswa berubah setelah dihitung ulang otomatis.'
+
+
 # ==================== DASHBOARD GURU ====================
 @bp.route('/dashboard')
 @login_required
+@baca_saja
 def dashboard():
     if current_user.role not in ['guru', 'admin']:
         return redirect('/')
@@ -186,53 +294,34 @@ def upload_soal(mapel_id):
             flash('Format waktu salah!', 'danger')
             return redirect(request.url)
 
-        pg_list = []
-        essay_list = []
+        kelas_ids = kelas_dari_form(request.form)
+        if not kelas_ids:
+            flash('Pilih minimal satu kelas peserta ujian!', 'danger')
+            return redirect(request.url)
 
         if file and file.filename != '':
             if not file.filename.lower().endswith('.pdf'):
                 flash('File harus berformat PDF (.pdf)', 'danger')
                 return redirect(request.url)
 
+            # PDF dibaca di latar belakang; ujian baru dibuat setelah soal terbaca
             try:
-                full_text = ""
-                with pdfplumber.open(file) as pdf:
-                    for page in pdf.pages:
-                        extracted = page.extract_text()
-                        if extracted:
-                            full_text += extracted + "\n"
-
-                lines = [line.strip() for line in full_text.split('\n') if line.strip()]
-                pg_list, essay_list = parse_pdf_lines(lines)
-
-                if not pg_list and not essay_list:
-                    flash('Gagal membaca soal! Pastikan format PDF sesuai.', 'warning')
-                    return redirect(request.url)
-
+                job_id = antrian_pekerjaan.kirim('impor_pdf_soal', {
+                    PARAM_FILE_MASUK: antrian_pekerjaan.simpan_upload(file, '.pdf'),
+                    'mapel_id': mapel_id, 'judul': judul, 'durasi': durasi_input, 'kelas_ids': kelas_ids,
+                    'mulai': mulai.isoformat(), 'selesai': selesai.isoformat(),
+                }, current_user.id, tautan=url_for('guru.dashboard'))
             except Exception as e:
                 flash(f'Terjadi kesalahan sistem saat membaca PDF: {str(e)}', 'danger')
                 return redirect(request.url)
+            return redirect(url_for('halaman_pekerjaan', job_id=job_id))
 
-        ujian = Ujian(
-            mapel_id=mapel_id,
-            judul=judul,
-            waktu_mulai=mulai,
-            waktu_selesai=selesai,
-            durasi_menit=durasi_input,
-            soal_pg=json.dumps(pg_list, ensure_ascii=False),
-            soal_essay=json.dumps(essay_list, ensure_ascii=False)
-        )
-        db.session.add(ujian)
-        db.session.commit()
+        ujian_id = buat_ujian(mapel_id, judul, mulai, selesai, durasi_input, kelas_ids, [], [])
+        flash('Kerangka ujian berhasil dibuat! Silakan tambahkan soal secara manual.', 'success')
+        return redirect(url_for('guru.edit_ujian', ujian_id=ujian_id))
 
-        if file and file.filename != '':
-            flash(f'Berhasil! {len(pg_list)} Soal PG dan {len(essay_list)} Soal Essay tersimpan.', 'success')
-            return redirect('/guru/dashboard')
-        else:
-            flash('Kerangka ujian berhasil dibuat! Silakan tambahkan soal secara manual.', 'success')
-            return redirect(url_for('guru.edit_ujian', ujian_id=ujian.id))
-
-    return render_template('guru/upload_soal.html', mapel=mapel)
+    return render_template('guru/upload_soal.html', mapel=mapel,
+                           kelas_list=Kelas.query.order_by(Kelas.nama_kelas).all())
 
 
 # ==================== EDIT UJIAN (FIX: ID UNIK + RECALCULATE) ====================
@@ -248,13 +337,7 @@ def edit_ujian(ujian_id):
         flash('Akses ditolak!', 'danger')
         return redirect('/guru/dashboard')
 
-    try:
-        pg_existing = json.loads(ujian.soal_pg) if ujian.soal_pg else []
-        essay_existing = json.loads(ujian.soal_essay) if ujian.soal_essay else []
-
-    except:
-        pg_existing = []
-        essay_existing = []
+    pg_existing, essay_existing = ambil_soal(ujian_id)
 
     if request.method == 'POST':
         ujian.judul = request.form['judul'].strip()
@@ -266,11 +349,14 @@ def edit_ujian(ujian_id):
             flash('Format waktu salah!', 'danger')
             return redirect(request.url)
 
+        kelas_ids = kelas_dari_form(request.form)
+        if not kelas_ids:
+            flash('Pilih minimal satu kelas peserta ujian!', 'danger')
+            return redirect(request.url)
+        # Target kelas + salinan jadwal di UjianKelas ikut diperbarui
+        simpan_kelas_ujian(ujian, kelas_ids)
+
         file = request.files.get('file_pdf')
-        
-        # Variabel untuk menampung soal baru (agar bisa dipakai hitung ulang nilai)
-        final_pg_list = []
-        final_essay_list = []
 
         # --- A. EDIT DENGAN UPLOAD PDF BARU ---
         if file and file.filename != '':
@@ -278,32 +364,19 @@ def edit_ujian(ujian_id):
                 flash('File harus format PDF!', 'danger')
                 return redirect(request.url)
 
-            try:
-                full_text = ""
-                with pdfplumber.open(file) as pdf:
-                    for page in pdf.pages:
-                        extracted = page.extract_text()
-                        if extracted:
-                            full_text += extracted + "\n"
-
-                lines = [line.strip() for line in full_text.split('\n') if line.strip()]
-                new_pg, new_essay = parse_pdf_lines(lines)
-
-                if not new_pg and not new_essay:
-                    flash('Gagal membaca PDF! Format tidak sesuai.', 'warning')
-                    return redirect(request.url)
-
-                ujian.soal_pg = json.dumps(new_pg, ensure_ascii=False)
-                ujian.soal_essay = json.dumps(new_essay, ensure_ascii=False)
-                
-                final_pg_list = new_pg
-                final_essay_list = new_essay
-                
-                flash('Soal diperbarui dari PDF & Nilai siswa sedang dihitung ulang...', 'success')
+            # Judul/jadwal/kelas disimpan sekarang; soal dari PDF + hitung ulang nilai menyusul di latar belakang
+            db.session.commit()
+            dashboard_cache.clear()
 
+            try:
+                job_id = antrian_pekerjaan.kirim('impor_pdf_soal', {
+                    PARAM_FILE_MASUK: antrian_pekerjaan.simpan_upload(file, '.pdf'),
+                    'ujian_id': ujian_id,
+                }, current_user.id, tautan=url_for('guru.dashboard'))
             except Exception as e:
                 flash(f'Error membaca PDF: {str(e)}', 'danger')
                 return redirect(request.url)
+            return redirect(url_for('halaman_pekerjaan', job_id=job_id))
 
         # --- B. EDIT MANUAL (DENGAN ID PERMANEN) ---
         else:
@@ -389,59 +462,31 @@ def edit_ujian(ujian_id):
                     'gambar': gambar_final
                 })
 
-            ujian.soal_pg = json.dumps(manual_pg_list, ensure_ascii=False)
-            ujian.soal_essay = json.dumps(manual_essay_list, ensure_ascii=False)
-            
-            final_pg_list = manual_pg_list
-            final_essay_list = manual_essay_list
-            
-            flash('Perubahan tersimpan!', 'success')
-
-        # ==================== HITUNG ULANG NILAI OTOMATIS ====================
-        # Hitung Max Score PG Baru
-        total_bobot_essay = sum(int(e.get('bobot', 0)) for e in final_essay_list)
-        max_pg = 100 - total_bobot_essay
-        if max_pg < 0: max_pg = 0
-        
-        all_jawaban = JawabanSiswa.query.filter_by(ujian_id=ujian_id).all()
-        count_updated = 0
-        
-        for jwb in all_jawaban:
-            user_pg_answers = json.loads(jwb.jawaban_pg) if jwb.jawaban_pg else {}
-            jml_benar = 0
-            
-            for idx, soal in enumerate(final_pg_list):
-                # 1. Coba ambil jawaban pakai ID (Prioritas Utama)
-                soal_id = soal.get('id')
-                jawaban_user = user_pg_answers.get(soal_id)
-                
-                # 2. Fallback: Jika ID tidak ketemu (Data lama), coba pakai Index Loop
-                if jawaban_user is None:
-                    # Cek apakah user menyimpan dengan key angka string "0", "1"
-                    jawaban_user = user_pg_answers.get(str(idx))
+            perubahan = simpan_soal(ujian_id, manual_pg_list, manual_essay_list)
 
-                if jawaban_user == soal.get('kunci'):
-                    jml_benar += 1
-            
-            if final_pg_list:
-                nilai_pg_baru = (jml_benar / len(final_pg_list)) * max_pg
-            else:
-                nilai_pg_baru = 0
-            
-            jwb.nilai_pg = round(nilai_pg_baru, 2)
-            jwb.total_nilai = jwb.nilai_pg + jwb.nilai_essay
-            count_updated += 1
-            
-        if count_updated > 0:
-            flash(f'Sukses! Nilai {count_updated} siswa telah dihitung ulang otomatis.', 'info')
+            flash('Perubahan tersimpan!', 'success')
 
+        # Versi soal (cache soal siswa) hanya naik jika ada baris soal yang berubah
+        if perubahan.ada:
+            naikkan_versi_soal(ujian)
         db.session.commit()
-        return redirect('/guru/dashboard')
+        dashboard_cache.clear()
+
+        # Typo/gambar/urutan saja -> tanpa hitung ulang. Kunci, set soal PG, atau bobot
+        # essay berubah -> nilai dihitung ulang di latar belakang (hanya baris yang berubah ditulis)
+        if (not perlu_hitung_ulang(perubahan)
+                or db.session.query(JawabanSiswa.id).filter_by(ujian_id=ujian_id).first() is None):
+            return redirect('/guru/dashboard')
+        job_id = antrian_pekerjaan.kirim('hitung_ulang', {'ujian_id': ujian_id}, current_user.id,
+                                         tautan=url_for('guru.dashboard'))
+        return redirect(url_for('halaman_pekerjaan', job_id=job_id))
 
     return render_template('guru/edit_ujian.html',
                            ujian=ujian,
                            pg_list=pg_existing,
-                           essay_list=essay_existing)
+                           essay_list=essay_existing,
+                           kelas_list=Kelas.query.order_by(Kelas.nama_kelas).all(),
+                           kelas_terpilih=kelas_ujian(ujian_id))
 
 
 # ==================== HAPUS UJIAN ====================
@@ -461,6 +506,8 @@ def hapus_ujian(ujian_id):
         JawabanSiswa.query.filter_by(ujian_id=ujian_id).delete()
         db.session.delete(ujian)
         db.session.commit()
+        exam_cache.hapus([ujian_id])
+        dashboard_cache.clear()
         flash('Ujian berhasil dihapus beserta data jawabannya!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -472,6 +519,7 @@ def hapus_ujian(ujian_id):
 # ==================== PREVIEW UJIAN ====================
 @bp.route('/preview/<int:ujian_id>')
 @login_required
+@baca_saja
 def preview(ujian_id):
     if current_user.role not in ['guru', 'admin']:
         return redirect('/')
@@ -482,8 +530,7 @@ def preview(ujian_id):
         flash('Akses ditolak!', 'danger')
         return redirect('/guru/dashboard')
 
-    pg = json.loads(ujian.soal_pg) if ujian.soal_pg else []
-    essay = json.loads(ujian.soal_essay) if ujian.soal_essay else []
+    pg, essay = ambil_soal(ujian_id)
     return render_template('guru/preview_ujian.html', ujian=ujian, pg=pg, essay=essay)
 
 
@@ -501,23 +548,15 @@ def koreksi(jawaban_id):
         flash('Akses ditolak!', 'danger')
         return redirect('/guru/dashboard')
 
-    soal_pg = json.loads(ujian.soal_pg) if ujian.soal_pg else []
-    soal_essay = json.loads(ujian.soal_essay) if ujian.soal_essay else []
-    
-    jawab_pg = json.loads(jawaban_siswa.jawaban_pg) if jawaban_siswa.jawaban_pg else {}
-    jawab_essay = json.loads(jawaban_siswa.jawaban_essay) if jawaban_siswa.jawaban_essay else {}
-
-    # HITUNG JUMLAH BENAR PG (ROBUST)
-    jml_benar = 0
-    for idx, s in enumerate(soal_pg):
-        # Cek by ID -> Fallback by Index
-        ans = jawab_pg.get(s.get('id'))
-        if ans is None: ans = jawab_pg.get(str(idx))
-            
-        if ans == s.get('kunci'):
-            jml_benar += 1
+    soal_pg, soal_essay = ambil_soal(ujian.id)
+
+    # HITUNG JUMLAH BENAR & NILAI PG (max nilai PG = 100 - total bobot essay)
+    bobot_essay = sum(int(s.get('bobot', 0)) for s in soal_essay)
+    jml_benar, nilai_pg_baru = nilai_pg_satu(jawaban_siswa.jawaban_pg_kode,
+                                             [s.get('kunci') for s in soal_pg], bobot_essay)
 
     if request.method == 'POST':
+        essay_per_uid = ambil_essay(jawaban_siswa.id)
         total_skor_essay = 0
         for i, soal in enumerate(soal_essay):
             try:
@@ -527,49 +566,153 @@ def koreksi(jawaban_id):
                 skor = 0
             total_skor_essay += skor
 
-        # Update PG Score juga (agar sinkron jika kunci berubah)
-        total_bobot_essay_soal = sum(int(s.get('bobot', 0)) for s in soal_essay)
-        max_pg_score = 100 - total_bobot_essay_soal
-        if max_pg_score < 0: max_pg_score = 0
-        
-        nilai_pg_baru = 0
-        if soal_pg:
-            nilai_pg_baru = (jml_benar / len(soal_pg)) * max_pg_score
+            # Simpan nilai per soal essay
+            row = essay_per_uid.get(str(soal.get('id')))
+            if row is None:
+                row = JawabanEssay(jawaban_id=jawaban_siswa.id, soal_uid=str(soal.get('id')), jawaban='')
+                db.session.add(row)
+            row.nilai = skor
 
-        jawaban_siswa.nilai_pg = round(nilai_pg_baru, 2)
+        # Update PG Score juga (agar sinkron jika kunci berubah)
+        jawaban_siswa.jml_benar_pg = jml_benar
+        jawaban_siswa.total_soal_pg = len(soal_pg)
+        jawaban_siswa.nilai_pg = nilai_pg_baru
         jawaban_siswa.nilai_essay = total_skor_essay
         jawaban_siswa.total_nilai = jawaban_siswa.nilai_pg + total_skor_essay
+        jawaban_siswa.versi_nilai = naikkan_versi_nilai(ujian.id)
         db.session.commit()
         
         flash(f'Nilai berhasil disimpan! (PG: {jawaban_siswa.nilai_pg}, Essay: {total_skor_essay})', 'success')
         return redirect(url_for('guru.lihat_nilai', ujian_id=ujian.id))
 
-    # MAPPING JAWABAN KE LIST (AGAR TEMPLATE MUDAH)
-    mapped_jawab_pg = {}
-    for i, s in enumerate(soal_pg):
-        ans = jawab_pg.get(s.get('id'))
-        if ans is None: ans = jawab_pg.get(str(i))
-        mapped_jawab_pg[str(i)] = ans
-        
-    mapped_jawab_essay = {}
-    for i, s in enumerate(soal_essay):
-        ans = jawab_essay.get(s.get('id'))
-        if ans is None: ans = jawab_essay.get(str(i))
-        mapped_jawab_essay[str(i)] = ans
+    # JAWABAN SEBAGAI LIST SESUAI URUTAN SOAL (TEMPLATE CUKUP PAKAI INDEX)
+    jawab_pg = decode_pg(jawaban_siswa.jawaban_pg_kode, len(soal_pg))
+    essay_list = essay_urut(jawaban_siswa.id, soal_essay)
 
     return render_template('guru/koreksi.html',
                            jawaban=jawaban_siswa,
                            soal_pg=soal_pg,
                            soal_essay=soal_essay,
-                           jawab_pg=mapped_jawab_pg,
-                           jawab_essay=mapped_jawab_essay,
+                           jawab_pg=jawab_pg,
+                           jawab_essay=[teks for teks, _ in essay_list],
+                           nilai_essay=[nilai for _, nilai in essay_list],
                            jml_benar_pg=jml_benar, 
                            total_soal_pg=len(soal_pg)) 
 
 
+# ==================== EXPORT EXCEL NILAI ====================
+def buat_excel_nilai(ujian, data_nilai):
+    list_data = []
+    for j in data_nilai:
+        list_data.append({
+            'No': 0,
+            'NIS': j.siswa.username if j.siswa else '-',
+            'Nama Siswa': j.siswa.nama if j.siswa else '-',
+            'Kelas': j.siswa.kelas.nama_kelas if j.siswa and j.siswa.kelas else '-',
+            'Jml Benar PG': j.jml_benar_pg or 0,
+            'Nilai PG': j.nilai_pg,
+            'Nilai Essay': j.nilai_essay,
+            'Total Nilai': j.total_nilai,
+            'Waktu Submit': j.waktu_submit.strftime('%Y-%m-%d %H:%M') if j.waktu_submit else '-'
+        })
+
+    for idx, item in enumerate(list_data, 1):
+        item['No'] = idx
+
+    import pandas as pd
+    from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+    from openpyxl.utils import get_column_letter
+    from openpyxl.drawing.image import Image as ExcelImage
+
+    df = pd.DataFrame(list_data)
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name='Nilai Ujian', startrow=5)
+        workbook = writer.book
+        worksheet = writer.sheets['Nilai Ujian']
+
+        font_std = Font(name='Times New Roman', size=12)
+        font_bold = Font(name='Times New Roman', size=12, bold=True)
+        font_title = Font(name='Times New Roman', size=14, bold=True)
+        border_thin = Border(left=Side(style='thin'), right=Side(style='thin'),
+                             top=Side(style='thin'), bottom=Side(style='thin'))
+        border_bottom_thick = Border(bottom=Side(style='medium'))
+
+        worksheet.merge_cells('A1:B3')
+        logo_path = os.path.join(current_app.root_path, 'static', 'img', 'logo_sekolah.png')
+        if os.path.exists(logo_path):
+            img = ExcelImage(logo_path)
+            img.height = 70
+            img.width = 70
+            worksheet.add_image(img, 'A1')
+            worksheet['A1'].alignment = Alignment(horizontal='center', vertical='center')
+
+        worksheet.merge_cells('C1:I1')  
+        cell_sekolah = worksheet['C1']
+        cell_sekolah.value = "SMA ISLAM PLUS BAITUSSALAM"
+        cell_sekolah.font = font_title
+        cell_sekolah.alignment = Alignment(horizontal="center", vertical="bottom")
+
+        worksheet.merge_cells('C2:I2')  
+        cell_judul = worksheet['C2']
+        cell_judul.value = f"LAPORAN HASIL UJIAN: {ujian.judul.upper()}"
+        cell_judul.font = font_bold
+        cell_judul.alignment = Alignment(horizontal="center", vertical="center")
+
+        worksheet.merge_cells('C3:I3')  
+        cell_info = worksheet['C3']
+        cell_info.value = f"Mapel: {ujian.mapel.nama} | Tanggal Cetak: {datetime.now().strftime('%d %B %Y')}"
+        cell_info.font = Font(name='Times New Roman', size=11, italic=True)
+        cell_info.alignment = Alignment(horizontal="center", vertical="top")
+
+        for col in range(1, 10):
+            cell = worksheet.cell(row=3, column=col)
+            cell.border = border_bottom_thick
+
+        header_row = 6
+        for i, col in enumerate(df.columns):
+            col_idx = i + 1
+            col_letter = get_column_letter(col_idx)
+            max_len = len(str(col))
+            for cell in worksheet[col_letter]:
+                if cell.row > header_row:
+                    if cell.value:
+                        max_len = max(max_len, len(str(cell.value)))
+                    cell.font = font_std
+                    cell.border = border_thin
+                    if col in ['No', 'Kelas', 'Jml Benar PG', 'Nilai PG', 'Nilai Essay', 'Total Nilai']:
+                        cell.alignment = Alignment(horizontal="center")
+
+            worksheet.column_dimensions[col_letter].width = max_len + 4
+            cell_header = worksheet.cell(row=header_row, column=col_idx)
+            cell_header.value = col
+            cell_header.font = font_bold
+            cell_header.alignment = Alignment(horizontal="center", vertical="center")
+            cell_header.border = border_thin
+            cell_header.fill = PatternFill(start_color="E0E0E0", end_color="E0E0E0", fill_type="solid")
+
+    safe_judul = secure_filename(ujian.judul)
+    if not safe_judul: safe_judul = f"Ujian_{ujian.id}"
+    filename = f"Rekap_{safe_judul}.xlsx"
+
+    return output.getvalue(), filename
+
+
+@antrian_pekerjaan.tugas('export_excel_nilai')
+def job_export_excel_nilai(konteks, ujian_id):
+    ujian = db.session.get(Ujian, ujian_id)
+    if ujian is None:
+        raise ValueError('Ujian sudah dihapus.')
+    data_nilai = ambil_data_nilai(ujian_id)
+    konteks.progres(0, len(data_nilai), paksa=True)
+    konteks.simpan_file(*buat_excel_nilai(ujian, data_nilai))
+    return f'File Excel berisi {len(data_nilai)} siswa siap diunduh.'
+
+
 # ==================== LIHAT NILAI (ROBUST CALCULATION) ====================
 @bp.route('/lihat_nilai/<int:ujian_id>', methods=['GET', 'POST'])
 @login_required
+@baca_saja  # POST export Excel menulis baris job -> tetap ke engine utama
 def lihat_nilai(ujian_id):
     if current_user.role not in ['guru', 'admin']:
         return redirect('/')
@@ -580,165 +723,69 @@ def lihat_nilai(ujian_id):
         flash('Anda tidak memiliki akses ke data ini!', 'danger')
         return redirect('/guru/dashboard')
 
-    data_nilai = JawabanSiswa.query.filter_by(ujian_id=ujian_id).all()
-
-    soal_pg_raw = json.loads(ujian.soal_pg) if ujian.soal_pg else []
-    total_pg = len(soal_pg_raw)
-
-    for n in data_nilai:
-        jw_pg = json.loads(n.jawaban_pg) if n.jawaban_pg else {}
-        benar = 0
-        for idx, s in enumerate(soal_pg_raw):
-            # Cek by ID -> Fallback by Index
-            ans = jw_pg.get(s.get('id'))
-            if ans is None: ans = jw_pg.get(str(idx))
-            
-            if ans == s.get('kunci'):
-                benar += 1
-
-        n.jml_benar_pg = benar
-        n.total_soal_pg = total_pg
-
-    data_nilai.sort(
-        key=lambda x: (x.siswa.kelas.nama_kelas if x.siswa and x.siswa.kelas else "", x.siswa.nama if x.siswa else ""))
+    # jml_benar_pg & total_soal_pg sudah tersimpan saat submit/hitung ulang
+    data_nilai = ambil_data_nilai(ujian_id)
 
     if request.method == 'POST' and 'download_excel' in request.form:
         if not data_nilai:
             flash('Belum ada siswa yang mengerjakan.', 'warning')
             return redirect(request.url)
 
-        try:
-            list_data = []
-            for j in data_nilai:
-                list_data.append({
-                    'No': 0,
-                    'NIS': j.siswa.username if j.siswa else '-',
-                    'Nama Siswa': j.siswa.nama if j.siswa else '-',
-                    'Kelas': j.siswa.kelas.nama_kelas if j.siswa and j.siswa.kelas else '-',
-                    'Jml Benar PG': getattr(j, 'jml_benar_pg', 0),  
-                    'Nilai PG': j.nilai_pg,
-                    'Nilai Essay': j.nilai_essay,
-                    'Total Nilai': j.total_nilai,
-                    'Waktu Submit': j.waktu_submit.strftime('%Y-%m-%d %H:%M') if j.waktu_submit else '-'
-                })
+        # File Excel dibuat di antrian pekerjaan; halaman progres mengunduhnya otomatis
+        job_id = antrian_pekerjaan.kirim('export_excel_nilai', {'ujian_id': ujian_id}, current_user.id,
+                                         tautan=url_for('guru.lihat_nilai', ujian_id=ujian_id))
+        return redirect(url_for('halaman_pekerjaan', job_id=job_id))
 
-            for idx, item in enumerate(list_data, 1):
-                item['No'] = idx
-
-            df = pd.DataFrame(list_data)
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df.to_excel(writer, index=False, sheet_name='Nilai Ujian', startrow=5)
-                workbook = writer.book
-                worksheet = writer.sheets['Nilai Ujian']
-
-                font_std = Font(name='Times New Roman', size=12)
-                font_bold = Font(name='Times New Roman', size=12, bold=True)
-                font_title = Font(name='Times New Roman', size=14, bold=True)
-                border_thin = Border(left=Side(style='thin'), right=Side(style='thin'),
-                                     top=Side(style='thin'), bottom=Side(style='thin'))
-                border_bottom_thick = Border(bottom=Side(style='medium'))
-
-                worksheet.merge_cells('A1:B3')
-                logo_path = os.path.join(current_app.root_path, 'static', 'img', 'logo_sekolah.png')
-                if os.path.exists(logo_path):
-                    img = ExcelImage(logo_path)
-                    img.height = 70
-                    img.width = 70
-                    worksheet.add_image(img, 'A1')
-                    worksheet['A1'].alignment = Alignment(horizontal='center', vertical='center')
-
-                worksheet.merge_cells('C1:I1')  
-                cell_sekolah = worksheet['C1']
-                cell_sekolah.value = "SMA ISLAM PLUS BAITUSSALAM"
-                cell_sekolah.font = font_title
-                cell_sekolah.alignment = Alignment(horizontal="center", vertical="bottom")
-
-                worksheet.merge_cells('C2:I2')  
-                cell_judul = worksheet['C2']
-                cell_judul.value = f"LAPORAN HASIL UJIAN: {ujian.judul.upper()}"
-                cell_judul.font = font_bold
-                cell_judul.alignment = Alignment(horizontal="center", vertical="center")
-
-                worksheet.merge_cells('C3:I3')  
-                cell_info = worksheet['C3']
-                cell_info.value = f"Mapel: {ujian.mapel.nama} | Tanggal Cetak: {datetime.now().strftime('%d %B %Y')}"
-                cell_info.font = Font(name='Times New Roman', size=11, italic=True)
-                cell_info.alignment = Alignment(horizontal="center", vertical="top")
-
-                for col in range(1, 10):
-                    cell = worksheet.cell(row=3, column=col)
-                    cell.border = border_bottom_thick
-
-                header_row = 6
-                for i, col in enumerate(df.columns):
-                    col_idx = i + 1
-                    col_letter = get_column_letter(col_idx)
-                    max_len = len(str(col))
-                    for cell in worksheet[col_letter]:
-                        if cell.row > header_row:
-                            if cell.value:
-                                max_len = max(max_len, len(str(cell.value)))
-                            cell.font = font_std
-                            cell.border = border_thin
-                            if col in ['No', 'Kelas', 'Jml Benar PG', 'Nilai PG', 'Nilai Essay', 'Total Nilai']:
-                                cell.alignment = Alignment(horizontal="center")
-
-                    worksheet.column_dimensions[col_letter].width = max_len + 4
-                    cell_header = worksheet.cell(row=header_row, column=col_idx)
-                    cell_header.value = col
-                    cell_header.font = font_bold
-                    cell_header.alignment = Alignment(horizontal="center", vertical="center")
-                    cell_header.border = border_thin
-                    cell_header.fill = PatternFill(start_color="E0E0E0", end_color="E0E0E0", fill_type="solid")
-
-            output.seek(0)
-            safe_judul = secure_filename(ujian.judul)
-            if not safe_judul: safe_judul = f"Ujian_{ujian.id}"
-            filename = f"Rekap_{safe_judul}.xlsx"
-
-            return send_file(output, as_attachment=True, download_name=filename,
-                             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-
-        except Exception as e:
-            flash(f"Gagal membuat Excel: {str(e)}", "danger")
-            return redirect(request.url)
-
-    return render_template('guru/lihat_nilai.html', ujian=ujian, data_nilai=data_nilai)
+    token, _, _ = buat_token(ujian_id, ujian.versi_nilai)
+    # Pilihan kelas untuk download ZIP PDF = kelas siswa yang sudah mengerjakan
+    kelas_peserta = sorted({n.siswa.kelas for n in data_nilai if n.siswa and n.siswa.kelas},
+                           key=lambda k: k.nama_kelas)
+    return render_template('guru/lihat_nilai.html', ujian=ujian, data_nilai=data_nilai, token_nilai=token,
+                           kelas_peserta=kelas_peserta)
 
 
 # ==================== HTMX REFRESH ====================
 @bp.route('/refresh_tabel_nilai/<int:ujian_id>')
 @login_required
+@baca_saja
 def refresh_tabel_nilai(ujian_id):
     if current_user.role not in ['guru', 'admin']:
         return ('', 403)
 
-    ujian = Ujian.query.get_or_404(ujian_id)
-    if current_user.role != 'admin' and ujian.mapel.guru_id != current_user.id:
+    # Query ringan: hanya versi nilai + pemilik mapel (tanpa memuat objek Ujian)
+    info = (db.session.query(Ujian.versi_nilai, Mapel.guru_id)
+            .join(Mapel, Ujian.mapel_id == Mapel.id)
+            .filter(Ujian.id == ujian_id)
+            .first())
+    if info is None:
+        return ('', 404)
+    versi, guru_id = info
+    if current_user.role != 'admin' and guru_id != current_user.id:
         return ('', 403)
 
-    data_nilai = JawabanSiswa.query.filter_by(ujian_id=ujian_id).all()
+    # 1. Tidak ada perubahan sejak polling terakhir -> 204 (htmx tidak melakukan swap)
+    token_klien = baca_token(request.args.get('token'))
+    if token_klien and token_klien[0] == versi:
+        return ('', 204, {'X-Nilai-Token': request.args.get('token')})
 
-    soal_pg_raw = json.loads(ujian.soal_pg) if ujian.soal_pg else []
-    total_pg = len(soal_pg_raw)
+    token, jumlah, _ = buat_token(ujian_id, versi)
 
-    for n in data_nilai:
-        jw_pg = json.loads(n.jawaban_pg) if n.jawaban_pg else {}
-        benar = 0
-        for idx, s in enumerate(soal_pg_raw):
-            # Cek by ID -> Fallback by Index
-            ans = jw_pg.get(s.get('id'))
-            if ans is None: ans = jw_pg.get(str(idx))
-            
-            if ans == s.get('kunci'):
-                benar += 1
-        n.jml_benar_pg = benar
-        n.total_soal_pg = total_pg
+    # 2. Ada perubahan -> kirim hanya baris yang berubah/baru
+    if token_klien and token_klien[0] < versi and token_klien[1] > 0:
+        _, jumlah_klien, id_max_klien = token_klien
+        berubah = ambil_data_nilai(ujian_id, sejak_versi=token_klien[0])
+        baru = [n for n in berubah if n.id > id_max_klien]
 
-    data_nilai.sort(
-        key=lambda x: (x.siswa.kelas.nama_kelas if x.siswa and x.siswa.kelas else "", x.siswa.nama if x.siswa else ""))
-    return render_template('guru/partials/tabel_nilai_body.html', data_nilai=data_nilai)
+        # Jika jumlah baris cocok berarti tidak ada baris yang dihapus (reset peserta)
+        if jumlah == jumlah_klien + len(baru):
+            lama = [n for n in berubah if n.id <= id_max_klien]
+            html = render_template('guru/partials/tabel_nilai_delta.html', baris_baru=baru, baris_berubah=lama)
+            return (html, 200, {'X-Nilai-Token': token, 'HX-Reswap': 'none'})
+
+    # 3. Token tidak ada/tidak valid atau ada baris terhapus -> render ulang penuh
+    data_nilai = ambil_data_nilai(ujian_id)
+    html = render_template('guru/partials/tabel_nilai_body.html', data_nilai=data_nilai)
+    return (html, 200, {'X-Nilai-Token': token})
 
 
 # ==================== RESET PESERTA ====================
@@ -752,80 +799,152 @@ def reset_peserta(jawaban_id):
     if current_user.role != 'admin' and jawaban.ujian.mapel.guru_id != current_user.id:
         return ('', 403)
 
+    naikkan_versi_nilai(jawaban.ujian_id)
     db.session.delete(jawaban)
     db.session.commit()
     return ('', 204)
 
 # ==================== DOWNLOAD PDF HASIL (FINAL) ====================
-@bp.route('/download_hasil_pdf/<int:jawaban_id>')
+def html_pdf_hasil(jawaban, soal_pg, soal_essay, essay_per_uid=None):
+    jawab_pg = decode_pg(jawaban.jawaban_pg_kode, len(soal_pg))
+    jawab_essay = [teks for teks, _ in essay_urut(jawaban.id, soal_essay, essay_per_uid)]
+
+    bobot_essay = sum(int(s.get('bobot', 0)) for s in soal_essay)
+    jml_benar_pg, _ = nilai_pg_satu(jawaban.jawaban_pg_kode, [s.get('kunci') for s in soal_pg], bobot_essay)
+
+    image_folder = os.path.join(current_app.root_path, 'static', 'uploads', 'soal')
+    image_folder = image_folder.replace('\\', '/')
+
+    return render_template(
+        'guru/pdf_hasil_siswa.html',
+        siswa=jawaban.siswa, ujian=jawaban.ujian, jawaban=jawaban,
+        soal_pg=soal_pg, soal_essay=soal_essay,
+        jawab_pg=jawab_pg, jawab_essay=jawab_essay,
+        jml_benar_pg=jml_benar_pg, total_soal_pg=len(soal_pg),
+        image_folder=image_folder
+    )
+
+
+def buat_pdf_hasil(jawaban):
+    ujian = jawaban.ujian
+    siswa = jawaban.siswa
+    soal_pg, soal_essay = ambil_soal(ujian.id)
+    html_content = html_pdf_hasil(jawaban, soal_pg, soal_essay)
+
+    from xhtml2pdf import pisa
+
+    pdf_output = io.BytesIO()
+    pisa_status = pisa.CreatePDF(src=html_content, dest=pdf_output)
+
+    if pisa_status.err:
+        raise ValueError(f'Gagal membuat PDF: {pisa_status.err}')
+
+    filename = secure_filename(f"Hasil_{siswa.nama}_{ujian.judul}.pdf")
+    return pdf_output.getvalue(), filename
+
+
+@antrian_pekerjaan.tugas('pdf_hasil_siswa')
+def job_pdf_hasil_siswa(konteks, jawaban_id):
+    jawaban = db.session.get(JawabanSiswa, jawaban_id)
+    if jawaban is None:
+        raise ValueError('Data jawaban sudah dihapus (peserta di-reset).')
+    konteks.simpan_file(*buat_pdf_hasil(jawaban))
+    return 'PDF hasil siswa siap diunduh.'
+
+
+# ==================== DOWNLOAD PDF HASIL MASSAL (ZIP PER UJIAN / KELAS) ====================
+# Lembar jawaban dimuat per potongan (siswa + kelas + essay sekaligus), HTML
+# dirender di thread job lalu dikonversi ke PDF di process pool (services/export_pdf.py)
+POTONGAN_ZIP_PDF = 50
+
+
+@antrian_pekerjaan.tugas('zip_pdf_hasil')
+def job_zip_pdf_hasil(konteks, ujian_id, kelas_id=None):
+    ujian = db.session.get(Ujian, ujian_id)
+    if ujian is None:
+        raise ValueError('Ujian sudah dihapus.')
+    kelas = db.session.get(Kelas, kelas_id) if kelas_id else None
+
+    query = (db.session.query(JawabanSiswa.id)
+             .join(User, JawabanSiswa.siswa_id == User.id)
+             .outerjoin(Kelas, User.kelas_id == Kelas.id)
+             .filter(JawabanSiswa.ujian_id == ujian_id))
+    if kelas_id:
+        query = query.filter(User.kelas_id == kelas_id)
+    daftar_id = [i for (i,) in query.order_by(func.coalesce(Kelas.nama_kelas, ''), func.coalesce(User.nama, '')).all()]
+    if not daftar_id:
+        raise ValueError('Belum ada siswa yang mengerjakan.')
+
+    soal_pg, soal_essay = ambil_soal(ujian_id)
+
+    def dokumen():
+        for i in range(0, len(daftar_id), POTONGAN_ZIP_PDF):
+            potongan = daftar_id[i:i + POTONGAN_ZIP_PDF]
+            rows = (JawabanSiswa.query
+                    .filter(JawabanSiswa.id.in_(potongan))
+                    .options(joinedload(JawabanSiswa.siswa).joinedload(User.kelas))
+                    .all())
+            per_id = {r.id: r for r in rows}
+            essay = ambil_essay_massal(potongan)
+            for jawaban_id in potongan:
+                jawaban = per_id.get(jawaban_id)
+                if jawaban is None:  # peserta di-reset saat export berjalan
+                    continue
+                siswa = jawaban.siswa
+                folder = secure_filename(siswa.kelas.nama_kelas if siswa.kelas else '') or 'Tanpa_Kelas'
+                nama = secure_filename(f'{siswa.username}_{siswa.nama}') or str(jawaban_id)
+                yield f'{folder}/{nama}.pdf', html_pdf_hasil(jawaban, soal_pg, soal_essay, essay[jawaban_id])
+            # Objek potongan sebelumnya dilepas dari session agar memori tidak menumpuk
+            db.session.expunge_all()
+
+    nama_zip = secure_filename(f"Hasil_{ujian.judul}{'_' + kelas.nama_kelas if kelas else ''}.zip")
+    ringkasan = export_pdf.tulis_zip(konteks.path_file(nama_zip or f'Hasil_{ujian_id}.zip'),
+                                     dokumen(), len(daftar_id), konteks.progres)
+    konteks.hasil = ringkasan
+
+    pesan = (f"ZIP berisi {ringkasan['jumlah'] - len(ringkasan['gagal'])} PDF selesai dalam "
+             f"{ringkasan['detik_total']} detik ({ringkasan['detik_per_siswa']} detik/siswa, "
+             f"{ringkasan['workers']} proses).")
+    if ringkasan['gagal']:
+        pesan += f" {len(ringkasan['gagal'])} PDF gagal dibuat, lihat GAGAL.txt di dalam ZIP."
+    return pesan
+
+
+@bp.route('/download_hasil_zip/<int:ujian_id>')
 @login_required
-def download_hasil_pdf(jawaban_id):
+def download_hasil_zip(ujian_id):
     if current_user.role not in ['guru', 'admin']:
         return redirect('/')
 
-    try:
-        jawaban = JawabanSiswa.query.get_or_404(jawaban_id)
-        ujian = jawaban.ujian
-        siswa = jawaban.siswa
-
-        if current_user.role != 'admin' and ujian.mapel.guru_id != current_user.id:
-            flash('Anda tidak memiliki akses ke ujian ini.', 'danger')
-            return redirect('/guru/dashboard')
+    ujian = Ujian.query.get_or_404(ujian_id)
+    if current_user.role != 'admin' and ujian.mapel.guru_id != current_user.id:
+        flash('Anda tidak memiliki akses ke ujian ini.', 'danger')
+        return redirect('/guru/dashboard')
 
-        try: soal_pg = json.loads(ujian.soal_pg) if ujian.soal_pg else []
-        except: soal_pg = []
-        
-        try: soal_essay = json.loads(ujian.soal_essay) if ujian.soal_essay else []
-        except: soal_essay = []
+    job_id = antrian_pekerjaan.kirim('zip_pdf_hasil', {
+        'ujian_id': ujian_id,
+        'kelas_id': request.args.get('kelas', type=int),
+    }, current_user.id, tautan=url_for('guru.lihat_nilai', ujian_id=ujian_id))
+    return redirect(url_for('halaman_pekerjaan', job_id=job_id))
 
-        try: jawab_pg = json.loads(jawaban.jawaban_pg) if jawaban.jawaban_pg else {}
-        except: jawab_pg = {}
 
-        try: jawab_essay = json.loads(jawaban.jawaban_essay) if jawaban.jawaban_essay else {}
-        except: jawab_essay = {}
+@bp.route('/download_hasil_pdf/<int:jawaban_id>')
+@login_required
+def download_hasil_pdf(jawaban_id):
+    if current_user.role not in ['guru', 'admin']:
+        return redirect('/')
 
-        jml_benar_pg = 0
-        for idx, s in enumerate(soal_pg):
-            # Cek by ID -> Fallback by Index
-            ans = jawab_pg.get(s.get('id'))
-            if ans is None: ans = jawab_pg.get(str(idx))
-            
-            if ans == s.get('kunci'):
-                jml_benar_pg += 1
-
-        image_folder = os.path.join(current_app.root_path, 'static', 'uploads', 'soal')
-        image_folder = image_folder.replace('\\', '/')
-
-        html_content = render_template(
-            'guru/pdf_hasil_siswa.html',
-            siswa=siswa, ujian=ujian, jawaban=jawaban,
-            soal_pg=soal_pg, soal_essay=soal_essay,
-            jawab_pg=jawab_pg, jawab_essay=jawab_essay,
-            jml_benar_pg=jml_benar_pg, total_soal_pg=len(soal_pg),
-            image_folder=image_folder
-        )
-
-        pdf_output = io.BytesIO()
-        pisa_status = pisa.CreatePDF(src=html_content, dest=pdf_output)
-
-        if pisa_status.err:
-            flash(f'Gagal membuat PDF: {pisa_status.err}', 'danger')
-            return redirect(url_for('guru.lihat_nilai', ujian_id=ujian.id))
-
-        pdf_output.seek(0)
-        filename = secure_filename(f"Hasil_{siswa.nama}_{ujian.judul}.pdf")
-        
-        return send_file(
-            pdf_output, 
-            as_attachment=True, 
-            download_name=filename, 
-            mimetype='application/pdf'
-        )
+    # Hanya cek akses di sini; render HTML + xhtml2pdf dikerjakan antrian pekerjaan
+    jawaban = JawabanSiswa.query.get_or_404(jawaban_id)
+    ujian = jawaban.ujian
 
-    except Exception as e:
-        print(f"ERROR PDF: {e}") 
-        flash("Terjadi kesalahan sistem saat membuat PDF.", "danger")
+    if current_user.role != 'admin' and ujian.mapel.guru_id != current_user.id:
+        flash('Anda tidak memiliki akses ke ujian ini.', 'danger')
         return redirect('/guru/dashboard')
+
+    job_id = antrian_pekerjaan.kirim('pdf_hasil_siswa', {'jawaban_id': jawaban_id}, current_user.id,
+                                     tautan=url_for('guru.lihat_nilai', ujian_id=ujian.id))
+    return redirect(url_for('halaman_pekerjaan', job_id=job_id))
     
 # ==================== GANTI PASSWORD ====================
 @bp.route('/ganti_password', methods=['GET', 'POST'])
@@ -834,19 +953,23 @@ def ganti_password():
     if current_user.role not in ['guru', 'admin']:
         return redirect('/')
 
+    # current_user berasal dari cache (tanpa hash password) -> muat User asli
+    user = db.session.get(User, current_user.id)
+
     if request.method == 'POST':
         old_pass = request.form['old_pass']
         new_pass = request.form['new_pass']
         confirm_pass = request.form['confirm_pass']
-        if not check_password_hash(current_user.password, old_pass):
+        if not check_password_hash(user.password, old_pass):
             flash('Password lama salah!', 'danger')
         elif new_pass != confirm_pass:
             flash('Konfirmasi password baru tidak cocok!', 'warning')
         elif len(new_pass) < 6:
             flash('Password baru minimal 6 karakter!', 'warning')
         else:
-            current_user.password = generate_password_hash(new_pass)
+            user.password = generate_password_hash(new_pass)
             db.session.commit()
+            user_cache.invalidate(user.id)
             flash('Password berhasil diubah!', 'success')
             return redirect('/guru/dashboard')
     return render_template('guru/ganti_password.html')
\ No newline at end of file
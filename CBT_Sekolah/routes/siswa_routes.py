@@ -1,17 +1,32 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for
 from flask_login import login_required, current_user
-from models import db, Ujian, JawabanSiswa
+from models import db, Ujian, JawabanSiswa, User
+from services.sesi_user import user_cache
+from services.exam_cache import exam_cache
+from services.lembar_jawaban import encode_pg
+from services.penilaian import nilai_pg_satu
+from services.tabel_nilai import naikkan_versi_nilai
+from services.autosave import autosave_buffer
+from services.antrian_submit import antrian_submit, tulis_lembar, DUPLIKAT
+from services.ujian_kelas import dashboard_cache, ujian_aktif_semua, boleh_ikut
+from services.koneksi_baca import baca_saja
+from services.metrik import metrik
+from concurrent.futures import TimeoutError as FutureTimeout
+from sqlalchemy.exc import IntegrityError, OperationalError
 from werkzeug.security import generate_password_hash, check_password_hash
-import json
 import random
 from datetime import datetime, timedelta
 
 bp = Blueprint('siswa', __name__)
 
+# Batas panjang satu jawaban essay yang diterima endpoint autosave
+MAKS_PANJANG_ESSAY = 20000
+
 
 # ==================== DASHBOARD SISWA ====================
 @bp.route('/dashboard')
 @login_required
+@baca_saja
 def dashboard():
     # UPDATE: Izinkan Siswa ATAU Admin (untuk preview)
     if current_user.role not in ['siswa', 'admin']: 
@@ -19,10 +34,13 @@ def dashboard():
 
     now = datetime.now()
     # Tampilkan ujian yang sedang aktif ATAU baru saja selesai (toleransi 30 menit agar siswa tidak panik jika telat dikit)
-    ujian = Ujian.query.filter(
-        Ujian.waktu_mulai <= now,
-        Ujian.waktu_selesai >= now - timedelta(minutes=30) 
-    ).order_by(Ujian.waktu_mulai).all()
+    # Siswa hanya melihat ujian untuk kelasnya (cache per kelas), admin melihat semua
+    if current_user.role == 'admin':
+        ujian = ujian_aktif_semua(now)
+    elif current_user.kelas_id:
+        ujian = dashboard_cache.get(current_user.kelas_id, now)
+    else:
+        ujian = ()
 
     return render_template('siswa/dashboard.html', ujian=ujian, datetime=datetime)
 
@@ -38,6 +56,11 @@ def ujian(ujian_id):
     ujian = Ujian.query.get_or_404(ujian_id)
     now = datetime.now()
 
+    # Ujian hanya untuk kelas yang menjadi target
+    if current_user.role == 'siswa' and not boleh_ikut(ujian_id, current_user.kelas_id):
+        flash('Ujian ini tidak ditujukan untuk kelas Anda!', 'danger')
+        return redirect('/siswa/dashboard')
+
     # Validasi Waktu Awal
     if now < ujian.waktu_mulai:
         flash('Ujian belum dimulai!', 'warning')
@@ -66,28 +89,19 @@ def ujian(ujian_id):
     if sisa_waktu_detik < 0:
         sisa_waktu_detik = 0
 
-    # Load Database Soal
-    try:
-        pg_db = json.loads(ujian.soal_pg) if ujian.soal_pg else []
-        essay_db = json.loads(ujian.soal_essay) if ujian.soal_essay else []
-    except json.JSONDecodeError:
-        pg_db = []
-        essay_db = []
+    # Load Database Soal (dari cache, di-parse sekali per versi soal)
+    soal_siap = exam_cache.get(ujian)
+    pg_db = soal_siap.pg_db
+    essay_db = soal_siap.essay_db
 
     # ==================== PROSES SUBMIT JAWABAN (POST) ====================
     if request.method == 'POST':
-        # 1. Hitung Bobot Maksimal Essay
-        total_bobot_essay = 0
-        for e in essay_db:
-            total_bobot_essay += int(e.get('bobot', 0))
-
-        # Max nilai PG adalah sisa dari 100 dikurangi bobot essay
-        max_score_pg = 100 - total_bobot_essay
-        if max_score_pg < 0: max_score_pg = 0 
+        # Draft autosave dipakai untuk soal yang tidak terkirim di form
+        # (misal browser sempat crash / localStorage terhapus)
+        draft = autosave_buffer.ambil(current_user.id, ujian_id)
 
-        # 2. Proses Jawaban PG (Menggunakan ID sebagai Key)
-        jawaban_pg_siswa = {}
-        jml_benar = 0
+        # 1. Proses Jawaban PG (disimpan ringkas: 1 byte per soal sesuai urutan soal)
+        jawaban_pg_siswa = []
 
         for i, soal in enumerate(pg_db):
             # Cek ID Soal
@@ -97,21 +111,13 @@ def ujian(ujian_id):
             form_key = f'pg_{soal_id}' if soal_id else f'pg_{i}'
             
             # Ambil jawaban dari form
-            jawaban = request.form.get(form_key)
-
-            # Tentukan Key Penyimpanan: Gunakan ID jika ada, fallback ke Index
-            storage_key = soal_id if soal_id else str(i)
-            jawaban_pg_siswa[storage_key] = jawaban
+            jawaban = request.form.get(form_key) or draft.get(form_key)
+            jawaban_pg_siswa.append(jawaban)
 
-            # Cek Kebenaran (Langsung hitung sementara)
-            if jawaban and jawaban == soal.get('kunci'):
-                jml_benar += 1
+        kode_pg = encode_pg(jawaban_pg_siswa)
 
-        # Hitung Nilai PG Sementara
-        if pg_db and len(pg_db) > 0:
-            nilai_pg = (jml_benar / len(pg_db)) * max_score_pg
-        else:
-            nilai_pg = 0
+        # 2. Hitung Nilai PG Sementara (max nilai PG = 100 - total bobot essay)
+        jml_benar, nilai_pg = nilai_pg_satu(kode_pg, soal_siap.kunci_pg, soal_siap.total_bobot_essay)
 
         # 3. Proses Jawaban Essay (Menggunakan ID sebagai Key)
         jawaban_essay_siswa = {}
@@ -119,25 +125,65 @@ def ujian(ujian_id):
             soal_id = soal.get('id')
             form_key = f'essay_{soal_id}' if soal_id else f'essay_{i}'
             
-            jawaban = request.form.get(form_key, '').strip()
+            jawaban = request.form.get(form_key)
+            if jawaban is None:
+                jawaban = draft.get(form_key, '')
+            jawaban = jawaban.strip()
             
             storage_key = soal_id if soal_id else str(i)
             jawaban_essay_siswa[storage_key] = jawaban
 
         # 4. Simpan ke Database
-        jwb = JawabanSiswa(
-            siswa_id=current_user.id,
-            ujian_id=ujian_id,
-            jawaban_pg=json.dumps(jawaban_pg_siswa),
-            jawaban_essay=json.dumps(jawaban_essay_siswa),
-            nilai_pg=round(nilai_pg, 2),
-            nilai_essay=0,  # Menunggu koreksi guru
-            total_nilai=round(nilai_pg, 2),  # Sementara total = PG
-            waktu_submit=datetime.now()
-        )
-        db.session.add(jwb)
-        db.session.commit()
-
+        lembar = {
+            'siswa_id': current_user.id,
+            'ujian_id': ujian_id,
+            'kode_pg': kode_pg,
+            'jml_benar': jml_benar,
+            'total_soal_pg': len(pg_db),
+            'nilai_pg': nilai_pg,
+            'essay': jawaban_essay_siswa,
+            'waktu_submit': datetime.now()
+        }
+
+        if antrian_submit.aktif:
+            # Lepas koneksi DB request ini, lalu tunggu thread writer meng-commit lembar
+            db.session.rollback()
+            try:
+                status = antrian_submit.kirim(lembar).result(timeout=antrian_submit.timeout)
+            except FutureTimeout:
+                metrik.catat_submit(ujian_id, 'timeout')
+                flash('Server sedang sibuk dan jawaban Anda belum dipastikan tersimpan. '
+                      'Cek status ujian di dashboard; jika belum selesai, kirim ulang jawaban.', 'warning')
+                return redirect('/siswa/dashboard')
+            except Exception:
+                metrik.catat_submit(ujian_id, 'gagal')
+                flash('Gagal menyimpan jawaban, silakan kirim ulang.', 'danger')
+                return redirect(url_for('siswa.ujian', ujian_id=ujian_id))
+
+            if status == DUPLIKAT:
+                metrik.catat_submit(ujian_id, 'duplikat')
+                flash('Anda sudah mengerjakan ujian ini!', 'info')
+                return redirect('/siswa/dashboard')
+        else:
+            try:
+                tulis_lembar(lembar, naikkan_versi_nilai(ujian_id))
+                autosave_buffer.hapus(current_user.id, ujian_id)
+                db.session.commit()
+            except IntegrityError:
+                # Double submit bersamaan ditolak oleh indeks unik (siswa_id, ujian_id)
+                db.session.rollback()
+                metrik.catat_submit(ujian_id, 'duplikat')
+                flash('Anda sudah mengerjakan ujian ini!', 'info')
+                return redirect('/siswa/dashboard')
+            except OperationalError:
+                # "database is locked" saat submit serentak: draft autosave masih utuh
+                db.session.rollback()
+                metrik.catat_submit(ujian_id, 'gagal')
+                flash('Server sedang sibuk, jawaban belum tersimpan. Silakan kirim ulang.', 'danger')
+                return redirect(url_for('siswa.ujian', ujian_id=ujian_id))
+            autosave_buffer.buang([(current_user.id, ujian_id)])
+
+        metrik.catat_submit(ujian_id, 'tersimpan')
         flash('Jawaban berhasil dikirim! Nilai akan muncul setelah dikoreksi guru.', 'success')
         return redirect('/siswa/dashboard')
 
@@ -147,54 +193,70 @@ def ujian(ujian_id):
     seed_key = f"{current_user.id}_{ujian_id}"
     rng = random.Random(seed_key) 
 
-    # 1. Siapkan Soal PG untuk Tampilan
-    pg_tampil = []
-    for idx, item in enumerate(pg_db):
-        opsi_list = []
-        for kode in ['a', 'b', 'c', 'd', 'e']:
-            has_text = item.get(kode)
-            has_img = item.get(f'{kode}_gambar')
-
-            if has_text or has_img:
-                opsi_list.append({
-                    'kode': kode.upper(),
-                    'teks': item.get(kode, ''),        
-                    'gambar': item.get(f'{kode}_gambar', '')
-                })
-        
-        # Masukkan ID ke objek tampilan agar template bisa pakai ID tersebut
-        pg_tampil.append({
-            'id': item.get('id'),          # PASSING ID
-            'original_index': idx,         # Fallback Index
-            'soal': item.get('soal', ''),
-            'gambar': item.get('gambar', ''),
-            'opsi_acak': opsi_list
-        })
-    
+    # 1. Soal PG siap tampil diambil dari cache (copy list agar shuffle tidak mengubah cache)
+    pg_tampil = list(soal_siap.pg_tampil)
+
     # Acak urutan soal (opsi jawaban tetap urut A-E sesuai request)
     rng.shuffle(pg_tampil)
 
-    # 2. Siapkan Soal Essay untuk Tampilan
-    essay_tampil = []
-    for idx, item in enumerate(essay_db):
-        essay_tampil.append({
-            'id': item.get('id'),          # PASSING ID
-            'original_index': idx,         # Fallback Index
-            'soal': item.get('soal', ''),
-            'gambar': item.get('gambar', ''),
-            'bobot': item.get('bobot', 0)
-        })
-    
+    # 2. Soal Essay siap tampil
+    essay_tampil = list(soal_siap.essay_tampil)
+
     # Acak urutan essay
     rng.shuffle(essay_tampil)
 
+    # 3. Draft autosave di server (dipulihkan jika localStorage browser kosong)
+    draft_jawaban = autosave_buffer.ambil(current_user.id, ujian_id)
+
     return render_template('siswa/ujian.html',
                            ujian=ujian,
                            pg_tampil=pg_tampil,
                            essay_tampil=essay_tampil,
+                           draft_jawaban=draft_jawaban,
                            sisa_waktu_detik=sisa_waktu_detik)
 
 
+# ==================== AUTOSAVE JAWABAN (PER SOAL) ====================
+@bp.route('/autosave/<int:ujian_id>', methods=['POST'])
+@login_required
+def autosave(ujian_id):
+    if current_user.role not in ['siswa', 'admin']:
+        return ('', 403)
+
+    ujian = Ujian.query.get_or_404(ujian_id)
+    now = datetime.now()
+    if now < ujian.waktu_mulai or now > ujian.waktu_selesai + timedelta(minutes=2):
+        return ('', 409)
+    if current_user.role == 'siswa' and not boleh_ikut(ujian_id, current_user.kelas_id):
+        return ('', 403)
+    if JawabanSiswa.query.filter_by(siswa_id=current_user.id, ujian_id=ujian_id).first():
+        return ('', 409)
+
+    data = request.get_json(silent=True) or {}
+    perubahan = data.get('jawaban')
+    if not isinstance(perubahan, dict) or not perubahan:
+        return ('', 400)
+
+    # Hanya field soal milik ujian ini yang diterima
+    soal_siap = exam_cache.get(ujian)
+    field_pg = {f"pg_{s.get('id') or i}" for i, s in enumerate(soal_siap.pg_db)}
+    field_essay = {f"essay_{s.get('id') or i}" for i, s in enumerate(soal_siap.essay_db)}
+
+    bersih = {}
+    for field, nilai in perubahan.items():
+        nilai = nilai if isinstance(nilai, str) else ''
+        if field in field_pg:
+            nilai = nilai.strip().upper()
+            bersih[field] = nilai if nilai in ('A', 'B', 'C', 'D', 'E') else ''
+        elif field in field_essay:
+            bersih[field] = nilai[:MAKS_PANJANG_ESSAY]
+    if not bersih:
+        return ('', 400)
+
+    autosave_buffer.tambah(current_user.id, ujian_id, bersih)
+    return ('', 204)
+
+
 # ==================== GANTI PASSWORD ====================
 @bp.route('/ganti_password', methods=['GET', 'POST'])
 @login_required
@@ -202,20 +264,24 @@ def ganti_password():
     if current_user.role not in ['siswa', 'admin']: 
         return redirect('/')
 
+    # current_user berasal dari cache (tanpa hash password) -> muat User asli
+    user = db.session.get(User, current_user.id)
+
     if request.method == 'POST':
         old_pass = request.form['old_pass']
         new_pass = request.form['new_pass']
         confirm_pass = request.form['confirm_pass']
 
-        if not check_password_hash(current_user.password, old_pass):
+        if not check_password_hash(user.password, old_pass):
             flash('Password lama salah!', 'danger')
         elif new_pass != confirm_pass:
             flash('Konfirmasi password baru tidak cocok!', 'warning')
         elif len(new_pass) < 6:
             flash('Password baru minimal 6 karakter!', 'warning')
         else:
-            current_user.password = generate_password_hash(new_pass)
+            user.password = generate_password_hash(new_pass)
             db.session.commit()
+            user_cache.invalidate(user.id)
             flash('Password berhasil diubah!', 'success')
             return redirect('/siswa/dashboard')
 
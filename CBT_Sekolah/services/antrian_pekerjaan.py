@@ -0,0 +1,373 @@
+import atexit
+import json
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import DateTime, bindparam, select, text, update
+from werkzeug.utils import secure_filename
+
+from models import db, Pekerjaan
+from services.statistik import ringkas_durasi
+
+logger = logging.getLogger(__name__)
+
+# ==================== ANTRIAN PEKERJAAN LATAR (TABEL SQLITE + WORKER THREAD) ====================
+# Pekerjaan berat staf (hitung ulang nilai, impor Excel/PDF, export Excel, PDF
+# hasil siswa) tidak lagi dikerjakan di thread waitress:
+#   - route memanggil antrian_pekerjaan.kirim(jenis, ...) -> baris tabel Pekerjaan,
+#     lalu langsung redirect ke halaman progres /pekerjaan/<id>
+#   - JOB_WORKERS thread worker mengambil job 'menunggu' (UPDATE ... RETURNING,
+#     atomik walau banyak proses) dan menjalankan fungsi yang didaftarkan lewat
+#     @antrian_pekerjaan.tugas('jenis')
+#   - worker menulis progres + heartbeat (kolom detak). Job 'berjalan' yang
+#     detaknya basi (proses mati / server restart) dikembalikan ke antrian sampai
+#     maks_percobaan, setelah itu ditandai gagal
+#   - waktu mulai/selesai per job tersimpan; ringkasan durasi per jenis di stats()
+# Proses hanya mengambil jenis job yang handler-nya ia kenal (profil student
+# tidak memuat route staf -> tidak menjalankan worker sama sekali).
+
+MENUNGGU = 'menunggu'
+BERJALAN = 'berjalan'
+SELESAI = 'selesai'
+GAGAL = 'gagal'
+
+# Parameter berisi path file upload sementara; dihapus saat job selesai/gagal final
+PARAM_FILE_MASUK = 'file_masuk'
+
+
+class KonteksPekerjaan:
+    # Objek yang diterima handler: progres, simpan file hasil, hasil terstruktur
+    def __init__(self, antrian, job_id, jenis, parameter, percobaan):
+        self.antrian = antrian
+        self.id = job_id
+        self.jenis = jenis
+        self.parameter = parameter
+        self.percobaan = percobaan
+        self.hasil = None
+        self.file_hasil = None
+        self.nama_file = None
+        self._terakhir = 0.0
+
+    def progres(self, selesai, total=None, paksa=False):
+        # Ditulis paling sering tiap JOB_PROGRESS_INTERVAL detik (sekalian heartbeat)
+        sekarang = time.monotonic()
+        akhir = total is not None and selesai >= total
+        if not paksa and not akhir and sekarang - self._terakhir < self.antrian.interval_progres:
+            return
+        self._terakhir = sekarang
+        nilai = {'progres': int(selesai), 'detak': datetime.now()}
+        if total is not None:
+            nilai['progres_total'] = int(total)
+        self.antrian._ubah(self.id, **nilai)
+
+    def path_file(self, nama_file):
+        # Untuk hasil besar yang ditulis bertahap langsung ke disk (mis. ZIP)
+        os.makedirs(self.antrian.folder_hasil, exist_ok=True)
+        self.file_hasil = os.path.join(self.antrian.folder_hasil, f'{self.id}_{secure_filename(nama_file) or "hasil"}')
+        self.nama_file = nama_file
+        return self.file_hasil
+
+    def simpan_file(self, data, nama_file):
+        with open(self.path_file(nama_file), 'wb') as f:
+            f.write(data)
+
+
+class AntrianPekerjaan:
+    def __init__(self):
+        self.app = None
+        self.workers = 2
+        self.interval = 1.0
+        self.interval_progres = 1.0
+        self.batas_basi = 60
+        self.simpan_hari = 7
+        self.folder = None
+        self.folder_hasil = None
+        self.pemegang_dasar = f'{socket.gethostname()}:{os.getpid()}'
+
+        self._handler = {}
+        self._threads = []
+        self._stop = threading.Event()
+        self._ada_kerja = threading.Event()
+        self._lock = threading.Lock()
+        self._berjalan = set()  # id job yang sedang dikerjakan proses ini
+
+        self.dikirim = 0
+        self.selesai = 0
+        self.gagal = 0
+        self.diulang = 0
+        self._durasi = {}  # jenis -> deque durasi (detik)
+
+    # ==================== REGISTRASI HANDLER ====================
+    def tugas(self, jenis):
+        def daftar(fungsi):
+            self._handler[jenis] = fungsi
+            return fungsi
+        return daftar
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config.get('JOB_WORKERS', self.workers)
+        self.interval = app.config.get('JOB_POLL_INTERVAL', self.interval)
+        self.interval_progres = app.config.get('JOB_PROGRESS_INTERVAL', self.interval_progres)
+        self.batas_basi = app.config.get('JOB_STALE_SECONDS', self.batas_basi)
+        self.simpan_hari = app.config.get('JOB_KEEP_DAYS', self.simpan_hari)
+        self.folder = app.config.get('JOB_DIR') or os.path.join(app.instance_path, 'pekerjaan')
+        self.folder_hasil = os.path.join(self.folder, 'hasil')
+        self.pemegang_dasar = f'{socket.gethostname()}:{os.getpid()}'
+
+        if self.workers > 0 and self._handler:
+            self._mulai_thread()
+            atexit.register(self.stop)
+
+    def _mulai_thread(self):
+        self._stop.clear()
+        self._threads = [t for t in self._threads if t.is_alive()]
+        for i in range(len(self._threads), self.workers):
+            t = threading.Thread(target=self._loop_worker, name=f'job-worker-{i}', daemon=True)
+            t.start()
+            self._threads.append(t)
+        t = threading.Thread(target=self._loop_penjaga, name='job-penjaga', daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    # ==================== KIRIM JOB (DARI ROUTE) ====================
+    def simpan_upload(self, file, ekstensi):
+        # Upload disalin per blok ke disk (tidak dibaca utuh ke RAM); path masuk parameter job
+        folder = os.path.join(self.folder, 'masuk')
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f'{uuid.uuid4().hex}{ekstensi}')
+        file.save(path)
+        return path
+
+    def kirim(self, jenis, parameter=None, pemilik_id=None, tautan=None, maks_percobaan=3, job_id=None):
+        job = Pekerjaan(
+            id=job_id or uuid.uuid4().hex,
+            jenis=jenis,
+            parameter=json.dumps(parameter or {}),
+            status=MENUNGGU,
+            pemilik_id=pemilik_id,
+            tautan=tautan,
+            maks_percobaan=maks_percobaan,
+            dibuat=datetime.now(),
+        )
+        db.session.add(job)
+        db.session.commit()
+        with self._lock:
+            self.dikirim += 1
+        # Bangunkan worker proses ini; proses lain mengambilnya pada polling berikutnya
+        self._ada_kerja.set()
+        return job.id
+
+    # ==================== WORKER ====================
+    def _ambil(self, pemegang):
+        jenis = list(self._handler)
+        with self.app.app_context():
+            # Cek murah di jalur baca dulu agar polling tidak mengambil lock writer
+            ada = db.session.execute(
+                select(Pekerjaan.id).where(Pekerjaan.status == MENUNGGU, Pekerjaan.jenis.in_(jenis)).limit(1)
+            ).first()
+            db.session.remove()
+            if ada is None:
+                return None
+
+            sekarang = datetime.now()
+            with db.engine.begin() as conn:
+                row = conn.execute(text(
+                    "UPDATE pekerjaan SET status = :berjalan, pemegang = :pemegang, mulai = :sekarang, "
+                    "detak = :sekarang, percobaan = percobaan + 1 "
+                    "WHERE id = (SELECT id FROM pekerjaan WHERE status = :menunggu AND jenis IN :jenis "
+                    "            ORDER BY dibuat LIMIT 1) AND status = :menunggu "
+                    "RETURNING id, jenis, parameter, percobaan"
+                ).bindparams(bindparam('jenis', expanding=True), bindparam('sekarang', type_=DateTime)), {
+                    'berjalan': BERJALAN, 'menunggu': MENUNGGU, 'pemegang': pemegang,
+                    'sekarang': sekarang, 'jenis': jenis,
+                }).first()
+        return row
+
+    def _loop_worker(self):
+        pemegang = f'{self.pemegang_dasar}:{threading.current_thread().name}'
+        while not self._stop.is_set():
+            try:
+                row = self._ambil(pemegang)
+            except Exception:
+                logger.exception('Antrian pekerjaan: gagal mengambil job')
+                row = None
+            if row is None:
+                self._ada_kerja.wait(self.interval)
+                self._ada_kerja.clear()
+                continue
+            self._kerjakan(*row)
+
+    def _kerjakan(self, job_id, jenis, parameter, percobaan):
+        konteks = KonteksPekerjaan(self, job_id, jenis, json.loads(parameter or '{}'), percobaan)
+        with self._lock:
+            self._berjalan.add(job_id)
+        mulai = time.perf_counter()
+        final = True
+        try:
+            with self.app.app_context():
+                pesan = self._handler[jenis](konteks, **konteks.parameter)
+            nilai = {'status': SELESAI, 'pesan': pesan or 'Selesai.'}
+        except ValueError as e:
+            # Kesalahan data dari pengguna (format file dsb.) -> tidak dicoba ulang
+            nilai = {'status': GAGAL, 'pesan': str(e)}
+        except Exception as e:
+            logger.exception('Pekerjaan %s (%s) gagal, percobaan %d', job_id, jenis, percobaan)
+            with self.app.app_context():
+                maks = db.session.get(Pekerjaan, job_id).maks_percobaan
+                db.session.remove()
+            final = percobaan >= maks
+            nilai = {'status': GAGAL if final else MENUNGGU, 'pemegang': None,
+                     'pesan': f'Terjadi kesalahan sistem: {e}' + ('' if final else ' (dicoba ulang)')}
+        durasi = time.perf_counter() - mulai
+
+        if nilai['status'] == SELESAI:
+            nilai.update(hasil=json.dumps(konteks.hasil) if konteks.hasil is not None else None,
+                         file_hasil=konteks.file_hasil, nama_file=konteks.nama_file)
+        if final:
+            nilai['selesai'] = datetime.now()
+        try:
+            self._ubah(job_id, **nilai)
+        finally:
+            with self._lock:
+                self._berjalan.discard(job_id)
+                if nilai['status'] == SELESAI:
+                    self.selesai += 1
+                elif final:
+                    self.gagal += 1
+                else:
+                    self.diulang += 1
+                self._durasi.setdefault(jenis, deque(maxlen=200)).append(durasi)
+            if final:
+                self._hapus_file_masuk(konteks.parameter)
+
+    def _ubah(self, job_id, **nilai):
+        with self.app.app_context(), db.engine.begin() as conn:
+            conn.execute(update(Pekerjaan).where(Pekerjaan.id == job_id).values(**nilai))
+
+    def _hapus_file_masuk(self, parameter):
+        path = parameter.get(PARAM_FILE_MASUK)
+        if path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    # ==================== PENJAGA: HEARTBEAT, JOB BASI, BERSIH-BERSIH ====================
+    def _loop_penjaga(self):
+        while not self._stop.wait(max(self.batas_basi / 4, 1)):
+            try:
+                self.jaga()
+            except Exception:
+                logger.exception('Antrian pekerjaan: penjaga gagal')
+
+    def jaga(self):
+        sekarang = datetime.now()
+        with self._lock:
+            berjalan = list(self._berjalan)
+
+        with self.app.app_context():
+            with db.engine.begin() as conn:
+                if berjalan:
+                    conn.execute(update(Pekerjaan).where(Pekerjaan.id.in_(berjalan)).values(detak=sekarang))
+
+                # Job 'berjalan' tanpa heartbeat = prosesnya mati -> antrikan ulang / gagal
+                basi = sekarang - timedelta(seconds=self.batas_basi)
+                rows = conn.execute(
+                    select(Pekerjaan.id, Pekerjaan.percobaan, Pekerjaan.maks_percobaan, Pekerjaan.parameter)
+                    .where(Pekerjaan.status == BERJALAN, Pekerjaan.detak < basi)
+                ).all()
+                for job_id, percobaan, maks, parameter in rows:
+                    final = percobaan >= maks
+                    conn.execute(update(Pekerjaan).where(Pekerjaan.id == job_id,
+                                                         Pekerjaan.status == BERJALAN).values(
+                        status=GAGAL if final else MENUNGGU,
+                        pemegang=None,
+                        selesai=sekarang if final else None,
+                        pesan='Proses server berhenti saat mengerjakan'
+                              + (f' ({percobaan} kali), dihentikan.' if final else ', dicoba ulang.'),
+                    ))
+                    if final:
+                        self._hapus_file_masuk(json.loads(parameter or '{}'))
+                    logger.warning('Pekerjaan %s basi (percobaan %d) -> %s', job_id, percobaan,
+                                   GAGAL if final else MENUNGGU)
+
+                # Job lama + file hasilnya dibuang setelah JOB_KEEP_DAYS
+                lama = sekarang - timedelta(days=self.simpan_hari)
+                rows = conn.execute(select(Pekerjaan.id, Pekerjaan.file_hasil)
+                                    .where(Pekerjaan.selesai < lama)).all()
+                for job_id, file_hasil in rows:
+                    if file_hasil:
+                        try:
+                            os.remove(file_hasil)
+                        except OSError:
+                            pass
+                if rows:
+                    conn.execute(Pekerjaan.__table__.delete().where(Pekerjaan.id.in_([r[0] for r in rows])))
+            if rows:
+                self._ada_kerja.set()
+
+    def stop(self):
+        self._stop.set()
+        self._ada_kerja.set()
+
+    def tunggu(self, job_id, timeout=30):
+        # Dipakai skrip/CLI: tunggu sampai job selesai atau gagal
+        batas = time.monotonic() + timeout
+        while time.monotonic() < batas:
+            with self.app.app_context():
+                status = db.session.execute(select(Pekerjaan.status).where(Pekerjaan.id == job_id)).scalar()
+                db.session.remove()
+            if status in (SELESAI, GAGAL):
+                return status
+            time.sleep(0.1)
+        return None
+
+    # ==================== STATUS ====================
+    def status(self, job):
+        durasi = (job.selesai - job.mulai).total_seconds() if job.selesai and job.mulai else None
+        return {
+            'id': job.id,
+            'jenis': job.jenis,
+            'status': job.status,
+            'progres': job.progres or 0,
+            'progres_total': job.progres_total or 0,
+            'pesan': job.pesan or '',
+            'tautan': job.tautan,
+            'ada_file': bool(job.file_hasil),
+            'nama_file': job.nama_file,
+            'percobaan': job.percobaan,
+            'dibuat': job.dibuat.isoformat(timespec='seconds') if job.dibuat else None,
+            'mulai': job.mulai.isoformat(timespec='seconds') if job.mulai else None,
+            'selesai': job.selesai.isoformat(timespec='seconds') if job.selesai else None,
+            'durasi_detik': round(durasi, 2) if durasi is not None else None,
+        }
+
+    def stats(self):
+        with self._lock:
+            durasi = {jenis: ringkas_durasi(data) for jenis, data in self._durasi.items()}
+            hasil = {
+                'workers': sum(1 for t in self._threads if t.is_alive() and t.name.startswith('job-worker')),
+                'jenis': sorted(self._handler),
+                'berjalan_di_proses_ini': len(self._berjalan),
+                'dikirim': self.dikirim,
+                'selesai': self.selesai,
+                'gagal': self.gagal,
+                'diulang': self.diulang,
+                'durasi_detik': durasi,
+            }
+        if self.app is not None:
+            with self.app.app_context():
+                hasil['antrian'] = dict(db.session.execute(
+                    select(Pekerjaan.status, db.func.count()).group_by(Pekerjaan.status)).all())
+        return hasil
+
+
+antrian_pekerjaan = AntrianPekerjaan()
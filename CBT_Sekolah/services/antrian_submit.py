@@ -0,0 +1,239 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, JawabanSiswa
+from services.autosave import autosave_buffer
+from services.lembar_jawaban import simpan_essay
+from services.tabel_nilai import naikkan_versi_nilai
+
+logger = logging.getLogger(__name__)
+
+# ==================== ANTRIAN SUBMIT (SINGLE WRITER) ====================
+# Saat waktu ujian habis, timer semua siswa mengirim jawaban dalam beberapa
+# detik yang sama. Tanpa antrian, puluhan thread waitress berebut satu writer
+# SQLite (WAL) -> "database is locked" dan antrean panjang.
+# Dengan antrian (opsional, SUBMIT_QUEUE=1): thread request hanya memvalidasi
+# & menilai lalu memasukkan lembar ke antrian; satu thread writer menulis
+# beberapa lembar sekaligus dalam satu transaksi. Request menunggu sampai
+# lembarnya benar-benar ter-commit (ack) sebelum redirect.
+
+TERSIMPAN = 'tersimpan'
+DUPLIKAT = 'duplikat'
+
+
+def tulis_lembar(item, versi_nilai):
+    # Dipakai jalur langsung (tanpa antrian) maupun thread writer
+    jwb = JawabanSiswa(
+        siswa_id=item['siswa_id'],
+        ujian_id=item['ujian_id'],
+        jawaban_pg_kode=item['kode_pg'],
+        jml_benar_pg=item['jml_benar'],
+        total_soal_pg=item['total_soal_pg'],
+        nilai_pg=item['nilai_pg'],
+        nilai_essay=0,  # Menunggu koreksi guru
+        total_nilai=item['nilai_pg'],  # Sementara total = PG
+        waktu_submit=item['waktu_submit'],
+        versi_nilai=versi_nilai
+    )
+    db.session.add(jwb)
+    simpan_essay(jwb, item['essay'])
+    return jwb
+
+
+class AntrianSubmit:
+    def __init__(self, batch_max=50, jeda=0.05):
+        self.app = None
+        self.aktif = False
+        self.batch_max = batch_max
+        # Waktu tunggu singkat setelah item pertama agar submit yang datang
+        # bersamaan ikut masuk ke batch yang sama
+        self.jeda = jeda
+        self.timeout = 30
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._berhenti = False
+
+        self.diterima = 0
+        self.ditulis = 0
+        self.duplikat = 0
+        self.gagal = 0
+        self.jumlah_batch = 0
+        self.batch_terbesar = 0
+        self.antrian_terpanjang = 0
+        self._ukuran_batch = deque(maxlen=200)
+        self._durasi_commit = deque(maxlen=200)
+
+    def init_app(self, app):
+        self.app = app
+        self.aktif = app.config.get('SUBMIT_QUEUE', False)
+        self.batch_max = app.config.get('SUBMIT_QUEUE_BATCH', self.batch_max)
+        self.timeout = app.config.get('SUBMIT_QUEUE_TIMEOUT', self.timeout)
+        atexit.register(self.stop)
+
+    def _pastikan_thread(self):
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name='submit-writer', daemon=True)
+                self._thread.start()
+
+    def kirim(self, item):
+        if self._berhenti:
+            raise RuntimeError('Antrian submit sudah dihentikan')
+
+        future = Future()
+        self._queue.put((item, future))
+        with self._stats_lock:
+            self.diterima += 1
+            self.antrian_terpanjang = max(self.antrian_terpanjang, self._queue.qsize())
+        self._pastikan_thread()
+        return future
+
+    # ==================== THREAD WRITER ====================
+    def _ambil_batch(self):
+        pertama = self._queue.get()
+        if pertama is None:
+            return None
+
+        batch = [pertama]
+        batas = time.monotonic() + self.jeda
+        while len(batch) < self.batch_max:
+            sisa = batas - time.monotonic()
+            try:
+                item = self._queue.get(timeout=max(sisa, 0)) if sisa > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Sentinel stop: tulis batch ini dulu, lalu berhenti
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._ambil_batch()
+            if batch is None:
+                return
+            with self.app.app_context():
+                self._tulis_batch(batch)
+
+    def _tulis_batch(self, batch):
+        mulai = time.perf_counter()
+        try:
+            hasil = self._simpan(batch)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logger.exception('Antrian submit: batch %d lembar gagal, ditulis satu per satu', len(batch))
+            # Satu lembar bermasalah tidak boleh menggagalkan lembar lain
+            for item in batch:
+                self._tulis_satu(item)
+            return
+
+        durasi = time.perf_counter() - mulai
+        # Buffer autosave baru dibuang setelah commit berhasil
+        autosave_buffer.buang((item['siswa_id'], item['ujian_id'])
+                              for (item, _), status in zip(batch, hasil) if status == TERSIMPAN)
+        for (_, future), status in zip(batch, hasil):
+            future.set_result(status)
+
+        with self._stats_lock:
+            self.jumlah_batch += 1
+            self.batch_terbesar = max(self.batch_terbesar, len(batch))
+            self._ukuran_batch.append(len(batch))
+            self._durasi_commit.append(durasi)
+            self.ditulis += hasil.count(TERSIMPAN)
+            self.duplikat += hasil.count(DUPLIKAT)
+
+    def _tulis_satu(self, entri):
+        item, future = entri
+        try:
+            status = self._simpan([entri])[0]
+            db.session.commit()
+        except IntegrityError:
+            # Lembar ganda yang lolos cek (submit bersamaan) ditolak indeks unik
+            db.session.rollback()
+            status = DUPLIKAT
+        except Exception as e:
+            db.session.rollback()
+            with self._stats_lock:
+                self.gagal += 1
+            future.set_exception(e)
+            return
+
+        if status == TERSIMPAN:
+            autosave_buffer.buang([(item['siswa_id'], item['ujian_id'])])
+        with self._stats_lock:
+            if status == TERSIMPAN:
+                self.ditulis += 1
+            else:
+                self.duplikat += 1
+        future.set_result(status)
+
+    def _simpan(self, batch):
+        # Cek sekali untuk seluruh batch: siswa yang sudah punya lembar (double submit)
+        pasangan = {(item['siswa_id'], item['ujian_id']) for item, _ in batch}
+        siswa_ids = {s for s, _ in pasangan}
+        ujian_ids = {u for _, u in pasangan}
+        sudah = set(db.session.query(JawabanSiswa.siswa_id, JawabanSiswa.ujian_id)
+                    .filter(JawabanSiswa.siswa_id.in_(siswa_ids), JawabanSiswa.ujian_id.in_(ujian_ids))
+                    .all())
+
+        # Versi tabel nilai cukup dinaikkan sekali per ujian per batch
+        versi = {u: naikkan_versi_nilai(u) for u in ujian_ids}
+
+        hasil = []
+        for item, _ in batch:
+            key = (item['siswa_id'], item['ujian_id'])
+            if key in sudah:
+                hasil.append(DUPLIKAT)
+                continue
+            tulis_lembar(item, versi[item['ujian_id']])
+            sudah.add(key)
+            hasil.append(TERSIMPAN)
+
+        # Draft autosave lembar yang tersimpan dihapus sekali untuk seluruh batch
+        # (ikut transaksi; buffer memori dibuang pemanggil setelah commit)
+        autosave_buffer.hapus_banyak(
+            (item['siswa_id'], item['ujian_id'])
+            for (item, _), status in zip(batch, hasil) if status == TERSIMPAN)
+        return hasil
+
+    # ==================== SHUTDOWN & METRIK ====================
+    def stop(self, timeout=30):
+        # Semua lembar yang sudah masuk antrian tetap ditulis sebelum proses berhenti
+        self._berhenti = True
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def stats(self):
+        with self._stats_lock:
+            ukuran = list(self._ukuran_batch)
+            durasi = list(self._durasi_commit)
+            return {
+                'aktif': self.aktif,
+                'antrian': self._queue.qsize(),
+                'antrian_terpanjang': self.antrian_terpanjang,
+                'diterima': self.diterima,
+                'ditulis': self.ditulis,
+                'duplikat': self.duplikat,
+                'gagal': self.gagal,
+                'jumlah_batch': self.jumlah_batch,
+                'batch_terbesar': self.batch_terbesar,
+                'rata_batch': round(sum(ukuran) / len(ukuran), 2) if ukuran else 0.0,
+                'rata_commit_ms': round(sum(durasi) / len(durasi) * 1000, 2) if durasi else 0.0,
+            }
+
+
+antrian_submit = AntrianSubmit()
@@ -0,0 +1,196 @@
+import atexit
+import logging
+import threading
+from datetime import datetime
+
+from sqlalchemy import bindparam, exists, select, tuple_
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import IntegrityError
+
+from models import db, DraftJawaban, JawabanSiswa
+
+logger = logging.getLogger(__name__)
+
+# ==================== AUTOSAVE JAWABAN (WRITE-BEHIND) ====================
+# Browser siswa mengirim perubahan jawaban per soal ({field: isi}) setiap kali
+# siswa menjawab. Perubahan ditampung di memori dan digabung per
+# (siswa, ujian, field): klik A lalu B lalu C pada soal yang sama hanya
+# menghasilkan satu baris. Thread flusher menulis seluruh isi buffer ke tabel
+# DraftJawaban dalam SATU transaksi setiap beberapa detik, sehingga 75 siswa
+# yang aktif menjawab tidak menjadi 75 x N transaksi tulis SQLite.
+# Tidak ada lock Python yang dipegang selama I/O database: submit memegang lock
+# tulis SQLite saat menghapus draft, jadi menunggu lock flush di sana bisa deadlock.
+# - upsert hanya menimpa draft yang lebih lama (flush boleh saling mendahului) dan
+#   dilewati jika lembar jawaban siswa sudah ada: SQLite menjalankan penulis satu
+#   per satu, jadi batch yang tertahan submit tidak menghidupkan lagi draft lama
+# - hapus() hanya DELETE di transaksi submit; buffer memori dibuang lewat
+#   buang() SETELAH commit berhasil (submit gagal -> draft tetap utuh)
+# - ambil() membaca DB dulu, lalu menimpa dengan batch yang sedang ditulis + buffer
+
+
+class AutosaveBuffer:
+    def __init__(self, interval=3.0):
+        self.interval = interval
+        self.app = None
+        self._pending = {}
+        # Batch yang sudah keluar dari buffer tapi belum ter-commit (dibaca ambil())
+        self._dikirim = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+        self.diterima = 0
+        self.digabung = 0
+        self.batch = 0
+        self.baris_ditulis = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get('AUTOSAVE_INTERVAL', self.interval)
+        atexit.register(self.stop)
+
+    def _pastikan_thread(self):
+        # Thread dijalankan saat autosave pertama, bukan saat import
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name='autosave-flusher', daemon=True)
+            self._thread.start()
+
+    def tambah(self, siswa_id, ujian_id, perubahan):
+        sekarang = datetime.utcnow()
+        with self._lock:
+            for field, nilai in perubahan.items():
+                key = (siswa_id, ujian_id, field)
+                if key in self._pending:
+                    self.digabung += 1
+                self._pending[key] = (nilai, sekarang)
+                self.diterima += 1
+            self._pastikan_thread()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Autosave: flush gagal')
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            self._dikirim.append(batch)
+
+        rows = [
+            {'siswa_id': s, 'ujian_id': u, 'field': f, 'nilai': nilai, 'diperbarui': waktu}
+            for (s, u, f), (nilai, waktu) in batch.items()
+        ]
+        kolom = ['siswa_id', 'ujian_id', 'field', 'nilai', 'diperbarui']
+        tabel = DraftJawaban.__table__
+        sumber = (select(*[bindparam(k, type_=tabel.c[k].type) for k in kolom])
+                  .where(~exists().where(JawabanSiswa.siswa_id == bindparam('siswa_id'),
+                                         JawabanSiswa.ujian_id == bindparam('ujian_id'))))
+        stmt = insert(tabel).from_select(kolom, sumber)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['siswa_id', 'ujian_id', 'field'],
+            set_={'nilai': stmt.excluded.nilai, 'diperbarui': stmt.excluded.diperbarui},
+            # Flush berkala dan flush saat shutdown bisa berjalan bersamaan
+            where=tabel.c.diperbarui <= stmt.excluded.diperbarui
+        )
+
+        try:
+            with self.app.app_context():
+                try:
+                    db.session.execute(stmt, rows)
+                    db.session.commit()
+                except IntegrityError:
+                    # Siswa/ujian sudah dihapus saat draft masih di buffer:
+                    # tulis satu per satu dan buang baris yang melanggar FK
+                    db.session.rollback()
+                    rows = self._tulis_per_baris(stmt, rows)
+        except Exception:
+            # Kembalikan ke buffer (kecuali sudah ada isi yang lebih baru) lalu coba lagi nanti
+            with self._lock:
+                for key, item in batch.items():
+                    self._pending.setdefault(key, item)
+            raise
+        finally:
+            with self._lock:
+                self._dikirim.remove(batch)
+
+        with self._lock:
+            self.batch += 1
+            self.baris_ditulis += len(rows)
+        return len(rows)
+
+    def _tulis_per_baris(self, stmt, rows):
+        tertulis = []
+        for row in rows:
+            try:
+                db.session.execute(stmt, [row])
+                db.session.commit()
+                tertulis.append(row)
+            except IntegrityError:
+                db.session.rollback()
+                logger.warning('Autosave: draft siswa %s ujian %s dibuang (data sudah dihapus)',
+                               row['siswa_id'], row['ujian_id'])
+        return tertulis
+
+    def stop(self):
+        self._stop.set()
+        if self.app is not None:
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Autosave: flush terakhir gagal')
+
+    # ==================== BACA / HAPUS DRAFT ====================
+    def ambil(self, siswa_id, ujian_id):
+        # Draft di database, lalu ditimpa batch yang belum ter-commit dan isi buffer
+        # (yang lebih baru menimpa yang lebih lama)
+        rows = (db.session.query(DraftJawaban.field, DraftJawaban.nilai)
+                .filter_by(siswa_id=siswa_id, ujian_id=ujian_id)
+                .all())
+        draft = {r.field: r.nilai for r in rows}
+        with self._lock:
+            for sumber in self._dikirim + [self._pending]:
+                for (s, u, field), (nilai, _) in sumber.items():
+                    if s == siswa_id and u == ujian_id:
+                        draft[field] = nilai
+        return draft
+
+    def hapus(self, siswa_id, ujian_id):
+        self.hapus_banyak([(siswa_id, ujian_id)])
+
+    def hapus_banyak(self, pasangan):
+        # Dipanggil dalam transaksi submit: draft tidak diperlukan lagi.
+        # Hanya DELETE (satu statement untuk seluruh batch); buffer memori baru
+        # dibuang lewat buang() setelah commit submit berhasil
+        pasangan = set(pasangan)
+        if not pasangan:
+            return
+        (DraftJawaban.query
+         .filter(tuple_(DraftJawaban.siswa_id, DraftJawaban.ujian_id).in_(pasangan))
+         .delete(synchronize_session=False))
+
+    def buang(self, pasangan):
+        # Dipanggil SETELAH commit submit: isi buffer lembar yang sudah tersimpan
+        # tidak perlu ditulis lagi (kalaupun lolos, upsert melewatinya)
+        pasangan = set(pasangan)
+        with self._lock:
+            for key in [k for k in self._pending if (k[0], k[1]) in pasangan]:
+                del self._pending[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'diterima': self.diterima,
+                'digabung': self.digabung,
+                'batch': self.batch,
+                'baris_ditulis': self.baris_ditulis,
+                'interval': self.interval,
+            }
+
+
+autosave_buffer = AutosaveBuffer()
@@ -0,0 +1,152 @@
+from collections import namedtuple
+
+from sqlalchemy import func
+
+from models import db, Soal
+from services.lembar_jawaban import remap_pg
+
+# ==================== BANK SOAL (TABEL SOAL PER BARIS) ====================
+# Semua pembaca/penulis soal lewat modul ini. Bentuk dict yang dikembalikan sama
+# dengan format JSON lama ({'id', 'soal', 'a'..'e', 'kunci', ...}) agar template
+# tidak perlu diubah.
+
+OPSI_KODE = ['a', 'b', 'c', 'd', 'e']
+TIPE_PG = 'pg'
+TIPE_ESSAY = 'essay'
+
+# Hasil simpan_soal, dibandingkan per uid soal:
+#   ada    : ada baris soal yang ditulis (teks, gambar, urutan, kunci, ...)
+#   kunci  : uid soal PG yang kuncinya berubah
+#   set_pg : soal PG ditambah/dihapus (urutan saja tidak dihitung: jawaban ikut dipetakan ulang)
+#   bobot  : total bobot essay berubah (menggeser nilai maksimal PG)
+PerubahanSoal = namedtuple('PerubahanSoal', ['ada', 'kunci', 'set_pg', 'bobot'])
+
+
+def perlu_hitung_ulang(perubahan):
+    # Typo soal/opsi, ganti gambar, atau urutan saja tidak mengubah nilai siswa
+    return bool(perubahan.kunci or perubahan.set_pg or perubahan.bobot)
+
+
+def soal_ke_dict(row):
+    if row.tipe == TIPE_PG:
+        data = {
+            'id': row.uid,
+            'soal': row.soal or '',
+            'kunci': row.kunci,
+            'gambar': row.gambar or ''
+        }
+        for kode in OPSI_KODE:
+            data[kode] = getattr(row, kode) or ''
+            data[f'{kode}_gambar'] = getattr(row, f'{kode}_gambar') or ''
+        return data
+
+    return {
+        'id': row.uid,
+        'soal': row.soal or '',
+        'bobot': row.bobot or 0,
+        'gambar': row.gambar or ''
+    }
+
+
+def _isi_baris(row, item):
+    row.soal = item.get('soal', '') or ''
+    row.gambar = item.get('gambar', '') or ''
+
+    if row.tipe == TIPE_PG:
+        row.kunci = item.get('kunci')
+        for kode in OPSI_KODE:
+            setattr(row, kode, item.get(kode, '') or '')
+            setattr(row, f'{kode}_gambar', item.get(f'{kode}_gambar', '') or '')
+    else:
+        try:
+            row.bobot = int(item.get('bobot', 0) or 0)
+        except (TypeError, ValueError):
+            row.bobot = 0
+
+
+# ==================== BACA ====================
+def ambil_soal(ujian_id):
+    rows = (Soal.query
+            .filter_by(ujian_id=ujian_id)
+            .order_by(Soal.urutan)
+            .all())
+
+    pg_list = [soal_ke_dict(r) for r in rows if r.tipe == TIPE_PG]
+    essay_list = [soal_ke_dict(r) for r in rows if r.tipe == TIPE_ESSAY]
+    return pg_list, essay_list
+
+
+def ambil_satu_soal(ujian_id, tipe, uid):
+    row = Soal.query.filter_by(ujian_id=ujian_id, tipe=tipe, uid=str(uid)).first()
+    return soal_ke_dict(row) if row else None
+
+
+def ambil_kunci(ujian_id):
+    # Hanya kolom uid & kunci soal PG (urut), tanpa memuat teks soal/opsi
+    return (db.session.query(Soal.uid, Soal.kunci)
+            .filter(Soal.ujian_id == ujian_id, Soal.tipe == TIPE_PG)
+            .order_by(Soal.urutan)
+            .all())
+
+
+def total_bobot_essay(ujian_id):
+    total = (db.session.query(func.coalesce(func.sum(Soal.bobot), 0))
+             .filter(Soal.ujian_id == ujian_id, Soal.tipe == TIPE_ESSAY)
+             .scalar())
+    return int(total or 0)
+
+
+# ==================== TULIS ====================
+def simpan_soal(ujian_id, pg_list, essay_list):
+    # Upsert berdasarkan (tipe, uid): baris yang tidak berubah tidak di-UPDATE
+    # (SQLAlchemy hanya menulis kolom yang nilainya benar-benar berubah),
+    # soal baru di-INSERT, soal yang hilang dari form di-DELETE.
+    # Mengembalikan PerubahanSoal agar pemanggil bisa melewati hitung ulang nilai.
+    rows_lama = Soal.query.filter_by(ujian_id=ujian_id).order_by(Soal.urutan).all()
+    existing = {(r.tipe, r.uid): r for r in rows_lama}
+    uid_pg_lama = [r.uid for r in rows_lama if r.tipe == TIPE_PG]
+    kunci_lama = {r.uid: r.kunci for r in rows_lama if r.tipe == TIPE_PG}
+    bobot_lama = sum(r.bobot or 0 for r in rows_lama if r.tipe == TIPE_ESSAY)
+    uid_pg_baru = []
+    kunci_baru = {}
+    bobot_baru = 0
+    dipakai = set()
+    ada = False
+
+    for tipe, daftar in ((TIPE_PG, pg_list), (TIPE_ESSAY, essay_list)):
+        for urutan, item in enumerate(daftar):
+            uid = str(item.get('id') or urutan)
+            key = (tipe, uid)
+            if key in dipakai:
+                continue
+
+            row = existing.get(key)
+            if row is None:
+                row = Soal(ujian_id=ujian_id, tipe=tipe, uid=uid)
+                db.session.add(row)
+                ada = True
+
+            row.urutan = urutan
+            _isi_baris(row, item)
+            ada = ada or db.session.is_modified(row)
+            dipakai.add(key)
+            if tipe == TIPE_PG:
+                uid_pg_baru.append(uid)
+                kunci_baru[uid] = row.kunci
+            else:
+                bobot_baru += row.bobot
+
+    for key, row in existing.items():
+        if key not in dipakai:
+            db.session.delete(row)
+            ada = True
+
+    # Jawaban PG ringkas mengikuti urutan soal -> petakan ulang jika urutan/set soal berubah
+    remap_pg(ujian_id, uid_pg_lama, uid_pg_baru)
+
+    return PerubahanSoal(
+        ada=ada,
+        kunci=[uid for uid, kunci in kunci_baru.items() if uid in kunci_lama and kunci_lama[uid] != kunci],
+        set_pg=set(kunci_lama) != set(kunci_baru),
+        bobot=bobot_lama != bobot_baru,
+    )
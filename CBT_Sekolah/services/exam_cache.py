@@ -0,0 +1,144 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+from services.bank_soal import ambil_soal
+from services.versi_cache import sinkron_cache
+
+# ==================== CACHE SOAL UJIAN (IN-PROCESS LRU) ====================
+# Saat puluhan siswa membuka ujian yang sama di menit yang sama, query soal
+# dan penyusunan opsi jawaban cukup dilakukan sekali per versi soal.
+# Key cache = (ujian_id, token_cache, versi_soal). Setiap kali guru menyimpan
+# perubahan soal, versi_soal dinaikkan sehingga entri lama otomatis tidak terpakai
+# lagi. token_cache acak per ujian mencegah ujian baru yang mendapat id bekas
+# ujian terhapus (SQLite memakai ulang rowid) membaca soal ujian lama.
+# Ujian yang dihapus dibuang dari cache semua proses lewat sinkron_cache ('soal').
+
+OPSI_KODE = ['a', 'b', 'c', 'd', 'e']
+
+SoalSiap = namedtuple('SoalSiap', ['pg_db', 'essay_db', 'pg_tampil', 'essay_tampil',
+                                   'kunci_pg', 'total_bobot_essay'])
+
+
+def siapkan_soal(ujian):
+    pg_db, essay_db = ambil_soal(ujian.id)
+
+    # 1. Soal PG siap tampil (opsi tetap urut A-E, hanya opsi yang berisi teks/gambar)
+    pg_tampil = []
+    for idx, item in enumerate(pg_db):
+        opsi_list = []
+        for kode in OPSI_KODE:
+            if item.get(kode) or item.get(f'{kode}_gambar'):
+                opsi_list.append({
+                    'kode': kode.upper(),
+                    'teks': item.get(kode, ''),
+                    'gambar': item.get(f'{kode}_gambar', '')
+                })
+
+        pg_tampil.append({
+            'id': item.get('id'),          # PASSING ID
+            'original_index': idx,         # Fallback Index
+            'soal': item.get('soal', ''),
+            'gambar': item.get('gambar', ''),
+            'opsi_acak': opsi_list
+        })
+
+    # 2. Soal Essay siap tampil
+    essay_tampil = []
+    for idx, item in enumerate(essay_db):
+        essay_tampil.append({
+            'id': item.get('id'),          # PASSING ID
+            'original_index': idx,         # Fallback Index
+            'soal': item.get('soal', ''),
+            'gambar': item.get('gambar', ''),
+            'bobot': item.get('bobot', 0)
+        })
+
+    # 3. Data penilaian (kunci PG urut & total bobot essay) ikut disiapkan sekali
+    kunci_pg = tuple(item.get('kunci') for item in pg_db)
+    total_bobot_essay = sum(int(item.get('bobot', 0) or 0) for item in essay_db)
+
+    # Disimpan sebagai tuple agar tidak ada request yang mengubah isi cache secara tidak sengaja
+    return SoalSiap(tuple(pg_db), tuple(essay_db), tuple(pg_tampil), tuple(essay_tampil),
+                    kunci_pg, total_bobot_essay)
+
+
+class ExamCache:
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # Lock terpisah untuk proses build agar 75 siswa yang bersamaan
+        # tidak mem-parsing soal yang sama berkali-kali (thundering herd)
+        self._build_lock = threading.Lock()
+
+    def init_app(self, app):
+        sinkron_cache.daftar('soal', self.clear)
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def get(self, ujian):
+        key = (ujian.id, ujian.token_cache, ujian.versi_soal or 0)
+
+        entry = self._lookup(key)
+        if entry is not None:
+            with self._lock:
+                self.hits += 1
+            return entry
+
+        with self._build_lock:
+            # Cek ulang: mungkin thread lain sudah membangun entri ini
+            entry = self._lookup(key)
+            if entry is not None:
+                with self._lock:
+                    self.hits += 1
+                return entry
+
+            entry = siapkan_soal(ujian)
+            with self._lock:
+                self.misses += 1
+                # Buang versi lama dari ujian yang sama
+                for old_key in [k for k in self._data if k[0] == ujian.id]:
+                    del self._data[old_key]
+                self._data[key] = entry
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+            return entry
+
+    def invalidate(self, ujian_id):
+        with self._lock:
+            for old_key in [k for k in self._data if k[0] == ujian_id]:
+                del self._data[old_key]
+
+    def hapus(self, ujian_ids):
+        # Dipanggil SETELAH hapus ujian di-commit: buang lokal, lalu proses lain
+        # ikut mengosongkan cache soalnya lewat versi 'soal'
+        if not ujian_ids:
+            return
+        for ujian_id in ujian_ids:
+            self.invalidate(ujian_id)
+        sinkron_cache.naikkan('soal')
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+                'entries': len(self._data),
+                'maxsize': self.maxsize,
+            }
+
+
+exam_cache = ExamCache()
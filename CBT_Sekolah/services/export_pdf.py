@@ -0,0 +1,127 @@
+import io
+import multiprocessing
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from services.pool_proses import PoolProses
+from services.statistik import ringkas_durasi
+
+# ==================== EXPORT PDF HASIL MASSAL (PROCESS POOL -> ZIP) ====================
+# Dipakai job 'zip_pdf_hasil' di antrian pekerjaan:
+#   - HTML per siswa dirender di thread job (butuh DB + Jinja), konversi
+#     xhtml2pdf (bagian berat) dikerjakan process pool
+#   - PDF yang selesai lebih dulu langsung ditulis ke file ZIP di disk; yang
+#     sedang dikerjakan dibatasi 2x jumlah worker sehingga memori tidak
+#     bertambah walau satu angkatan 300+ siswa
+#   - worker yang mati mendadak (OOM, crash) merusak pool: siswa yang PDF-nya
+#     sedang dikerjakan dicatat di GAGAL.txt, pool diganti baru, export lanjut
+# Modul ini sengaja tidak meng-import xhtml2pdf: hanya proses worker yang memuatnya.
+
+
+def _html_ke_pdf(html):
+    from xhtml2pdf import pisa
+
+    output = io.BytesIO()
+    try:
+        status = pisa.CreatePDF(src=html, dest=output)
+    except Exception as e:
+        # Diganti ValueError biasa agar proses web tidak ikut memuat xhtml2pdf saat unpickle
+        raise ValueError(str(e)) from None
+    if status.err:
+        raise ValueError(f'{status.err} kesalahan xhtml2pdf')
+    return output.getvalue()
+
+
+class ExportPDF:
+    def __init__(self):
+        self.pool = PoolProses()
+        self._lock = threading.Lock()
+
+        self.arsip = 0
+        self.dokumen = 0
+        self.gagal = 0
+        self._per_dokumen = deque(maxlen=200)  # detik per PDF (rata-rata per arsip)
+
+    def init_app(self, app):
+        self.pool.workers = app.config.get('PDF_EXPORT_WORKERS') or max(multiprocessing.cpu_count() - 1, 1)
+
+    def tulis_zip(self, path, dokumen, total, laporan=None):
+        # dokumen: iterator (nama_file_di_zip, html). Mengembalikan ringkasan waktu.
+        mulai = time.perf_counter()
+        pool = self.pool.ambil()
+        berjalan = {}
+        gagal = []
+        selesai = 0
+        dokumen = iter(dokumen)
+        habis = False
+
+        with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as arsip:
+            while not habis or berjalan:
+                while not habis and len(berjalan) < self.pool.workers * 2:
+                    item = next(dokumen, None)
+                    if item is None:
+                        habis = True
+                        break
+                    nama, html = item
+                    try:
+                        future = pool.submit(_html_ke_pdf, html)
+                    except BrokenProcessPool:
+                        pool = self.pool.ganti(pool)
+                        future = pool.submit(_html_ke_pdf, html)
+                    berjalan[future] = nama
+                if not berjalan:
+                    break
+
+                beres, _ = wait(berjalan, return_when=FIRST_COMPLETED)
+                rusak = False
+                for future in beres:
+                    nama = berjalan.pop(future)
+                    try:
+                        arsip.writestr(nama, future.result())
+                    except ValueError as e:
+                        gagal.append(f'{nama}: {e}')
+                    except BrokenProcessPool:
+                        gagal.append(f'{nama}: proses konversi PDF berhenti mendadak')
+                        rusak = True
+                    selesai += 1
+                if rusak:
+                    pool = self.pool.ganti(pool)
+                if laporan:
+                    laporan(selesai, total)
+
+            if gagal:
+                arsip.writestr('GAGAL.txt', '\n'.join(gagal))
+
+        durasi = time.perf_counter() - mulai
+        with self._lock:
+            self.arsip += 1
+            self.dokumen += selesai - len(gagal)
+            self.gagal += len(gagal)
+            if selesai:
+                self._per_dokumen.append(durasi / selesai)
+        return {
+            'jumlah': selesai,
+            'gagal': gagal,
+            'detik_total': round(durasi, 2),
+            'detik_per_siswa': round(durasi / selesai, 3) if selesai else 0.0,
+            'workers': self.pool.workers,
+        }
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.pool.workers,
+                'pool_aktif': self.pool.aktif,
+                'arsip': self.arsip,
+                'dokumen': self.dokumen,
+                'gagal': self.gagal,
+                'pool_rusak': self.pool.rusak,
+                'detik_per_siswa': ringkas_durasi(self._per_dokumen, digit=3, p95=False),
+            }
+
+
+export_pdf = ExportPDF()
@@ -0,0 +1,125 @@
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures.process import BrokenProcessPool
+
+from services.pool_proses import PoolProses
+from services.statistik import ringkas_durasi
+
+# ==================== IMPOR SOAL PDF (PROCESS POOL) ====================
+# Dipakai job 'impor_pdf_soal' di antrian pekerjaan (services/antrian_pekerjaan.py):
+#   - jumlah halaman dihitung di worker, lalu halaman dibagi per blok
+#     (PDF_HALAMAN_PER_TUGAS) ke process pool
+#   - hasil dibaca berurutan dan baris teks dialirkan langsung ke parser (tanpa
+#     string full_text). Blok yang sedang dikerjakan dibatasi 2x jumlah worker
+#     agar memori tetap kecil
+#   - worker yang mati mendadak (PDF rusak yang membuat crash, OOM) merusak pool:
+#     pool diganti baru dan job gagal dengan pesan blok halaman yang bermasalah
+# Modul ini sengaja tidak meng-import models/pdfplumber: proses worker hanya
+# memuat pdfplumber, proses web tidak memuatnya sama sekali.
+
+
+def _hitung_halaman(path):
+    import pdfplumber
+
+    try:
+        with pdfplumber.open(path) as pdf:
+            return len(pdf.pages)
+    except Exception as e:
+        # Exception pdfplumber diganti ValueError biasa: membongkar (unpickle) kelas
+        # aslinya di proses web akan ikut memuat pdfplumber
+        raise ValueError(f'File PDF tidak bisa dibaca: {e}') from None
+
+
+def _ekstrak_halaman(path, awal, akhir):
+    # Halaman awal..akhir-1 (0-based); pdfplumber memakai nomor halaman 1-based
+    import pdfplumber
+
+    baris = []
+    try:
+        with pdfplumber.open(path, pages=list(range(awal + 1, akhir + 1))) as pdf:
+            for page in pdf.pages:
+                teks = page.extract_text()
+                if teks:
+                    baris.extend(line.strip() for line in teks.split('\n') if line.strip())
+                page.close()
+    except Exception as e:
+        raise ValueError(f'Halaman {awal + 1}-{akhir} PDF tidak bisa dibaca: {e}') from None
+    return baris
+
+
+class ImporPDF:
+    def __init__(self):
+        self.pool = PoolProses()
+        self.halaman_per_tugas = 4
+        self._lock = threading.Lock()
+
+        self.dokumen = 0
+        self.halaman = 0
+        self._durasi = deque(maxlen=200)
+
+    def init_app(self, app):
+        self.pool.workers = app.config.get('PDF_POOL_WORKERS') or max(multiprocessing.cpu_count() - 1, 1)
+        self.halaman_per_tugas = app.config.get('PDF_HALAMAN_PER_TUGAS', self.halaman_per_tugas)
+
+    def _kirim(self, pool, fungsi, *args):
+        try:
+            return pool.submit(fungsi, *args)
+        except BrokenProcessPool:
+            # Pool sudah dirusak job lain: ganti pool, job ini diulang antrian pekerjaan
+            self.pool.buang(pool)
+            raise
+
+    def _hasil(self, pool, future, bagian):
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            self.pool.buang(pool)
+            raise ValueError(f'{bagian} membuat proses pembaca PDF berhenti mendadak. '
+                             'Periksa / simpan ulang file PDF lalu impor lagi.') from None
+
+    def baris(self, path, laporan=None):
+        # Generator baris teks PDF berurutan; laporan(halaman_selesai, halaman_total) untuk progres
+        mulai = time.perf_counter()
+        pool = self.pool.ambil()
+        total = self._hasil(pool, self._kirim(pool, _hitung_halaman, path), 'File PDF')
+        if laporan:
+            laporan(0, total)
+
+        blok = [(awal, min(awal + self.halaman_per_tugas, total))
+                for awal in range(0, total, self.halaman_per_tugas)]
+        berjalan = deque()
+        try:
+            while blok or berjalan:
+                while blok and len(berjalan) < self.pool.workers * 2:
+                    awal, akhir = blok.pop(0)
+                    berjalan.append((awal, akhir, self._kirim(pool, _ekstrak_halaman, path, awal, akhir)))
+                awal, akhir, future = berjalan.popleft()
+                yield from self._hasil(pool, future, f'Halaman {awal + 1}-{akhir}')
+                if laporan:
+                    laporan(akhir, total)
+        finally:
+            # Parser / job berhenti lebih awal (error, blok lain gagal): blok yang
+            # belum dikerjakan dibatalkan agar tidak menahan proses pool
+            for _, _, future in berjalan:
+                future.cancel()
+
+        with self._lock:
+            self.dokumen += 1
+            self.halaman += total
+            self._durasi.append(time.perf_counter() - mulai)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.pool.workers,
+                'pool_aktif': self.pool.aktif,
+                'dokumen': self.dokumen,
+                'halaman': self.halaman,
+                'pool_rusak': self.pool.rusak,
+                'durasi_baca_detik': ringkas_durasi(self._durasi, p95=False),
+            }
+
+
+impor_pdf = ImporPDF()
@@ -0,0 +1,112 @@
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+
+from models import db, User, Kelas
+
+# ==================== IMPORT MASSAL SISWA / GURU DARI EXCEL ====================
+# Versi lama memproses baris satu per satu: 1 query cek username + 1 query cari
+# kelas + 1 hash password per baris (1.500 siswa = beberapa menit).
+# Di sini:
+#   - username & kelas yang sudah ada dimuat SEKALI ke set/dict
+#   - pembersihan NIS/NIP & validasi dilakukan per kolom dengan pandas
+#   - hash password default dijalankan paralel di process pool
+#   - INSERT dikirim per potongan (executemany)
+# Hasilnya laporan per baris (nomor baris Excel + alasan gagal). Mode dry-run
+# hanya memvalidasi tanpa hashing & tanpa menulis ke database.
+
+HasilImpor = namedtuple('HasilImpor', ['berhasil', 'gagal', 'laporan', 'dry_run'])
+
+UKURAN_POTONGAN = 500
+# Di bawah jumlah ini hashing serial lebih cepat daripada menyalakan process pool
+MIN_HASH_PARALEL = 50
+
+
+def bersihkan_kolom(series):
+    # NaN / 'nan' -> '', spasi dibuang, angka Excel "12345.0" -> "12345"
+    hasil = series.fillna('').astype(str).str.strip()
+    hasil = hasil.mask(hasil.str.lower() == 'nan', '')
+    return hasil.str.replace(r'\.0$', '', regex=True)
+
+
+def hash_massal(daftar_password):
+    # Server 1 CPU: process pool hanya menambah overhead -> hash serial
+    cpu = multiprocessing.cpu_count()
+    if cpu < 2 or len(daftar_password) < MIN_HASH_PARALEL:
+        return [generate_password_hash(p) for p in daftar_password]
+
+    workers = cpu - 1
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        chunksize = max(len(daftar_password) // (workers * 4), 1)
+        return list(pool.map(generate_password_hash, daftar_password, chunksize=chunksize))
+
+
+def _validasi(df, kolom_kode, pakai_kelas):
+    if kolom_kode not in df.columns or 'Nama' not in df.columns:
+        raise ValueError(f"Kolom wajib tidak ditemukan: {kolom_kode}, Nama")
+    if pakai_kelas and 'Kelas' not in df.columns:
+        raise ValueError("Kolom wajib tidak ditemukan: Kelas")
+
+    data = pd.DataFrame({
+        'baris': df.index + 2,  # baris 1 = header Excel
+        'username': bersihkan_kolom(df[kolom_kode]),
+        'nama': bersihkan_kolom(df['Nama']),
+    })
+    data['alasan'] = ''
+
+    # Username yang sudah ada dimuat sekali (username unik untuk semua role)
+    sudah_ada = {u for (u,) in db.session.query(User.username).all()}
+
+    if pakai_kelas:
+        peta_kelas = {nama: id for id, nama in db.session.query(Kelas.id, Kelas.nama_kelas).all()}
+        data['kelas'] = bersihkan_kolom(df['Kelas'])
+        data['kelas_id'] = data['kelas'].map(peta_kelas)
+
+    # Urutan pengecekan = prioritas alasan yang ditampilkan (alasan pertama yang menang)
+    aturan = [
+        ((data['username'] == '') | (data['nama'] == ''), f'{kolom_kode} / Nama kosong'),
+        (data['username'].isin(sudah_ada), f'{kolom_kode} sudah terdaftar'),
+        (data['username'].duplicated(keep='first') & (data['username'] != ''), f'{kolom_kode} ganda di file'),
+    ]
+    if pakai_kelas:
+        aturan.append((data['kelas_id'].isna(), 'Kelas tidak ditemukan'))
+
+    for mask, alasan in aturan:
+        data.loc[mask & (data['alasan'] == ''), 'alasan'] = alasan
+    return data
+
+
+def impor_user(df, role, dry_run=False):
+    kolom_kode = 'NIS' if role == 'siswa' else 'NIP'
+    pakai_kelas = role == 'siswa'
+    data = _validasi(df, kolom_kode, pakai_kelas)
+
+    valid = data[data['alasan'] == '']
+    laporan = [
+        {'baris': int(r.baris), 'username': r.username, 'nama': r.nama,
+         'status': 'OK' if not r.alasan else 'GAGAL', 'alasan': r.alasan}
+        for r in data.itertuples(index=False)
+    ]
+
+    if dry_run or valid.empty:
+        return HasilImpor(len(valid), len(data) - len(valid), laporan, dry_run)
+
+    # Password default = NIS / NIP
+    daftar_hash = hash_massal(valid['username'].tolist())
+
+    rows = []
+    for i, r in enumerate(valid.itertuples(index=False)):
+        row = {'username': r.username, 'password': daftar_hash[i], 'role': role, 'nama': r.nama}
+        if pakai_kelas:
+            row['kelas_id'] = int(r.kelas_id)
+        rows.append(row)
+
+    for i in range(0, len(rows), UKURAN_POTONGAN):
+        db.session.execute(insert(User), rows[i:i + UKURAN_POTONGAN])
+    db.session.commit()
+
+    return HasilImpor(len(valid), len(data) - len(valid), laporan, dry_run)
@@ -0,0 +1,86 @@
+import os
+from functools import wraps
+from urllib.parse import quote
+
+from flask import g, request, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy.engine import make_url
+
+# ==================== POOL KONEKSI BACA-SAJA (DASHBOARD & LAPORAN) ====================
+# Engine kedua ke file database yang sama, dibuka mode=ro + PRAGMA query_only,
+# dengan pool sendiri (Config.SQLITE_READ_POOL_SIZE). Route yang hanya membaca
+# (dashboard, tabel nilai, export, daftar siswa) memakai engine ini sehingga
+# laporan yang lama tidak menghabiskan pool koneksi milik submit siswa.
+# Cara pakai di route:
+#   @baca_saja              -> seluruh request GET/HEAD view tsb ke engine baca
+#   pakai_koneksi_baca()    -> mulai titik ini (setelah bagian POST yang menulis)
+# Flush (INSERT/UPDATE/DELETE) selalu tetap ke engine utama.
+# Modul ini tidak meng-import models (dipakai oleh models.py sebagai kelas session).
+
+BIND_BACA = 'baca'
+
+
+def url_baca(app):
+    # sqlite:///cbt.db -> sqlite:///file:/abs/instance/cbt.db?mode=ro&uri=true
+    # None jika database bukan file SQLite biasa (memory / URI khusus / DB lain)
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:') or url.query.get('uri'):
+        return None
+
+    # Path relatif mengikuti aturan Flask-SQLAlchemy (relatif ke folder instance)
+    path = url.database if os.path.isabs(url.database) else os.path.join(app.instance_path, url.database)
+    path = quote(os.path.abspath(path).replace(os.sep, '/'), safe='/:')
+    return url.set(database=f'file:{path}').update_query_dict({'mode': 'ro', 'uri': 'true'})
+
+
+def siapkan_bind_baca(app):
+    # Dipanggil SEBELUM db.init_app(app): engine baca didaftarkan sebagai bind 'baca'
+    if not app.config.get('SQLITE_READ_POOL'):
+        return
+    url = url_baca(app)
+    if url is None:
+        return
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    binds[BIND_BACA] = {
+        'url': url,
+        'pool_size': app.config.get('SQLITE_READ_POOL_SIZE', 10),
+        'max_overflow': app.config.get('SQLITE_READ_POOL_OVERFLOW', 10),
+    }
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+
+class SessionBacaTulis(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and has_app_context()
+                and g.get('koneksi_baca') and BIND_BACA in self._db.engines):
+            return self._db.engines[BIND_BACA]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def pakai_koneksi_baca():
+    g.koneksi_baca = True
+
+
+def baca_saja(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        # Hanya method yang aman; POST di view yang sama tetap ke engine utama
+        if request.method in ('GET', 'HEAD'):
+            pakai_koneksi_baca()
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def status_pool(engines):
+    hasil = {}
+    for key, engine in engines.items():
+        pool = engine.pool
+        if not hasattr(pool, 'checkedout'):
+            continue
+        hasil[key or 'utama'] = {
+            'ukuran': pool.size(),
+            'dipakai': pool.checkedout(),
+            'menganggur': pool.checkedin(),
+            'overflow': pool.overflow(),
+        }
+    return hasil
@@ -0,0 +1,76 @@
+from models import db, JawabanSiswa, JawabanEssay
+
+# ==================== LEMBAR JAWABAN RINGKAS ====================
+# Jawaban PG disimpan sebagai byte string lebar tetap: 1 byte per soal PG sesuai
+# urutan soal di tabel Soal (b'A'..b'E', b'-' = tidak dijawab). Ujian 50 soal
+# cukup 50 byte, dan penilaian cukup membandingkan byte ke-i dengan kunci ke-i
+# (lihat services/penilaian.py).
+# Jawaban essay disimpan per baris di tabel JawabanEssay (key = uid soal).
+
+KOSONG = b'-'
+PILIHAN_VALID = {'A', 'B', 'C', 'D', 'E'}
+
+
+def encode_pg(daftar_jawaban):
+    hasil = bytearray()
+    for jawaban in daftar_jawaban:
+        jawaban = (jawaban or '').strip().upper()
+        hasil += jawaban.encode('ascii') if jawaban in PILIHAN_VALID else KOSONG
+    return bytes(hasil)
+
+
+def decode_pg(kode, jumlah_soal):
+    kode = (kode or b'')[:jumlah_soal].ljust(jumlah_soal, KOSONG)
+    return [None if ch == KOSONG[0] else chr(ch) for ch in kode]
+
+
+# ==================== ESSAY ====================
+def simpan_essay(jawaban_siswa, isi_per_uid):
+    for soal_uid, teks in isi_per_uid.items():
+        db.session.add(JawabanEssay(lembar=jawaban_siswa, soal_uid=str(soal_uid), jawaban=teks or ''))
+
+
+def ambil_essay(jawaban_id):
+    rows = JawabanEssay.query.filter_by(jawaban_id=jawaban_id).all()
+    return {r.soal_uid: r for r in rows}
+
+
+def ambil_essay_massal(daftar_jawaban_id):
+    # Essay banyak lembar jawaban dalam satu query (export massal): {jawaban_id: {uid: row}}
+    hasil = {jawaban_id: {} for jawaban_id in daftar_jawaban_id}
+    for r in JawabanEssay.query.filter(JawabanEssay.jawaban_id.in_(daftar_jawaban_id)).all():
+        hasil[r.jawaban_id][r.soal_uid] = r
+    return hasil
+
+
+def essay_urut(jawaban_id, soal_essay, per_uid=None):
+    # List (teks, nilai) sesuai urutan soal essay, agar template cukup pakai index
+    if per_uid is None:
+        per_uid = ambil_essay(jawaban_id)
+    hasil = []
+    for s in soal_essay:
+        row = per_uid.get(str(s.get('id')))
+        hasil.append((row.jawaban if row else '', row.nilai if row else 0))
+    return hasil
+
+
+# ==================== REMAP SAAT URUTAN SOAL PG BERUBAH ====================
+def remap_pg(ujian_id, uid_lama, uid_baru):
+    # Posisi byte mengikuti urutan soal. Jika guru menambah/menghapus/mengurutkan
+    # ulang soal PG, jawaban yang sudah masuk dipetakan ulang berdasarkan uid soal.
+    if list(uid_lama) == list(uid_baru):
+        return 0
+
+    posisi_lama = {uid: i for i, uid in enumerate(uid_lama)}
+    peta = [posisi_lama.get(uid) for uid in uid_baru]
+
+    rows = (JawabanSiswa.query
+            .filter(JawabanSiswa.ujian_id == ujian_id, JawabanSiswa.jawaban_pg_kode.isnot(None))
+            .all())
+    for row in rows:
+        lama = row.jawaban_pg_kode
+        baru = bytearray()
+        for pos in peta:
+            baru += lama[pos:pos + 1] if pos is not None and pos < len(lama) else KOSONG
+        row.jawaban_pg_kode = bytes(baru)
+    return len(rows)
@@ -0,0 +1,254 @@
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, abort, g, has_request_context, request
+from sqlalchemy import event
+
+from services.koneksi_baca import status_pool
+from services.sqlite_tuning import checkpoint_wal
+
+# ==================== METRIK PROMETHEUS (/metrics) ====================
+# Opsional (METRICS=1). Dikumpulkan lewat hook before/after/teardown request
+# Flask dan event engine SQLAlchemy, disajikan dalam format teks Prometheus:
+#   cbt_http_requests_total / cbt_http_request_duration_seconds  per blueprint & endpoint
+#   cbt_http_requests_in_flight vs cbt_http_threads               pemakaian thread waitress
+#   cbt_sql_queries_per_request, cbt_sql_queries_total, cbt_sql_seconds_total
+#   cbt_sql_write_duration_seconds  INSERT/UPDATE/DELETE, termasuk waktu menunggu
+#                                   lock writer (busy_timeout)
+#   cbt_sqlite_locked_total         busy_timeout habis ("database is locked")
+#   cbt_submit_total                lembar jawaban per ujian & status
+# Angka per proses: pada jalankan_multi.py setiap worker punya metriknya sendiri
+# (lihat label pid di cbt_process_info). Hanya alamat di METRICS_ALLOW yang boleh
+# mengakses /metrics.
+
+BUCKET_DURASI = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKET_JUMLAH_QUERY = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+STATEMENT_TULIS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def _escape(nilai):
+    return str(nilai).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label(nama_label, nilai):
+    if not nama_label:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in zip(nama_label, nilai)) + '}'
+
+
+def _angka(nilai):
+    if nilai == float('inf'):
+        return '+Inf'
+    return repr(float(nilai)) if isinstance(nilai, float) else str(nilai)
+
+
+class Counter:
+    jenis = 'counter'
+
+    def __init__(self, nama, bantuan, label=()):
+        self.nama = nama
+        self.bantuan = bantuan
+        self.label = label
+        self._nilai = {}
+
+    def tambah(self, *nilai_label, jumlah=1):
+        self._nilai[nilai_label] = self._nilai.get(nilai_label, 0) + jumlah
+
+    def render(self):
+        baris = [f'# HELP {self.nama} {self.bantuan}', f'# TYPE {self.nama} {self.jenis}']
+        for kunci, nilai in sorted(self._nilai.items()):
+            baris.append(f'{self.nama}{_label(self.label, kunci)} {_angka(nilai)}')
+        return baris
+
+
+class Gauge(Counter):
+    jenis = 'gauge'
+
+
+class Histogram:
+    def __init__(self, nama, bantuan, label=(), bucket=BUCKET_DURASI):
+        self.nama = nama
+        self.bantuan = bantuan
+        self.label = label
+        self.bucket = tuple(bucket)
+        self._nilai = {}  # label -> [hitungan per bucket (+Inf di akhir), jumlah, total]
+
+    def amati(self, nilai, *nilai_label):
+        data = self._nilai.get(nilai_label)
+        if data is None:
+            data = self._nilai[nilai_label] = [[0] * (len(self.bucket) + 1), 0.0, 0]
+        data[0][bisect_left(self.bucket, nilai)] += 1
+        data[1] += nilai
+        data[2] += 1
+
+    def render(self):
+        baris = [f'# HELP {self.nama} {self.bantuan}', f'# TYPE {self.nama} histogram']
+        for kunci, (hitungan, jumlah, total) in sorted(self._nilai.items()):
+            kumulatif = 0
+            for batas, n in zip(self.bucket + (float('inf'),), hitungan):
+                kumulatif += n
+                label = _label(self.label + ('le',), kunci + (_angka(float(batas)),))
+                baris.append(f'{self.nama}_bucket{label} {kumulatif}')
+            label = _label(self.label, kunci)
+            baris.append(f'{self.nama}_sum{label} {_angka(jumlah)}')
+            baris.append(f'{self.nama}_count{label} {total}')
+        return baris
+
+
+class Metrik:
+    def __init__(self):
+        self.aktif = False
+        self.app = None
+        self.threads = 0
+        self.izin = set()
+        self._lock = threading.Lock()
+        self.dalam_proses = 0
+        self.dalam_proses_puncak = 0
+
+        self.request_total = Counter('cbt_http_requests_total', 'Jumlah request HTTP',
+                                     ('blueprint', 'endpoint', 'method', 'status'))
+        self.durasi_request = Histogram('cbt_http_request_duration_seconds', 'Latensi request HTTP',
+                                        ('blueprint', 'endpoint'))
+        self.query_per_request = Histogram('cbt_sql_queries_per_request', 'Jumlah query SQL per request',
+                                           ('endpoint',), BUCKET_JUMLAH_QUERY)
+        self.query_total = Counter('cbt_sql_queries_total', 'Jumlah query SQL', ('endpoint',))
+        self.query_detik = Counter('cbt_sql_seconds_total', 'Total waktu eksekusi query SQL', ('endpoint',))
+        self.durasi_tulis = Histogram('cbt_sql_write_duration_seconds',
+                                      'Durasi statement tulis, termasuk menunggu lock writer SQLite')
+        self.terkunci = Counter('cbt_sqlite_locked_total', 'Query gagal karena busy_timeout habis (database is locked)')
+        self.submit = Counter('cbt_submit_total', 'Lembar jawaban yang dikirim siswa', ('ujian_id', 'status'))
+
+    def init_app(self, app, db):
+        self.aktif = app.config.get('METRICS', False)
+        if not self.aktif:
+            return
+        self.app = app
+        self.db = db
+        self.threads = app.config.get('SERVER_THREADS', 0)
+        self.izin = {a.strip() for a in str(app.config.get('METRICS_ALLOW', '')).split(',') if a.strip()}
+
+        app.before_request(self._mulai_request)
+        app.after_request(self._catat_status)
+        app.teardown_request(self._selesai_request)
+        app.add_url_rule('/metrics', 'metrics', self.halaman)
+
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', self._sebelum_query)
+                event.listen(engine, 'after_cursor_execute', self._setelah_query)
+                event.listen(engine, 'handle_error', self._query_error)
+
+    # ==================== HOOK REQUEST ====================
+    def _mulai_request(self):
+        g._metrik = [time.perf_counter(), 0, 500]  # mulai, jumlah query, status
+        with self._lock:
+            self.dalam_proses += 1
+            self.dalam_proses_puncak = max(self.dalam_proses_puncak, self.dalam_proses)
+
+    def _catat_status(self, response):
+        data = g.get('_metrik')
+        if data is not None:
+            data[2] = response.status_code
+        return response
+
+    def _selesai_request(self, exc=None):
+        data = g.pop('_metrik', None)
+        if data is None:
+            return
+        durasi = time.perf_counter() - data[0]
+        blueprint = request.blueprint or 'app'
+        endpoint = request.endpoint or 'tidak_dikenal'
+        status = 500 if exc is not None else data[2]
+        with self._lock:
+            self.dalam_proses -= 1
+            self.request_total.tambah(blueprint, endpoint, request.method, status)
+            self.durasi_request.amati(durasi, blueprint, endpoint)
+            self.query_per_request.amati(data[1], endpoint)
+
+    # ==================== EVENT ENGINE SQLALCHEMY ====================
+    def _sebelum_query(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_metrik_mulai', []).append(time.perf_counter())
+
+    def _setelah_query(self, conn, cursor, statement, parameters, context, executemany):
+        daftar = conn.info.get('_metrik_mulai')
+        if not daftar:
+            return
+        durasi = time.perf_counter() - daftar.pop()
+        endpoint = 'background'
+        if has_request_context():
+            endpoint = request.endpoint or 'tidak_dikenal'
+            data = g.get('_metrik')
+            if data is not None:
+                data[1] += 1
+        tulis = statement.lstrip()[:7].upper().startswith(STATEMENT_TULIS)
+        with self._lock:
+            self.query_total.tambah(endpoint)
+            self.query_detik.tambah(endpoint, jumlah=durasi)
+            if tulis:
+                self.durasi_tulis.amati(durasi)
+
+    def _query_error(self, konteks):
+        daftar = konteks.connection.info.get('_metrik_mulai') if konteks.connection is not None else None
+        if daftar:
+            daftar.pop()
+        asli = konteks.original_exception
+        if isinstance(asli, sqlite3.OperationalError) and ('locked' in str(asli) or 'busy' in str(asli)):
+            with self._lock:
+                self.terkunci.tambah()
+
+    # ==================== SUBMIT ====================
+    def catat_submit(self, ujian_id, status):
+        if not self.aktif:
+            return
+        with self._lock:
+            self.submit.tambah(ujian_id, status)
+
+    # ==================== HALAMAN /metrics ====================
+    def _statistik_db(self):
+        pool = Gauge('cbt_db_pool_connections', 'Koneksi di pool SQLAlchemy', ('pool', 'keadaan'))
+        for nama, data in status_pool(self.db.engines).items():
+            pool.tambah(nama, 'dipakai', jumlah=data['dipakai'])
+            pool.tambah(nama, 'menganggur', jumlah=data['menganggur'])
+        wal = checkpoint_wal.stats()
+        baris = pool.render()
+        baris += ['# HELP cbt_sqlite_wal_bytes Ukuran file -wal saat ini',
+                  '# TYPE cbt_sqlite_wal_bytes gauge',
+                  f"cbt_sqlite_wal_bytes {wal['wal_bytes']}",
+                  '# HELP cbt_sqlite_checkpoint_total Checkpoint PASSIVE yang dijalankan proses ini',
+                  '# TYPE cbt_sqlite_checkpoint_total counter',
+                  f"cbt_sqlite_checkpoint_total {wal['checkpoint']}"]
+        return baris
+
+    def render(self):
+        with self._lock:
+            baris = [
+                '# HELP cbt_process_info Proses server yang menjawab scrape ini',
+                '# TYPE cbt_process_info gauge',
+                f"cbt_process_info{_label(('pid', 'profil'), (os.getpid(), self.app.config.get('CBT_PROFILE')))} 1",
+                '# HELP cbt_http_requests_in_flight Request yang sedang diproses',
+                '# TYPE cbt_http_requests_in_flight gauge',
+                f'cbt_http_requests_in_flight {self.dalam_proses}',
+                '# HELP cbt_http_requests_in_flight_max Puncak request bersamaan sejak start',
+                '# TYPE cbt_http_requests_in_flight_max gauge',
+                f'cbt_http_requests_in_flight_max {self.dalam_proses_puncak}',
+                '# HELP cbt_http_threads Jumlah thread waitress (SERVER_THREADS)',
+                '# TYPE cbt_http_threads gauge',
+                f'cbt_http_threads {self.threads}',
+            ]
+            for metrik in (self.request_total, self.durasi_request, self.query_per_request,
+                           self.query_total, self.query_detik, self.durasi_tulis,
+                           self.terkunci, self.submit):
+                baris += metrik.render()
+        baris += self._statistik_db()
+        return '\n'.join(baris) + '\n'
+
+    def halaman(self):
+        if self.izin and request.remote_addr not in self.izin:
+            abort(404)
+        return Response(self.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+metrik = Metrik()
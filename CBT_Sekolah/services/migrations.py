@@ -0,0 +1,220 @@
+import json
+
+from sqlalchemy import text, or_, update, delete, insert
+
+from models import db, Ujian, Soal, JawabanSiswa, JawabanEssay, Kelas, UjianKelas
+from services.bank_soal import simpan_soal, ambil_soal, ambil_kunci
+from services.lembar_jawaban import encode_pg
+from services.penilaian import nilai_pg_massal
+
+# ==================== MIGRASI SKEMA SEDERHANA (SQLITE) ====================
+# db.create_all() hanya membuat tabel yang belum ada, tidak menambah kolom baru
+# ke tabel lama. Daftar di bawah menambahkan kolom yang belum ada pada file
+# cbt.db lama agar aplikasi tetap jalan tanpa harus menghapus database.
+
+KOLOM_BARU = [
+    # (tabel, kolom, definisi DDL)
+    ('ujian', 'versi_soal', 'INTEGER NOT NULL DEFAULT 1'),
+    ('jawaban_siswa', 'jawaban_pg_kode', 'BLOB'),
+    ('jawaban_siswa', 'jml_benar_pg', 'INTEGER'),
+    ('jawaban_siswa', 'total_soal_pg', 'INTEGER'),
+    ('ujian', 'versi_nilai', 'INTEGER NOT NULL DEFAULT 0'),
+    ('jawaban_siswa', 'versi_nilai', 'INTEGER DEFAULT 0'),
+    ('ujian', 'token_cache', 'VARCHAR(32)'),
+]
+
+
+def _kolom_tabel(conn, tabel):
+    rows = conn.execute(text(f'PRAGMA table_info("{tabel}")')).fetchall()
+    return {row[1] for row in rows}
+
+
+def tambah_kolom_baru():
+    with db.engine.begin() as conn:
+        cache_kolom = {}
+        for tabel, kolom, ddl in KOLOM_BARU:
+            if tabel not in cache_kolom:
+                cache_kolom[tabel] = _kolom_tabel(conn, tabel)
+            if kolom not in cache_kolom[tabel]:
+                conn.execute(text(f'ALTER TABLE "{tabel}" ADD COLUMN "{kolom}" {ddl}'))
+                cache_kolom[tabel].add(kolom)
+                print(f"Migrasi: kolom {tabel}.{kolom} ditambahkan")
+
+
+def _load_json_list(raw):
+    try:
+        data = json.loads(raw) if raw else []
+    except json.JSONDecodeError:
+        data = []
+    return data if isinstance(data, list) else []
+
+
+def _load_json_dict(raw):
+    try:
+        data = json.loads(raw) if raw else {}
+    except json.JSONDecodeError:
+        data = {}
+    return data if isinstance(data, dict) else {}
+
+
+# ==================== MIGRASI DATA: JSON SOAL -> TABEL SOAL ====================
+def migrasi_soal_json():
+    # One-shot: ujian yang masih punya blob soal_pg/soal_essay dipindah ke tabel Soal,
+    # lalu blob-nya dikosongkan agar tidak dimigrasi ulang.
+    daftar_ujian = Ujian.query.filter(or_(Ujian.soal_pg.isnot(None), Ujian.soal_essay.isnot(None))).all()
+    if not daftar_ujian:
+        return
+
+    jumlah = 0
+    for ujian in daftar_ujian:
+        if not Soal.query.filter_by(ujian_id=ujian.id).first():
+            simpan_soal(ujian.id, _load_json_list(ujian.soal_pg), _load_json_list(ujian.soal_essay))
+            jumlah += 1
+        ujian.soal_pg = None
+        ujian.soal_essay = None
+
+    db.session.commit()
+    print(f"Migrasi: soal {jumlah} ujian dipindah dari JSON ke tabel Soal")
+
+
+# ==================== MIGRASI DATA: JSON JAWABAN -> JAWABAN RINGKAS ====================
+def _cari_jawaban(peta, soal_id, idx):
+    # Ambiguitas lama (key uid vs key index string) diselesaikan sekali di sini
+    jawaban = peta.get(soal_id)
+    if jawaban is None:
+        jawaban = peta.get(str(idx))
+    return jawaban
+
+
+def migrasi_jawaban_json():
+    daftar_jawaban = JawabanSiswa.query.filter(
+        JawabanSiswa.jawaban_pg_kode.is_(None),
+        or_(JawabanSiswa.jawaban_pg.isnot(None), JawabanSiswa.jawaban_essay.isnot(None))
+    ).all()
+    if not daftar_jawaban:
+        return
+
+    soal_per_ujian = {}
+    for jwb in daftar_jawaban:
+        if jwb.ujian_id not in soal_per_ujian:
+            pg_list, essay_list = ambil_soal(jwb.ujian_id)
+            soal_per_ujian[jwb.ujian_id] = ([s['id'] for s in pg_list], [s['id'] for s in essay_list])
+        uid_pg, uid_essay = soal_per_ujian[jwb.ujian_id]
+
+        peta_pg = _load_json_dict(jwb.jawaban_pg)
+        jwb.jawaban_pg_kode = encode_pg([_cari_jawaban(peta_pg, uid, i) for i, uid in enumerate(uid_pg)])
+
+        peta_essay = _load_json_dict(jwb.jawaban_essay)
+        for i, uid in enumerate(uid_essay):
+            db.session.add(JawabanEssay(
+                jawaban_id=jwb.id,
+                soal_uid=uid,
+                jawaban=_cari_jawaban(peta_essay, uid, i) or ''
+            ))
+
+        jwb.jawaban_pg = None
+        jwb.jawaban_essay = None
+
+    db.session.commit()
+    print(f"Migrasi: {len(daftar_jawaban)} lembar jawaban dikonversi ke format ringkas")
+
+
+# ==================== BACKFILL: JUMLAH BENAR PG ====================
+def isi_jml_benar_pg():
+    # Lembar jawaban lama belum punya jml_benar_pg/total_soal_pg -> hitung sekali.
+    # Nilai (nilai_pg/total_nilai) tidak diubah.
+    daftar_ujian_id = [row[0] for row in (db.session.query(JawabanSiswa.ujian_id)
+                                          .filter(JawabanSiswa.total_soal_pg.is_(None))
+                                          .distinct()
+                                          .all())]
+    if not daftar_ujian_id:
+        return
+
+    for ujian_id in daftar_ujian_id:
+        daftar_kunci = [kunci for _, kunci in ambil_kunci(ujian_id)]
+        rows = (db.session.query(JawabanSiswa.id, JawabanSiswa.jawaban_pg_kode)
+                .filter(JawabanSiswa.ujian_id == ujian_id, JawabanSiswa.total_soal_pg.is_(None))
+                .all())
+        hasil = nilai_pg_massal([r.jawaban_pg_kode for r in rows], daftar_kunci, 0)
+        db.session.execute(update(JawabanSiswa), [
+            {'id': r.id, 'jml_benar_pg': int(hasil.jml_benar[i]), 'total_soal_pg': hasil.total_soal}
+            for i, r in enumerate(rows)
+        ])
+
+    db.session.commit()
+    print(f"Migrasi: jumlah benar PG diisi untuk {len(daftar_ujian_id)} ujian")
+
+
+# ==================== BACKFILL: TARGET KELAS UJIAN ====================
+def isi_kelas_ujian():
+    # One-shot saat tabel UjianKelas baru dibuat: ujian lama dulu tampil untuk
+    # semua siswa -> ditujukan ke semua kelas yang ada agar perilakunya tetap sama.
+    # (Setelah itu ujian tanpa target = semua kelasnya sudah dihapus, jangan diisi ulang.)
+    if db.session.query(UjianKelas.id).first() is not None:
+        return
+    tanpa_target = Ujian.query.all()
+    semua_kelas = [kelas_id for (kelas_id,) in db.session.query(Kelas.id).all()]
+    if not tanpa_target or not semua_kelas:
+        return
+
+    db.session.execute(insert(UjianKelas), [
+        {'ujian_id': u.id, 'kelas_id': kelas_id, 'waktu_mulai': u.waktu_mulai, 'waktu_selesai': u.waktu_selesai}
+        for u in tanpa_target for kelas_id in semua_kelas
+    ])
+    db.session.commit()
+    print(f"Migrasi: {len(tanpa_target)} ujian lama ditujukan ke {len(semua_kelas)} kelas")
+
+
+# ==================== INDEKS UNTUK QUERY UTAMA ====================
+def hapus_jawaban_ganda():
+    # Sebelum indeks unik (siswa_id, ujian_id) dibuat: jika ada lembar ganda akibat
+    # double submit di versi lama, simpan lembar PERTAMA (id terkecil), hapus sisanya.
+    with db.engine.begin() as conn:
+        ganda = conn.execute(text(
+            'SELECT id FROM jawaban_siswa WHERE id NOT IN '
+            '(SELECT MIN(id) FROM jawaban_siswa GROUP BY siswa_id, ujian_id)'
+        )).scalars().all()
+        if not ganda:
+            return
+        for i in range(0, len(ganda), 500):
+            potongan = ganda[i:i + 500]
+            conn.execute(delete(JawabanEssay).where(JawabanEssay.jawaban_id.in_(potongan)))
+            conn.execute(delete(JawabanSiswa).where(JawabanSiswa.id.in_(potongan)))
+    print(f"Migrasi: {len(ganda)} lembar jawaban ganda dihapus")
+
+
+def buat_indeks():
+    # db.create_all() tidak menambah indeks ke tabel yang sudah ada. Semua indeks
+    # yang dideklarasikan di models.py dibuat di sini jika belum ada (cek per nama).
+    with db.engine.begin() as conn:
+        sudah_ada = set(conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars())
+
+    if 'uq_jawaban_siswa_ujian' not in sudah_ada:
+        hapus_jawaban_ganda()
+
+    with db.engine.begin() as conn:
+        for tabel in db.metadata.sorted_tables:
+            for indeks in tabel.indexes:
+                if indeks.name not in sudah_ada:
+                    indeks.create(conn)
+                    print(f"Migrasi: indeks {indeks.name} dibuat")
+
+
+def isi_token_cache():
+    # Ujian lama (sebelum kolom token_cache ada) diberi token acak
+    with db.engine.begin() as conn:
+        jumlah = conn.execute(text(
+            'UPDATE ujian SET token_cache = lower(hex(randomblob(16))) WHERE token_cache IS NULL'
+        )).rowcount
+    if jumlah:
+        print(f"Migrasi: token cache diisi untuk {jumlah} ujian")
+
+
+def upgrade_schema():
+    tambah_kolom_baru()
+    isi_token_cache()
+    buat_indeks()
+    migrasi_soal_json()
+    migrasi_jawaban_json()
+    isi_jml_benar_pg()
+    isi_kelas_ujian()
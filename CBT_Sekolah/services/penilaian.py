@@ -0,0 +1,103 @@
+from collections import namedtuple
+
+import numpy as np
+from sqlalchemy import update
+
+from models import db, JawabanSiswa
+from services.lembar_jawaban import KOSONG
+from services.tabel_nilai import naikkan_versi_nilai
+
+# ==================== MESIN PENILAIAN PG (VEKTORISASI NUMPY) ====================
+# Semua jalur penilaian (submit siswa, koreksi, lihat nilai, refresh tabel,
+# hitung ulang setelah edit, PDF hasil) memakai modul ini agar rumusnya satu:
+#   max_score_pg = 100 - total bobot essay (minimal 0)
+#   nilai_pg     = (jumlah benar / jumlah soal PG) * max_score_pg
+# Jawaban semua siswa disusun menjadi matriks uint8 (siswa x soal) lalu
+# dibandingkan sekaligus dengan vektor kunci dalam satu operasi.
+
+HasilPenilaian = namedtuple('HasilPenilaian', ['jml_benar', 'nilai_pg', 'total_soal', 'max_score_pg'])
+
+
+def max_score_pg(total_bobot_essay):
+    return max(100 - int(total_bobot_essay or 0), 0)
+
+
+def vektor_kunci(daftar_kunci):
+    # Soal tanpa kunci diberi nilai 0 agar tidak pernah cocok dengan jawaban apa pun
+    return np.array([ord(k[0].upper()) if k else 0 for k in daftar_kunci], dtype=np.uint8)
+
+
+def matriks_jawaban(daftar_kode, jumlah_soal):
+    if not daftar_kode or jumlah_soal == 0:
+        return np.empty((len(daftar_kode), jumlah_soal), dtype=np.uint8)
+
+    # Samakan panjang tiap baris (potong/isi '-') lalu gabung jadi satu buffer
+    buffer = b''.join((kode or b'')[:jumlah_soal].ljust(jumlah_soal, KOSONG) for kode in daftar_kode)
+    return np.frombuffer(buffer, dtype=np.uint8).reshape(len(daftar_kode), jumlah_soal)
+
+
+def nilai_pg_massal(daftar_kode, daftar_kunci, total_bobot_essay):
+    jumlah_soal = len(daftar_kunci)
+    max_pg = max_score_pg(total_bobot_essay)
+
+    if jumlah_soal == 0:
+        nol = np.zeros(len(daftar_kode))
+        return HasilPenilaian(nol.astype(np.int64), nol, 0, max_pg)
+
+    matriks = matriks_jawaban(daftar_kode, jumlah_soal)
+    jml_benar = (matriks == vektor_kunci(daftar_kunci)).sum(axis=1)
+    nilai_pg = np.round(jml_benar / jumlah_soal * max_pg, 2)
+    return HasilPenilaian(jml_benar, nilai_pg, jumlah_soal, max_pg)
+
+
+def nilai_pg_satu(kode, daftar_kunci, total_bobot_essay):
+    hasil = nilai_pg_massal([kode], daftar_kunci, total_bobot_essay)
+    return int(hasil.jml_benar[0]), float(hasil.nilai_pg[0])
+
+
+# ==================== HITUNG ULANG SATU UJIAN ====================
+def _beda(baru, lama):
+    # Nilai tersimpan NULL (belum pernah dinilai) selalu dianggap berbeda
+    lama = np.array([np.nan if v is None else v for v in lama], dtype=float)
+    return np.isnan(lama) | (np.abs(baru - lama) > 1e-9)
+
+
+def hitung_ulang_ujian(ujian_id, daftar_kunci, total_bobot_essay):
+    # Hanya kolom yang dibutuhkan yang diambil; nilai baru dibandingkan dengan
+    # nilai tersimpan dan hanya baris yang berubah yang ditulis (satu bulk UPDATE
+    # berdasarkan primary key, tanpa memuat objek ORM per baris). Ganti kunci satu
+    # soal hanya menyentuh siswa yang jawabannya di soal itu berubah benar/salah.
+    rows = (db.session.query(JawabanSiswa.id, JawabanSiswa.jawaban_pg_kode, JawabanSiswa.nilai_essay,
+                             JawabanSiswa.jml_benar_pg, JawabanSiswa.total_soal_pg,
+                             JawabanSiswa.nilai_pg, JawabanSiswa.total_nilai)
+            .filter(JawabanSiswa.ujian_id == ujian_id)
+            .all())
+    if not rows:
+        return 0
+
+    hasil = nilai_pg_massal([r.jawaban_pg_kode for r in rows], daftar_kunci, total_bobot_essay)
+    nilai_essay = np.array([r.nilai_essay or 0 for r in rows], dtype=float)
+    total = hasil.nilai_pg + nilai_essay
+
+    berubah = (_beda(hasil.jml_benar, [r.jml_benar_pg for r in rows])
+               | _beda(np.full(len(rows), hasil.total_soal), [r.total_soal_pg for r in rows])
+               | _beda(hasil.nilai_pg, [r.nilai_pg for r in rows])
+               | _beda(total, [r.total_nilai for r in rows]))
+    indeks = np.flatnonzero(berubah)
+    if len(indeks) == 0:
+        return 0
+
+    # Versi nilai hanya naik jika ada baris yang berubah (tabel nilai guru tidak di-refresh percuma)
+    versi = naikkan_versi_nilai(ujian_id)
+    db.session.execute(update(JawabanSiswa), [
+        {
+            'id': rows[i].id,
+            'jml_benar_pg': int(hasil.jml_benar[i]),
+            'total_soal_pg': hasil.total_soal,
+            'nilai_pg': float(hasil.nilai_pg[i]),
+            'total_nilai': float(total[i]),
+            'versi_nilai': versi
+        }
+        for i in indeks
+    ])
+    return len(indeks)
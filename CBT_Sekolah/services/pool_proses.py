@@ -0,0 +1,44 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# ==================== PROCESS POOL BERSAMA (SPAWN, DIBUAT SAAT DIPAKAI) ====================
+# Dipakai verifikasi password, impor PDF, dan export PDF:
+#   - pool baru dibuat saat pertama dipakai (bukan saat import / start server)
+#   - spawn: aman dipakai di proses yang sudah punya banyak thread (dan sama di Windows)
+#   - worker yang mati mendadak (OOM killer, crash) membuat pool rusak
+#     (BrokenProcessPool): pemanggil melepasnya lewat buang(), pemakaian
+#     berikutnya otomatis membuat pool baru
+
+
+class PoolProses:
+    def __init__(self, workers=1):
+        self.workers = workers
+        self.rusak = 0
+
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def aktif(self):
+        return self._pool is not None
+
+    def ambil(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def buang(self, pool):
+        # Banyak future bisa melaporkan pool rusak yang sama: hanya yang pertama melepasnya
+        with self._lock:
+            if self._pool is not pool:
+                return
+            self._pool = None
+            self.rusak += 1
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def ganti(self, pool):
+        self.buang(pool)
+        return self.ambil()
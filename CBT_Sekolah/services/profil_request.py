@@ -0,0 +1,209 @@
+import cProfile
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from flask import g, request
+from flask_login import current_user
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# ==================== PROFILER PER REQUEST + DETEKSI N+1 ====================
+# Diaktifkan per request oleh ADMIN yang sudah login, tanpa restart server:
+#   header  X-CBT-Profil: 1          atau  ?_profil=1         -> catat semua query SQL
+#   header  X-CBT-Profil: cprofile   atau  ?_profil=cprofile  -> + dump cProfile (.prof)
+# Setiap query dicatat beserta durasi dan baris kode aplikasi yang memicunya.
+# Statement identik dari call site yang sama >= PROFILER_N1_MIN kali ditandai
+# sebagai kandidat N+1 (pola lazy load per baris, misal j.siswa.kelas di loop).
+# Hasil ditulis ke PROFILER_DIR (default instance/profiles) sebagai JSON; nama
+# file dikirim balik di header respons X-CBT-Profil.
+# Baca dump cProfile: python -m pstats instance/profiles/<nama>.prof
+
+BATAS_QUERY = 2000  # query yang dicatat per request (sisanya hanya dihitung)
+
+
+class ProfilRequest:
+    def __init__(self):
+        self.aktif = False
+        self.folder = None
+        self.ambang_n1 = 3
+        self.root = None
+        self._lock = threading.Lock()
+        self.jumlah = 0
+        self.terakhir = None
+
+    def init_app(self, app, db):
+        self.aktif = app.config.get('PROFILER', False)
+        if not self.aktif:
+            return
+        self.folder = app.config.get('PROFILER_DIR') or os.path.join(app.instance_path, 'profiles')
+        self.ambang_n1 = app.config.get('PROFILER_N1_MIN', self.ambang_n1)
+        self.root = os.path.abspath(app.root_path)
+
+        app.before_request(self._mulai)
+        app.after_request(self._catat_status)
+        app.teardown_request(self._selesai)
+
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', self._sebelum_query)
+                event.listen(engine, 'after_cursor_execute', self._setelah_query)
+
+    # ==================== HOOK REQUEST ====================
+    def _mode(self):
+        mode = request.headers.get('X-CBT-Profil') or request.args.get('_profil')
+        if mode not in ('1', 'cprofile'):
+            return None
+        # Hanya admin; user lain tidak bisa memicu penulisan file di server
+        if not current_user.is_authenticated or current_user.role != 'admin':
+            return None
+        return mode
+
+    def _mulai(self):
+        mode = self._mode()
+        if mode is None:
+            return
+        endpoint = (request.endpoint or 'tidak_dikenal').replace('.', '_')
+        data = {
+            'nama': f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{endpoint}",
+            'mulai': time.perf_counter(),
+            'query': [],
+            'jumlah_query': 0,
+            'status': 500,
+            'profiler': None,
+        }
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                data['profiler'] = profiler
+            except ValueError:
+                # Profiler lain sedang aktif di proses ini
+                logger.warning('cProfile tidak bisa diaktifkan untuk %s', request.path)
+        g._profil = data
+
+    def _catat_status(self, response):
+        data = g.get('_profil')
+        if data is not None:
+            data['status'] = response.status_code
+            response.headers['X-CBT-Profil'] = data['nama'] + '.json'
+        return response
+
+    def _selesai(self, exc=None):
+        # teardown: tetap jalan walau view error (status 500), profiler selalu dimatikan
+        data = g.pop('_profil', None)
+        if data is None:
+            return
+        profiler = data['profiler']
+        if profiler is not None:
+            profiler.disable()
+        durasi = time.perf_counter() - data['mulai']
+
+        try:
+            self._tulis(data, durasi)
+        except Exception:
+            logger.exception('Profiler: gagal menulis hasil %s', request.path)
+
+    # ==================== EVENT ENGINE SQLALCHEMY ====================
+    def _sebelum_query(self, conn, cursor, statement, parameters, context, executemany):
+        if g and g.get('_profil') is not None:
+            conn.info.setdefault('_profil_mulai', []).append(time.perf_counter())
+
+    def _setelah_query(self, conn, cursor, statement, parameters, context, executemany):
+        data = g.get('_profil') if g else None
+        daftar = conn.info.get('_profil_mulai')
+        if data is None or not daftar:
+            return
+        durasi = time.perf_counter() - daftar.pop()
+        data['jumlah_query'] += 1
+        if len(data['query']) < BATAS_QUERY:
+            data['query'].append({
+                'sql': statement,
+                'parameter': repr(parameters)[:200],
+                'durasi_ms': round(durasi * 1000, 3),
+                'asal': self._call_site(),
+            })
+
+    def _call_site(self):
+        # Frame pertama di kode aplikasi (bukan SQLAlchemy/Flask/Jinja, bukan modul ini)
+        frame = sys._getframe(2)
+        while frame is not None:
+            nama_file = frame.f_code.co_filename
+            # Lazy load dari template ikut tercatat (nama file template, baris kode hasil kompilasi)
+            if (nama_file.startswith(self.root) and 'site-packages' not in nama_file
+                    and nama_file != __file__):
+                return f'{os.path.relpath(nama_file, self.root)}:{frame.f_lineno} ({frame.f_code.co_name})'
+            frame = frame.f_back
+        return '-'
+
+    # ==================== HASIL ====================
+    def deteksi_n1(self, daftar_query):
+        kelompok = defaultdict(list)
+        for q in daftar_query:
+            kelompok[(q['sql'], q['asal'])].append(q['durasi_ms'])
+        hasil = [{'sql': sql, 'asal': asal, 'jumlah': len(durasi), 'total_ms': round(sum(durasi), 3)}
+                 for (sql, asal), durasi in kelompok.items() if len(durasi) >= self.ambang_n1]
+        return sorted(hasil, key=lambda x: x['jumlah'], reverse=True)
+
+    def _tulis(self, data, durasi):
+        os.makedirs(self.folder, exist_ok=True)
+        nama = data['nama']
+
+        n1 = self.deteksi_n1(data['query'])
+        hasil = {
+            'waktu': datetime.now().isoformat(timespec='seconds'),
+            'method': request.method,
+            'url': request.full_path,
+            'endpoint': request.endpoint,
+            'status': data['status'],
+            'pid': os.getpid(),
+            'durasi_ms': round(durasi * 1000, 3),
+            'jumlah_query': data['jumlah_query'],
+            'total_query_ms': round(sum(q['durasi_ms'] for q in data['query']), 3),
+            'n_plus_1': n1,
+            'query': data['query'],
+        }
+
+        profiler = data['profiler']
+        if profiler is not None:
+            profiler.dump_stats(os.path.join(self.folder, nama + '.prof'))
+            hasil['cprofile'] = nama + '.prof'
+            # Ringkasan 25 fungsi teratas (cumulative) agar bisa dibaca tanpa pstats
+            statistik = pstats.Stats(profiler).stats
+            hasil['cprofile_teratas'] = [
+                {'fungsi': f'{os.path.basename(f)}:{baris}({fungsi})', 'panggilan': nc,
+                 'total_ms': round(tt * 1000, 3), 'kumulatif_ms': round(ct * 1000, 3)}
+                for (f, baris, fungsi), (cc, nc, tt, ct, _) in
+                sorted(statistik.items(), key=lambda x: x[1][3], reverse=True)[:25]
+            ]
+
+        with open(os.path.join(self.folder, nama + '.json'), 'w', encoding='utf-8') as f:
+            json.dump(hasil, f, ensure_ascii=False, indent=1)
+
+        if n1:
+            logger.warning('Profiler: kandidat N+1 di %s -> %s (%d query)',
+                           request.endpoint, n1[0]['asal'], n1[0]['jumlah'])
+        with self._lock:
+            self.jumlah += 1
+            self.terakhir = nama + '.json'
+        return nama + '.json'
+
+    def stats(self):
+        with self._lock:
+            return {
+                'aktif': self.aktif,
+                'folder': self.folder,
+                'ambang_n1': self.ambang_n1,
+                'jumlah_profil': self.jumlah,
+                'terakhir': self.terakhir,
+            }
+
+
+profil_request = ProfilRequest()
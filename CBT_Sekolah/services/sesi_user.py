@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import namedtuple
+
+from flask_login import UserMixin
+
+from models import db, User, Kelas
+from services.versi_cache import sinkron_cache
+
+# ==================== CACHE USER LOADER (TTL) ====================
+# Flask-Login memanggil user_loader di SETIAP request terautentikasi (autosave,
+# polling tabel nilai, halaman ujian). Data yang dibutuhkan untuk otorisasi
+# (id, role, nama, kelas) disimpan di memori selama USER_CACHE_TTL detik
+# sehingga request tersebut tidak perlu SELECT user lagi.
+# CachedUser TIDAK membawa hash password: halaman ganti password harus memuat
+# User asli dari database. Cache di-invalidate saat user diubah/dihapus admin
+# atau mengganti password sendiri; proses server lain ikut dikosongkan lewat
+# services/versi_cache.py.
+
+KelasRingkas = namedtuple('KelasRingkas', ['id', 'nama_kelas'])
+
+
+class CachedUser(UserMixin):
+    def __init__(self, id, username, role, nama, kelas_id, nama_kelas):
+        self.id = id
+        self.username = username
+        self.role = role
+        self.nama = nama
+        self.kelas_id = kelas_id
+        # Kompatibel dengan template lama: current_user.kelas.nama_kelas
+        self.kelas = KelasRingkas(kelas_id, nama_kelas) if kelas_id else None
+
+
+class UserCache:
+    def __init__(self, ttl=300, maxsize=5000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config.get('USER_CACHE_TTL', self.ttl)
+        sinkron_cache.daftar('user', self._kosongkan)
+
+    def _muat(self, user_id):
+        row = (db.session.query(User.id, User.username, User.role, User.nama, User.kelas_id, Kelas.nama_kelas)
+               .outerjoin(Kelas, User.kelas_id == Kelas.id)
+               .filter(User.id == user_id)
+               .first())
+        return CachedUser(*row) if row else None
+
+    def get(self, user_id):
+        sekarang = time.monotonic()
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is not None and entry[1] > sekarang:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        user = self._muat(user_id)
+        if user is None:
+            return None
+
+        with self._lock:
+            if len(self._data) >= self.maxsize:
+                # Buang entri yang sudah kedaluwarsa dulu, jika masih penuh kosongkan
+                self._data = {k: v for k, v in self._data.items() if v[1] > sekarang}
+                if len(self._data) >= self.maxsize:
+                    self._data.clear()
+            self._data[user_id] = (user, sekarang + self.ttl)
+        return user
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._data.pop(int(user_id), None)
+        sinkron_cache.naikkan('user')
+
+    def clear(self):
+        self._kosongkan()
+        sinkron_cache.naikkan('user')
+
+    def _kosongkan(self):
+        # Hanya cache proses ini (dipanggil juga saat proses lain mengubah data user)
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+                'entries': len(self._data),
+                'ttl': self.ttl,
+            }
+
+
+user_cache = UserCache()
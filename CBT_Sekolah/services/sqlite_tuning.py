@@ -0,0 +1,151 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import event, text
+
+from services.statistik import ringkas_durasi
+
+# ==================== PROFIL PERFORMA SQLITE ====================
+# Semua PRAGMA per koneksi diambil dari Config (lihat config.py bagian SQLITE_*):
+#   busy_timeout       : writer menunggu lock (ms) alih-alih langsung "database is locked"
+#   cache_size         : page cache per koneksi (nilai negatif = KiB)
+#   mmap_size          : baca database lewat memory-mapped I/O
+#   temp_store         : tabel/indeks sementara (ORDER BY, GROUP BY) di memori
+#   wal_autocheckpoint : checkpoint otomatis oleh writer setiap N halaman WAL
+#   journal_size_limit : ukuran file WAL dipotong kembali ke batas ini setelah checkpoint
+# Ditambah thread checkpoint PASSIVE berkala agar file -wal tidak terus membesar
+# selama hari ujian yang panjang (PASSIVE tidak pernah menunggu/menahan pembaca).
+
+logger = logging.getLogger(__name__)
+
+PILIHAN_SYNCHRONOUS = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+PILIHAN_TEMP_STORE = {'DEFAULT', 'FILE', 'MEMORY'}
+
+
+def pragma_koneksi(config):
+    synchronous = str(config.get('SQLITE_SYNCHRONOUS', 'NORMAL')).upper()
+    temp_store = str(config.get('SQLITE_TEMP_STORE', 'MEMORY')).upper()
+    if synchronous not in PILIHAN_SYNCHRONOUS:
+        raise ValueError(f'SQLITE_SYNCHRONOUS tidak valid: {synchronous}')
+    if temp_store not in PILIHAN_TEMP_STORE:
+        raise ValueError(f'SQLITE_TEMP_STORE tidak valid: {temp_store}')
+
+    return [
+        # Aktifkan Foreign Keys
+        'PRAGMA foreign_keys = ON',
+        # Write-Ahead Logging (WAL): pembaca tidak terblokir oleh penulis
+        'PRAGMA journal_mode = WAL',
+        f'PRAGMA synchronous = {synchronous}',
+        f"PRAGMA busy_timeout = {int(config.get('SQLITE_BUSY_TIMEOUT_MS', 5000))}",
+        f"PRAGMA cache_size = {int(config.get('SQLITE_CACHE_SIZE', -32000))}",
+        f"PRAGMA mmap_size = {int(config.get('SQLITE_MMAP_SIZE', 0))}",
+        f'PRAGMA temp_store = {temp_store}',
+        f"PRAGMA wal_autocheckpoint = {int(config.get('SQLITE_WAL_AUTOCHECKPOINT', 1000))}",
+        f"PRAGMA journal_size_limit = {int(config.get('SQLITE_JOURNAL_SIZE_LIMIT', -1))}",
+    ]
+
+
+def pasang_pragma(engine, config, query_only=False):
+    daftar_pragma = pragma_koneksi(config)
+    if query_only:
+        # Engine baca-saja: tolak semua penulisan walau ada kode yang salah memakai engine ini
+        daftar_pragma.append('PRAGMA query_only = ON')
+
+    def set_sqlite_pragma(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in daftar_pragma:
+            cursor.execute(pragma)
+        cursor.close()
+
+    event.listen(engine, 'connect', set_sqlite_pragma)
+
+
+# ==================== CHECKPOINT WAL BERKALA ====================
+class CheckpointWAL:
+    def __init__(self):
+        self.interval = 30
+        self.engine = None
+        self.path_wal = None
+
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._durasi = deque(maxlen=500)
+
+        self.jumlah = 0
+        self.gagal = 0
+        self.terakhir = None  # (busy, log_frames, checkpointed)
+        self.wal_terbesar = 0
+
+    def init_app(self, app, engine):
+        self.interval = app.config.get('SQLITE_CHECKPOINT_INTERVAL', self.interval)
+        self.engine = engine
+        # Hanya untuk database file SQLite (bukan :memory:)
+        database = engine.url.database if engine.url.get_backend_name() == 'sqlite' else None
+        self.path_wal = os.path.abspath(database) + '-wal' if database and database != ':memory:' else None
+
+        if self.path_wal and self.interval > 0:
+            self._pastikan_thread()
+            atexit.register(self.stop)
+
+    def _pastikan_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name='wal-checkpoint', daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.checkpoint()
+            except Exception:
+                with self._lock:
+                    self.gagal += 1
+                logger.exception('Checkpoint WAL gagal')
+
+    def ukuran_wal(self):
+        try:
+            return os.path.getsize(self.path_wal) if self.path_wal else 0
+        except OSError:
+            return 0
+
+    def checkpoint(self):
+        ukuran = self.ukuran_wal()
+        mulai = time.perf_counter()
+        with self.engine.connect() as conn:
+            hasil = conn.execute(text('PRAGMA wal_checkpoint(PASSIVE)')).fetchone()
+        durasi = time.perf_counter() - mulai
+
+        with self._lock:
+            self.jumlah += 1
+            self.terakhir = tuple(hasil) if hasil else None
+            self.wal_terbesar = max(self.wal_terbesar, ukuran)
+            self._durasi.append(durasi)
+        return hasil
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        ukuran = self.ukuran_wal()
+        with self._lock:
+            busy, frame_wal, frame_checkpoint = self.terakhir or (None, None, None)
+            return {
+                'aktif': bool(self._thread and self._thread.is_alive()),
+                'interval': self.interval,
+                'wal_bytes': ukuran,
+                'wal_bytes_terbesar': max(self.wal_terbesar, ukuran),
+                'checkpoint': self.jumlah,
+                'checkpoint_gagal': self.gagal,
+                'terakhir_busy': busy,
+                'terakhir_frame_wal': frame_wal,
+                'terakhir_frame_checkpoint': frame_checkpoint,
+                'durasi_ms': ringkas_durasi(self._durasi, skala=1000),
+            }
+
+
+checkpoint_wal = CheckpointWAL()
@@ -0,0 +1,14 @@
+# ==================== RINGKASAN DURASI (UNTUK stats() / STATUS SERVER) ====================
+
+
+def ringkas_durasi(data, skala=1, digit=2, p95=True):
+    # data: kumpulan durasi (detik); skala=1000 untuk ms
+    urut = sorted(data)
+    hasil = {
+        'n': len(urut),
+        'p50': round(urut[len(urut) // 2] * skala, digit) if urut else 0.0,
+    }
+    if p95:
+        hasil['p95'] = round(urut[int(len(urut) * 0.95)] * skala, digit) if urut else 0.0
+    hasil['max'] = round(urut[-1] * skala, digit) if urut else 0.0
+    return hasil
@@ -0,0 +1,47 @@
+from sqlalchemy import update, select, func
+
+from models import db, Ujian, JawabanSiswa
+
+# ==================== VERSI TABEL NILAI (UNTUK POLLING HTMX) ====================
+# Ujian.versi_nilai adalah counter perubahan per ujian. Setiap submit, koreksi,
+# hitung ulang, reset peserta, atau hapus akun siswa menaikkan counter ini, dan baris jawaban yang
+# berubah dicap dengan nilai counter terbaru (JawabanSiswa.versi_nilai).
+#
+# Browser guru menyimpan token "versi.jumlah_baris.id_terbesar". Saat polling:
+#   - versi sama          -> 204 (tanpa query data, tanpa render)
+#   - hanya ada perubahan -> kirim baris yang berubah/baru saja (out-of-band swap)
+#   - ada baris terhapus  -> render ulang tabel penuh
+
+
+def naikkan_versi_nilai(ujian_id):
+    # UPDATE atomik di dalam transaksi yang sama dengan perubahan nilainya
+    db.session.execute(
+        update(Ujian)
+        .where(Ujian.id == ujian_id)
+        .values(versi_nilai=Ujian.versi_nilai + 1)
+    )
+    return db.session.execute(select(Ujian.versi_nilai).where(Ujian.id == ujian_id)).scalar()
+
+
+def naikkan_versi_nilai_siswa(siswa_id):
+    # Dipanggil sebelum akun dihapus: lembar jawabannya ikut terhapus (ON DELETE CASCADE)
+    ujian_ids = db.session.execute(
+        select(JawabanSiswa.ujian_id).where(JawabanSiswa.siswa_id == siswa_id).distinct()
+    ).scalars().all()
+    for ujian_id in ujian_ids:
+        naikkan_versi_nilai(ujian_id)
+
+
+def buat_token(ujian_id, versi):
+    jumlah, id_max = (db.session.query(func.count(JawabanSiswa.id), func.max(JawabanSiswa.id))
+                      .filter(JawabanSiswa.ujian_id == ujian_id)
+                      .one())
+    return f'{versi}.{jumlah}.{id_max or 0}', jumlah, id_max or 0
+
+
+def baca_token(token):
+    try:
+        versi, jumlah, id_max = (int(x) for x in (token or '').split('.'))
+    except ValueError:
+        return None
+    return versi, jumlah, id_max
@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from sqlalchemy import delete, insert, select
+
+from models import db, Ujian, Mapel, Kelas, UjianKelas
+from services.versi_cache import sinkron_cache
+
+# ==================== TARGET KELAS UJIAN + CACHE DASHBOARD SISWA ====================
+# Setiap ujian ditujukan ke satu atau beberapa kelas (tabel UjianKelas). Jadwal
+# ujian disalin ke tabel tersebut sehingga dashboard siswa cukup membaca indeks
+# (kelas_id, waktu_mulai, waktu_selesai) milik kelasnya sendiri.
+# Semua siswa satu kelas melihat daftar yang sama -> hasilnya di-cache per kelas
+# selama DASHBOARD_CACHE_TTL detik. Cache dikosongkan setiap ujian/kelas berubah
+# (di semua proses server, lewat services/versi_cache.py).
+
+# Ujian masih tampil di dashboard sampai 30 menit setelah selesai
+TOLERANSI_DASHBOARD = timedelta(minutes=30)
+
+UjianRingkas = namedtuple('UjianRingkas', ['id', 'judul', 'nama_mapel', 'waktu_mulai',
+                                           'waktu_selesai', 'durasi_menit'])
+
+
+def simpan_kelas_ujian(ujian, daftar_kelas_id):
+    # Target lama diganti seluruhnya; jadwal disalin dari ujian (dipanggil juga saat waktu diedit)
+    db.session.execute(delete(UjianKelas).where(UjianKelas.ujian_id == ujian.id))
+    rows = [{'ujian_id': ujian.id, 'kelas_id': kelas_id,
+             'waktu_mulai': ujian.waktu_mulai, 'waktu_selesai': ujian.waktu_selesai}
+            for kelas_id in sorted(set(daftar_kelas_id))]
+    if rows:
+        db.session.execute(insert(UjianKelas), rows)
+
+
+def kelas_ujian(ujian_id):
+    return {kelas_id for (kelas_id,) in
+            db.session.query(UjianKelas.kelas_id).filter(UjianKelas.ujian_id == ujian_id).all()}
+
+
+def kelas_dari_form(form):
+    # Hanya id kelas yang benar-benar ada yang disimpan
+    dipilih = {int(v) for v in form.getlist('kelas_ids') if v.isdigit()}
+    if not dipilih:
+        return []
+    return [kelas_id for (kelas_id,) in db.session.query(Kelas.id).filter(Kelas.id.in_(dipilih)).all()]
+
+
+def boleh_ikut(ujian_id, kelas_id):
+    return db.session.query(
+        select(UjianKelas.id).where(UjianKelas.ujian_id == ujian_id, UjianKelas.kelas_id == kelas_id).exists()
+    ).scalar()
+
+
+def _query_ringkas():
+    return (db.session.query(Ujian.id, Ujian.judul, Mapel.nama, Ujian.waktu_mulai,
+                             Ujian.waktu_selesai, Ujian.durasi_menit)
+            .join(Mapel, Ujian.mapel_id == Mapel.id))
+
+
+def ujian_aktif_kelas(kelas_id, now):
+    rows = (_query_ringkas()
+            .join(UjianKelas, UjianKelas.ujian_id == Ujian.id)
+            .filter(UjianKelas.kelas_id == kelas_id,
+                    UjianKelas.waktu_mulai <= now,
+                    UjianKelas.waktu_selesai >= now - TOLERANSI_DASHBOARD)
+            .order_by(UjianKelas.waktu_mulai)
+            .all())
+    return tuple(UjianRingkas(*r) for r in rows)
+
+
+def ujian_aktif_semua(now):
+    # Preview admin: semua ujian aktif tanpa filter kelas
+    rows = (_query_ringkas()
+            .filter(Ujian.waktu_mulai <= now, Ujian.waktu_selesai >= now - TOLERANSI_DASHBOARD)
+            .order_by(Ujian.waktu_mulai)
+            .all())
+    return tuple(UjianRingkas(*r) for r in rows)
+
+
+class DashboardCache:
+    def __init__(self, ttl=15):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config.get('DASHBOARD_CACHE_TTL', self.ttl)
+        sinkron_cache.daftar('dashboard', self._kosongkan)
+
+    def get(self, kelas_id, now):
+        sekarang = time.monotonic()
+        with self._lock:
+            entry = self._data.get(kelas_id)
+            if entry is not None and entry[1] > sekarang:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        daftar = ujian_aktif_kelas(kelas_id, now)
+        with self._lock:
+            self._data[kelas_id] = (daftar, sekarang + self.ttl)
+        return daftar
+
+    def clear(self):
+        self._kosongkan()
+        sinkron_cache.naikkan('dashboard')
+
+    def _kosongkan(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+                'entries': len(self._data),
+                'ttl': self.ttl,
+            }
+
+
+dashboard_cache = DashboardCache()
@@ -0,0 +1,137 @@
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash
+
+from services.pool_proses import PoolProses
+from services.statistik import ringkas_durasi
+
+# ==================== VERIFIKASI PASSWORD (PROCESS POOL + ADMISSION CONTROL) ====================
+# check_password_hash sengaja lambat (KDF). Saat ratusan siswa login bersamaan
+# di awal ujian, hashing di thread waitress menahan GIL & menghabiskan 75 thread
+# sehingga halaman ujian ikut lambat. Di sini hashing dijalankan di process pool
+# (lepas dari GIL) dengan batas antrian: jika pool + antrian penuh, login
+# langsung ditolak dengan "coba lagi dalam N detik" (503 + Retry-After)
+# tanpa menahan thread.
+# Modul ini sengaja tidak meng-import models/app agar proses worker tetap ringan.
+
+
+class AntrianPenuh(Exception):
+    pass
+
+
+def _cek_hash(pwhash, password):
+    # Dijalankan di proses worker; durasi hashing dikembalikan untuk metrik
+    mulai = time.perf_counter()
+    cocok = check_password_hash(pwhash, password)
+    return cocok, time.perf_counter() - mulai
+
+
+def _noop():
+    return True
+
+
+class VerifikasiPassword:
+    TAHAP = ('query_user', 'antri', 'hash', 'total')
+
+    def __init__(self):
+        self.aktif = False
+        self.antrian_max = 32
+        self.timeout = 10
+        self.retry_after = 5
+
+        self.pool = PoolProses(workers=2)
+        self._slot = None
+        self._stats_lock = threading.Lock()
+        self._durasi = {tahap: deque(maxlen=500) for tahap in self.TAHAP}
+
+        self.diterima = 0
+        self.ditolak = 0
+        self.timeout_count = 0
+
+    def init_app(self, app):
+        self.aktif = app.config.get('LOGIN_POOL', False)
+        self.pool.workers = app.config.get('LOGIN_POOL_WORKERS') or max(multiprocessing.cpu_count() - 1, 1)
+        self.antrian_max = app.config.get('LOGIN_QUEUE_MAX', self.antrian_max)
+        self.timeout = app.config.get('LOGIN_TIMEOUT', self.timeout)
+        self.retry_after = app.config.get('LOGIN_RETRY_AFTER', self.retry_after)
+        # Slot = worker yang sedang hashing + request yang boleh menunggu di antrian
+        self._slot = threading.BoundedSemaphore(self.pool.workers + self.antrian_max)
+
+    def panaskan(self):
+        # Jalankan semua proses worker sebelum login pertama (dipanggil saat server start)
+        if self.aktif:
+            pool = self.pool.ambil()
+            for future in [pool.submit(_noop) for _ in range(self.pool.workers)]:
+                future.result()
+
+    def catat(self, tahap, detik):
+        with self._stats_lock:
+            self._durasi[tahap].append(detik)
+
+    def cek(self, pwhash, password):
+        if not self.aktif:
+            cocok, durasi_hash = _cek_hash(pwhash, password)
+            self.catat('hash', durasi_hash)
+            with self._stats_lock:
+                self.diterima += 1
+            return cocok
+
+        if not self._slot.acquire(blocking=False):
+            with self._stats_lock:
+                self.ditolak += 1
+            raise AntrianPenuh()
+
+        mulai = time.perf_counter()
+        pool = self.pool.ambil()
+        try:
+            future = pool.submit(_cek_hash, pwhash, password)
+        except BrokenProcessPool:
+            self._slot.release()
+            self.pool.buang(pool)
+            raise AntrianPenuh()
+        except Exception:
+            self._slot.release()
+            raise
+        # Slot dilepas saat hashing benar-benar selesai (bukan saat request menyerah)
+        future.add_done_callback(lambda _: self._slot.release())
+
+        try:
+            cocok, durasi_hash = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            with self._stats_lock:
+                self.timeout_count += 1
+            raise AntrianPenuh()
+        except BrokenProcessPool:
+            # Login ini diminta mencoba lagi (503 + Retry-After), bukan hashing di
+            # thread waitress: saat pool rusak, puluhan login bisa gagal bersamaan
+            self.pool.buang(pool)
+            raise AntrianPenuh()
+
+        self.catat('hash', durasi_hash)
+        self.catat('antri', max(time.perf_counter() - mulai - durasi_hash, 0))
+        with self._stats_lock:
+            self.diterima += 1
+        return cocok
+
+    def stats(self):
+        with self._stats_lock:
+            hasil = {
+                'aktif': self.aktif,
+                'workers': self.pool.workers,
+                'antrian_max': self.antrian_max,
+                'diterima': self.diterima,
+                'ditolak': self.ditolak,
+                'timeout': self.timeout_count,
+                'pool_rusak': self.pool.rusak,
+            }
+            for tahap, data in self._durasi.items():
+                hasil[f'{tahap}_ms'] = ringkas_durasi(data, skala=1000, digit=1)
+            return hasil
+
+
+verifikasi_password = VerifikasiPassword()
@@ -0,0 +1,130 @@
+import atexit
+import logging
+import threading
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from models import db, VersiCache
+
+logger = logging.getLogger(__name__)
+
+# ==================== SINKRON CACHE ANTAR PROSES (VERSI DI DATABASE) ====================
+# Cache in-process (user_loader, dashboard per kelas) hanya bisa di-invalidate
+# di proses yang melakukan perubahan. Saat server dijalankan multi-proses
+# (jalankan_multi.py) atau dipisah student/staff, proses lain tetap menyajikan
+# data lama sampai TTL habis. Di sini setiap perubahan menaikkan counter
+# VersiCache.versi per nama cache; thread di setiap proses membaca tabel kecil
+# itu setiap CACHE_SYNC_INTERVAL detik dan mengosongkan cache yang versinya
+# berubah. Tidak ada query tambahan di jalur request.
+
+
+class SinkronCache:
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.app = None
+        self._pendengar = {}   # nama -> [fungsi pengosong cache lokal]
+        self._dikenal = {}     # nama -> versi terakhir yang diketahui proses ini
+        self._siap = False
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+        self.dinaikkan = 0
+        self.disinkron = 0
+        self.gagal = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get('CACHE_SYNC_INTERVAL', self.interval)
+        if self.interval > 0:
+            self._pastikan_thread()
+            atexit.register(self.stop)
+
+    def daftar(self, nama, fungsi):
+        with self._lock:
+            daftar = self._pendengar.setdefault(nama, [])
+            if fungsi not in daftar:
+                daftar.append(fungsi)
+
+    def _pastikan_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name='sinkron-cache', daemon=True)
+            self._thread.start()
+
+    def _panggil(self, nama):
+        for fungsi in list(self._pendengar.get(nama, [])):
+            fungsi()
+
+    def naikkan(self, nama):
+        # Dipanggil SETELAH perubahan data di-commit (lihat UserCache/DashboardCache)
+        if self.app is None:
+            return
+        try:
+            with self.app.app_context(), db.engine.begin() as conn:
+                conn.execute(insert(VersiCache).values(nama=nama, versi=1).on_conflict_do_update(
+                    index_elements=['nama'], set_={'versi': VersiCache.versi + 1}))
+                versi = conn.execute(select(VersiCache.versi).where(VersiCache.nama == nama)).scalar()
+        except Exception:
+            # Proses lain tetap aman karena TTL cache; request tidak boleh gagal karena ini
+            with self._lock:
+                self.gagal += 1
+            logger.exception('Sinkron cache: gagal menaikkan versi %s', nama)
+            return
+
+        with self._lock:
+            lama = self._dikenal.get(nama, 0)
+            self._dikenal[nama] = versi
+            self.dinaikkan += 1
+            # Lompat lebih dari 1 = ada perubahan dari proses lain yang belum terbaca
+            terlewat = self._siap and versi != lama + 1
+        if terlewat:
+            self._panggil(nama)
+
+    def periksa(self):
+        with self.app.app_context(), db.engine.connect() as conn:
+            rows = conn.execute(select(VersiCache.nama, VersiCache.versi)).all()
+
+        berubah = []
+        with self._lock:
+            for nama, versi in rows:
+                lama = self._dikenal.get(nama)
+                self._dikenal[nama] = versi
+                if self._siap and versi != lama:
+                    berubah.append(nama)
+            # Pembacaan pertama hanya mencatat versi awal
+            self._siap = True
+            self.disinkron += len(berubah)
+
+        for nama in berubah:
+            self._panggil(nama)
+        return berubah
+
+    def _loop(self):
+        while True:
+            try:
+                self.periksa()
+            except Exception:
+                with self._lock:
+                    self.gagal += 1
+                logger.exception('Sinkron cache: gagal membaca versi')
+            if self._stop.wait(self.interval):
+                return
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'aktif': bool(self._thread and self._thread.is_alive()),
+                'interval': self.interval,
+                'versi': dict(self._dikenal),
+                'dinaikkan': self.dinaikkan,
+                'disinkron': self.disinkron,
+                'gagal': self.gagal,
+            }
+
+
+sinkron_cache = SinkronCache()